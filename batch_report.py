@@ -0,0 +1,227 @@
+"""
+ダッシュボードと同じ指標を、複数ユーザーのデータセットに対してまとめて計算するバッチ処理です。
+
+    python batch_report.py data_dir/ reports/ --workers 8
+
+data_dir 直下の *.csv / *.parquet を 1 ユーザー 1 ファイルとして扱い
+(ファイル名の拡張子を除いた部分をユーザー ID とします)、
+reports/<ユーザー ID>/report.json とチャートの HTML を書き出します。
+チャートが読み込む plotly.js は reports/plotly.min.js に一度だけ書き出すので、
+HTML はネットワークなしで表示できます。Streamlit は import しません。
+"""
+import argparse
+import glob
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+from plotly.offline import get_plotlyjs
+
+import charts
+import data_cache
+import sleep_debt
+import sleep_metrics
+import storage
+from sleep_histogram import BinnedHistogram
+
+# 書き出すチャート (ファイル名, 生成関数)
+REPORT_CHARTS = [
+    ('weekly_bar', charts.create_weekly_bar_chart),
+    ('sleep_debt', charts.create_sleep_debt_chart),
+    ('score_trend', charts.create_sleep_score_trend),
+    ('monthly_trend', charts.create_monthly_sleep_trend),
+    ('histogram', charts.create_sleep_histogram),
+]
+
+DATA_PATTERNS = ('*.csv', '*.parquet')
+
+# 出力先直下に書き出す plotly.js (各ユーザーの HTML は ../plotly.min.js で参照する)
+PLOTLYJS_FILE = 'plotly.min.js'
+
+
+def _mean(values):
+    """欠損を除いた平均。値がなければ None (JSON では null)。"""
+    values = np.asarray(values, dtype=float)
+    values = values[~np.isnan(values)]
+    return round(float(values.mean()), 4) if len(values) else None
+
+
+def histogram_counts(values, bin_size=0.5):
+    """ダッシュボードのヒストグラムと同じ 0.5 時間幅のビンで度数を数えます。"""
+    return BinnedHistogram(bin_size).add(values).to_dict()
+
+
+def debt_ledger(timeline, debt_model=sleep_debt.LEGACY_MODEL):
+    """
+    timeline の晩の DebtLedger を返します (ダッシュボードと同じ計算)。
+    日付がなければ行順に 1 日ずつの晩とみなします。
+    """
+    df = timeline.frame
+    ledger = sleep_debt.DebtLedger(debt_model)
+    dates = df['date_dt'] if timeline.has_dates else pd.date_range('1970-01-01', periods=len(df))
+    ledger.sync(dates, df['sleep_duration_hour'].to_numpy(dtype=float, na_value=np.nan))
+    return ledger
+
+
+def summarize(timeline, debt_model=sleep_debt.LEGACY_MODEL, ledger=None):
+    """
+    ダッシュボードの各パネルに対応する指標を dict にまとめます。
+    睡眠負債は debt_model (sleep_debt.DebtModel) で計算します (ledger があればそれを使います)。
+    """
+    df = timeline.frame
+    duration = df['sleep_duration_hour'].to_numpy(dtype=float, na_value=np.nan)
+    last_week = timeline.last_nights(7)
+
+    report = {
+        'nights': len(df),
+        'first_date': timeline.first_date.strftime('%Y-%m-%d') if timeline.has_dates and len(df) else None,
+        'last_date': timeline.last_date.strftime('%Y-%m-%d') if timeline.has_dates and len(df) else None,
+        'sleep_duration_mean': _mean(duration),
+        'sleep_duration_7day_mean': _mean(last_week['sleep_duration_hour'].to_numpy(dtype=float, na_value=np.nan)),
+        'quality_7day_mean': {
+            col: _mean(last_week[col].to_numpy(dtype=float, na_value=np.nan))
+            for col in storage.SCORE_COLS if col in df.columns
+        },
+        'histogram': histogram_counts(duration),
+    }
+
+    # 睡眠負債: ダッシュボードと同じ DebtLedger で計算する
+    if ledger is None:
+        ledger = debt_ledger(timeline, debt_model)
+    debt = ledger.between()['debt'].to_numpy()
+    report['sleep_debt'] = {
+        'model': ledger.model._asdict(),
+        'total': round(float(debt.sum()), 4) if len(debt) else None,
+        'mean': _mean(debt),
+        'latest': round(ledger.latest, 4) if len(debt) else None,
+    }
+
+    if 'sleep_fit_score' in df.columns:
+        scores = df['sleep_fit_score'].to_numpy(dtype=float)
+        report['sleep_fit_score_mean'] = _mean(scores)
+        report['sleep_fit_score_30day_mean'] = _mean(scores[-30:])
+    return report
+
+
+def write_plotlyjs(out_dir):
+    """out_dir に plotly.js を書き出します (既にあれば何もしません)。パスを返します。"""
+    path = os.path.join(out_dir, PLOTLYJS_FILE)
+    if not os.path.exists(path):
+        # 複数のワーカーが同時に書いても壊れないよう、一時ファイルに書いてから置き換える
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(get_plotlyjs())
+        os.replace(tmp, path)
+    return path
+
+
+def build_user_report(path, out_dir, target_start="23:30", target_end="07:30", write_charts=True,
+                      debt_model=sleep_debt.LEGACY_MODEL):
+    """
+    1 ユーザー分のレポートを作成して書き出します (ワーカープロセスで実行されます)。
+    戻り値は (ユーザー ID, 晩数, エラーメッセージ or None) です。
+    """
+    user_id = os.path.splitext(os.path.basename(path))[0]
+    try:
+        data = data_cache.read_dashboard_data(path)
+        timeline = data.timeline
+        if data.bed_min is not None:
+            scores = sleep_metrics.sleep_fit_scores(data.bed_min, data.wake_min, target_start, target_end)
+            timeline = timeline.with_column('sleep_fit_score', scores)
+
+        ledger = debt_ledger(timeline, debt_model)
+        report = summarize(timeline, ledger=ledger)
+        report['user_id'] = user_id
+        report['target_window'] = [target_start, target_end]
+
+        user_dir = os.path.join(out_dir, user_id)
+        os.makedirs(user_dir, exist_ok=True)
+        with open(os.path.join(user_dir, 'report.json'), 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2, sort_keys=True)
+
+        if write_charts and timeline.has_dates:
+            write_plotlyjs(out_dir)
+            for chart_id, build in REPORT_CHARTS:
+                fig = build(timeline, ledger) if chart_id == 'sleep_debt' else build(timeline)
+                if fig is not None:
+                    # div_id を固定して、同じ入力なら同じ HTML になるようにする
+                    fig.write_html(os.path.join(user_dir, f'{chart_id}.html'),
+                                   include_plotlyjs=f'../{PLOTLYJS_FILE}', div_id=f'{user_id}-{chart_id}')
+        return user_id, len(timeline), None
+    except Exception as e:
+        return user_id, 0, f"{type(e).__name__}: {e}"
+
+
+def find_datasets(data_dir):
+    """data_dir 直下のデータファイルをファイル名順に返します。"""
+    paths = []
+    for pattern in DATA_PATTERNS:
+        paths.extend(glob.glob(os.path.join(data_dir, pattern)))
+    return sorted(paths)
+
+
+def run(data_dir, out_dir, workers=None, target_start="23:30", target_end="07:30", write_charts=True,
+        debt_model=sleep_debt.LEGACY_MODEL):
+    """全ユーザーのレポートを作成し、実行結果のサマリー (dict) を返します。"""
+    paths = find_datasets(data_dir)
+    os.makedirs(out_dir, exist_ok=True)
+    if write_charts:
+        write_plotlyjs(out_dir)
+
+    start = time.perf_counter()
+    results = []
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(build_user_report, p, out_dir, target_start, target_end, write_charts, debt_model)
+                   for p in paths]
+        for future in futures:
+            results.append(future.result())
+    elapsed = time.perf_counter() - start
+
+    nights = sum(n for _, n, _ in results)
+    summary = {
+        'users': len(results),
+        'failed': {user: err for user, _, err in results if err},
+        'nights': nights,
+        'elapsed_sec': round(elapsed, 3),
+        'users_per_sec': round(len(results) / elapsed, 2) if elapsed > 0 else None,
+        'nights_per_sec': round(nights / elapsed, 1) if elapsed > 0 else None,
+    }
+    with open(os.path.join(out_dir, 'summary.json'), 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2, sort_keys=True)
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ユーザーごとの睡眠レポート (JSON + HTML) を一括作成します。")
+    parser.add_argument('data_dir', help="ユーザーごとのデータファイル (*.csv / *.parquet) があるディレクトリ")
+    parser.add_argument('out_dir', help="レポートの出力先")
+    parser.add_argument('--workers', type=int, default=None, help="ワーカープロセス数 (既定: CPU 数)")
+    parser.add_argument('--target-start', default="23:30")
+    parser.add_argument('--target-end', default="07:30")
+    parser.add_argument('--no-charts', action='store_true', help="HTML チャートを書き出さない")
+    parser.add_argument('--debt-target', type=float, default=sleep_debt.LEGACY_MODEL.target_hours,
+                        help="睡眠負債の目標睡眠時間 (時間)")
+    parser.add_argument('--debt-cumulative', action='store_true',
+                        help="睡眠負債を累積 (返済・減衰あり) で計算する (既定: その晩の不足分)")
+    parser.add_argument('--debt-repayment', type=float, default=1.0, help="累積のときの返済率 (0〜1)")
+    parser.add_argument('--debt-half-life', type=int, default=0, help="累積のときの半減期 (日、0 は減衰なし)")
+    args = parser.parse_args()
+
+    # ダッシュボードの設定画面と同じ組み立て方
+    if args.debt_cumulative:
+        debt_model = sleep_debt.DebtModel(args.debt_target, args.debt_repayment, args.debt_half_life or None)
+    else:
+        debt_model = sleep_debt.LEGACY_MODEL._replace(target_hours=args.debt_target)
+    summary = run(args.data_dir, args.out_dir, args.workers,
+                  args.target_start, args.target_end, not args.no_charts, debt_model)
+    print(f"{summary['users']} ユーザー / {summary['nights']} 晩を {summary['elapsed_sec']} 秒で処理しました "
+          f"({summary['users_per_sec']} users/sec)")
+    for user, err in summary['failed'].items():
+        print(f"  失敗: {user}: {err}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,271 @@
+"""
+ダッシュボードのデータ処理・チャート生成のベンチマークです。
+
+    python bench_dashboard.py --sizes 1000,100000 --output bench.json
+    python bench_dashboard.py --sizes 1000,100000 --baseline bench.json
+
+data_tent.csv と同じスキーマの合成データを各サイズで作り、次の処理を個別に計測します:
+  csv_load / parse_sleep_times / sleep_duration / sleep_fit_score / dashboard_frame /
+  各 create_* チャート / panels_* (全パネルを直列・スレッド・プロセスで作る) /
+  weekly_quality_metrics / upload_validation
+*_legacy は行ごとの旧実装 (dashboard.calculate_*) で、--legacy-max 以下のサイズでのみ計測します。
+
+各処理の実時間 (wall_sec) と tracemalloc によるピークメモリ (peak_mb) を JSON で出力し、
+ダッシュボード用フレームの列ごとのメモリ (文字列の派生列で持っていた従来の形との比較) も表示します。
+--baseline を指定すると保存済みの結果と比べて遅くなった処理を報告します
+(閾値を超えた処理があれば終了コード 1)。
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+import charts
+import data_cache
+import ingest
+import panel_builder
+import sleep_metrics
+import storage
+from timeline import SleepTimeline
+
+DEFAULT_SIZES = [1_000, 100_000, 10_000_000]
+
+# pandas の datetime64[ns] で表せる範囲に収めるため、日付はこの日数で循環させる
+MAX_DISTINCT_DAYS = 150_000
+
+REQUIRED_COLS = ['タイムスタンプ', '日付', '就寝時間', '起床時間']
+
+# panels_* で panel_builder にまとめて作らせるチャート (ダッシュボードの日付ありのパネル)
+PANEL_CHARTS = ['create_weekly_bar_chart', 'create_sleep_debt_chart', 'create_sleep_histogram',
+                'create_monthly_sleep_trend', 'create_sleep_score_trend']
+
+
+def make_synthetic_frame(n, seed=0):
+    """data_tent.csv と同じスキーマ・文字列形式の合成データを n 晩分作ります。"""
+    rng = np.random.default_rng(seed)
+    days = pd.date_range('2000-01-01', periods=min(n, MAX_DISTINCT_DAYS), freq='D')
+    day_idx = np.arange(n) % len(days)
+
+    clock = np.array([f"{m // 60}:{m % 60:02d}:00" for m in range(sleep_metrics.DAY_MIN)], dtype=object)
+    bed = (rng.normal(0, 60, n).round().astype(int) + 23 * 60 + 30) % sleep_metrics.DAY_MIN
+    wake = (bed + rng.normal(7.5 * 60, 60, n).round().astype(int)) % sleep_metrics.DAY_MIN
+
+    date_str = days.strftime(storage.DATE_FORMAT).to_numpy(dtype=object)
+    stamp_str = (days + pd.Timedelta(hours=32)).strftime(storage.TIMESTAMP_FORMAT).to_numpy(dtype=object)
+    return pd.DataFrame({
+        'タイムスタンプ': stamp_str[day_idx],
+        '日付': date_str[day_idx],
+        '就寝時間': clock[bed],
+        '起床時間': clock[wake],
+        '昼寝の時間': clock[rng.choice([0, 0, 0, 30, 60], n)],
+        '寝つきの良さ': rng.integers(1, 6, n),
+        '寝起きの良さ': rng.integers(1, 6, n),
+        '日中の眠気': rng.integers(1, 6, n),
+        '目が覚めた回数': rng.integers(0, 4, n).astype(float),
+    })
+
+
+def string_dashboard_columns(typed):
+    """
+    従来のダッシュボード用フレーム (weekday / date_label を行ごとの文字列、
+    就寝分・起床分を int64 で持つ形)。frame_memory_report の比較用です。
+    """
+    df = typed.copy()
+    bed_sec = df['就寝時間'].to_numpy(dtype=float, na_value=np.nan) * 60
+    wake_sec = df['起床時間'].to_numpy(dtype=float, na_value=np.nan) * 60
+    df['sleep_duration_hour'] = sleep_metrics.sleep_duration_hours(bed_sec, wake_sec)
+    df['date_dt'] = df['日付']
+    df['weekday'] = df['date_dt'].dt.dayofweek.map(data_cache.WEEKDAY_MAP)
+    df['date_label'] = df['date_dt'].dt.strftime('%m/%d') + ' (' + df['weekday'] + ')'
+    return df, sleep_metrics.clock_minutes(bed_sec), sleep_metrics.clock_minutes(wake_sec)
+
+
+def frame_memory_report(typed):
+    """
+    同じデータについて、従来の形と現在の形 (data_cache.derive_dashboard_columns) の
+    列ごとのバイト数を before / after とする DataFrame を返します。
+    就寝分・起床分の配列 (DashboardData が持つ) は bed_min / wake_min の行です。
+    """
+    frames = {}
+    for name, derive in [('before', string_dashboard_columns),
+                         ('after', lambda t: data_cache.derive_dashboard_columns(t.copy()))]:
+        df, bed_min, wake_min = derive(typed)
+        usage = data_cache.frame_memory(df[data_cache.DASHBOARD_COLUMNS + ['date_dt', 'weekday', 'date_label']])
+        frames[name] = pd.concat([usage, pd.Series({'bed_min': bed_min.nbytes, 'wake_min': wake_min.nbytes})])
+    report = pd.DataFrame(frames)
+    report.loc['total'] = report.sum()
+    report['bytes_per_row_after'] = (report['after'] / max(len(typed), 1)).round(2)
+    return report
+
+
+def _measure(func, memory=True):
+    """func を実行し (実時間 秒, ピークメモリ MB or None, 戻り値) を返します。"""
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    wall = time.perf_counter() - start
+
+    peak_mb = None
+    if memory:
+        # 時間計測に tracemalloc のオーバーヘッドが乗らないよう、メモリは別に計測する
+        del result
+        gc.collect()
+        tracemalloc.start()
+        result = func()
+        peak_mb = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return wall, peak_mb, result
+
+
+def bench_size(n, workdir, legacy_max=100_000, memory=True, seed=0, panel_workers=panel_builder.DEFAULT_WORKERS):
+    """1 つのサイズについて全ての処理を計測し、(結果のリスト, フレームの列ごとのメモリ) を返します。"""
+    import dashboard  # 旧実装 (calculate_*) の参照用
+
+    raw = make_synthetic_frame(n, seed)
+    csv_path = os.path.join(workdir, f'bench_{n}.csv')
+    raw.to_csv(csv_path, index=False)
+    results = []
+
+    def record(step, func):
+        wall, peak, value = _measure(func, memory)
+        results.append({'size': n, 'step': step, 'wall_sec': round(wall, 6),
+                        'peak_mb': None if peak is None else round(peak, 3)})
+        print(f"  {n:>10,} {step:<28} {wall:10.4f} s" + ("" if peak is None else f" {peak:10.1f} MB"))
+        return value
+
+    record('csv_load', lambda: storage.to_typed_frame(pd.read_csv(csv_path)))
+
+    bed_sec, wake_sec = record('parse_sleep_times', lambda: sleep_metrics.parse_sleep_times(raw))
+    record('sleep_duration', lambda: sleep_metrics.sleep_duration_hours(bed_sec, wake_sec))
+    bed_min, wake_min = sleep_metrics.clock_minutes(bed_sec), sleep_metrics.clock_minutes(wake_sec)
+    record('sleep_fit_score', lambda: sleep_metrics.sleep_fit_scores(bed_min, wake_min))
+    if n <= legacy_max:
+        record('sleep_duration_legacy', lambda: raw.apply(dashboard.calculate_sleep_duration, axis=1))
+        record('sleep_fit_score_legacy', lambda: raw.apply(dashboard.calculate_sleep_fit_score, axis=1))
+
+    typed = storage.to_typed_frame(raw)
+
+    def dashboard_frame():
+        frame = typed.sort_values('日付', kind='stable').reset_index(drop=True)
+        return data_cache.derive_dashboard_columns(frame)
+
+    df, bed_min, wake_min = record('dashboard_frame', dashboard_frame)
+    memory_report = frame_memory_report(typed[data_cache.DASHBOARD_COLUMNS[:3] + storage.SCORE_COLS])
+    print(memory_report.to_string())
+    frame_memory = [{'size': n, 'column': column, 'before_bytes': int(row['before']),
+                     'after_bytes': int(row['after'])} for column, row in memory_report.iterrows()]
+    timeline = SleepTimeline(df).with_column(
+        'sleep_fit_score', sleep_metrics.sleep_fit_scores(bed_min, wake_min))
+
+    for name in ['create_plot', 'create_weekly_bar_chart', 'create_sleep_debt_chart',
+                 'create_sleep_histogram', 'create_monthly_sleep_trend', 'create_sleep_score_trend']:
+        build = getattr(charts, name)
+        record(name, lambda: build(timeline).to_json())
+
+    # 全パネルを panel_builder でまとめて作る (キャッシュなし)。プロセスプールは起動を済ませてから計測する
+    panel_tasks = [panel_builder.PanelTask(name, None, getattr(charts, name), (timeline,)) for name in PANEL_CHARTS]
+    panel_builder.build_panels(panel_tasks, panel_workers, 'process')
+    record('panels_serial', lambda: panel_builder.build_panels(panel_tasks, 1))
+    for executor in panel_builder.EXECUTORS:
+        record(f'panels_{executor}_{panel_workers}', lambda: panel_builder.build_panels(panel_tasks, panel_workers, executor))
+
+    record('weekly_quality_metrics',
+           lambda: timeline.last_nights(7)[storage.SCORE_COLS].mean())
+
+    def upload_validation():
+        uploaded = pd.read_csv(csv_path)
+        if not all(col in uploaded.columns for col in REQUIRED_COLS):
+            raise ValueError("required columns missing")
+        store_path = os.path.join(workdir, 'bench_store.csv')
+        if os.path.exists(store_path):
+            os.remove(store_path)
+        # 既存データ = アップロードの前半 (後半が新規行になる)
+        uploaded.iloc[:len(uploaded) // 2].to_csv(store_path, index=False)
+        return ingest.merge_upload(storage.CsvStore(store_path), uploaded)
+
+    record('upload_validation', upload_validation)
+    return results, frame_memory
+
+
+def compare(results, baseline, threshold, min_sec=0.001):
+    """
+    ベースラインより threshold 倍以上遅くなった処理を (size, step, 比率) のリストで返します。
+    ベースラインが min_sec 未満の処理は計測誤差が大きいので比較しません。
+    """
+    base = {(r['size'], r['step']): r['wall_sec'] for r in baseline['results']}
+    regressions = []
+    for r in results:
+        ref = base.get((r['size'], r['step']))
+        if ref and ref >= min_sec:
+            ratio = r['wall_sec'] / ref
+            if ratio >= threshold:
+                regressions.append((r['size'], r['step'], ratio))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ダッシュボードのデータ処理・チャート生成のベンチマーク")
+    parser.add_argument('--sizes', default=','.join(str(s) for s in DEFAULT_SIZES),
+                        help="合成データの晩数 (カンマ区切り)")
+    parser.add_argument('--legacy-max', type=int, default=100_000,
+                        help="行ごとの旧実装を計測する最大サイズ")
+    parser.add_argument('--no-memory', action='store_true', help="ピークメモリを計測しない")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--panel-workers', type=int, default=panel_builder.DEFAULT_WORKERS,
+                        help="panels_thread / panels_process のワーカー数")
+    parser.add_argument('--output', help="結果の JSON を書き出すパス")
+    parser.add_argument('--baseline', help="比較する保存済みの結果 (JSON)")
+    parser.add_argument('--threshold', type=float, default=1.2,
+                        help="この倍率以上遅くなった処理を退行として報告する")
+    parser.add_argument('--min-sec', type=float, default=0.001,
+                        help="ベースラインがこの秒数未満の処理は比較しない")
+    args = parser.parse_args()
+
+    sizes = [int(s) for s in args.sizes.split(',') if s]
+    results = []
+    frame_memory = []
+    with tempfile.TemporaryDirectory() as workdir:
+        for n in sizes:
+            size_results, size_memory = bench_size(n, workdir, args.legacy_max, not args.no_memory, args.seed,
+                                                   args.panel_workers)
+            results.extend(size_results)
+            frame_memory.extend(size_memory)
+
+    report = {
+        'meta': {
+            'python': sys.version.split()[0],
+            'numpy': np.__version__,
+            'pandas': pd.__version__,
+            'platform': platform.platform(),
+            'cpu_count': os.cpu_count(),
+            'panel_workers': args.panel_workers,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        },
+        'results': results,
+        'frame_memory': frame_memory,
+    }
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, args.min_sec)
+        for size, step, ratio in regressions:
+            print(f"退行: {size:,} {step} がベースラインの {ratio:.2f} 倍")
+        if regressions:
+            sys.exit(1)
+        print("ベースラインからの退行はありません。")
+
+
+if __name__ == "__main__":
+    main()
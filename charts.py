@@ -0,0 +1,172 @@
+import numpy as np
+import pandas as pd
+import plotly.express as px
+import plotly.graph_objects as go
+
+import sleep_debt
+import trend_tiers
+
+# ダッシュボードのチャート生成関数
+# Streamlit に依存しないので、バッチ処理などからも利用できます。
+# 各関数は date_dt でソート済みの SleepTimeline (timeline.py) を受け取り、
+# 必要な期間を二分探索で切り出して使います。
+
+
+def format_hours(hours):
+    """Convert decimal hours to XhYm format."""
+    if pd.isna(hours):
+        return ""
+    h = int(hours)
+    m = int((hours - h) * 60)
+    return f"{h}h{m}m"
+
+
+def update_chart_layout(fig):
+    """Apply common layout settings."""
+    fig.update_layout(
+        paper_bgcolor="rgba(0,0,0,0)",
+        plot_bgcolor="rgba(0,0,0,0)",
+        font_color="#333333",
+        title_font_size=22,
+        height=320,
+        margin=dict(l=20, r=20, t=50, b=20)
+    )
+    return fig
+
+
+def _histogram_figure(hist, title):
+    # Only bin edges and counts are sent to the browser (binned on the server, see sleep_histogram.py)
+    edges = hist.edges
+    centers = (edges[:-1] + edges[1:]) / 2
+    fig = go.Figure(go.Bar(x=centers, y=hist.counts, width=hist.bin_size,
+                           customdata=np.column_stack([edges[:-1], edges[1:]]) if len(edges) else None,
+                           hovertemplate='睡眠時間: %{customdata[0]:.1f}〜%{customdata[1]:.1f} 時間<br>頻度: %{y}<extra></extra>'))
+
+    # 30 min bins, transparent fill, colored edge
+    fig.update_traces(marker_color='rgba(0,0,0,0)',
+                      marker_line_color='#EF6C00',
+                      marker_line_width=3)
+
+    fig.update_layout(title=title, bargap=0, xaxis_title='睡眠時間 (時間)', yaxis_title='頻度')
+    return update_chart_layout(fig)
+
+
+def create_plot(timeline, title_suffix=""):
+    return _histogram_figure(timeline.sleep_histogram(), f'睡眠時間の分布 {title_suffix}')
+
+
+def create_weekly_bar_chart(timeline):
+    # Get last 7 days
+    recent_data = timeline.last_nights(7).copy() # Use copy to avoid SettingWithCopyWarning
+
+    # Calculate average
+    avg_sleep = recent_data['sleep_duration_hour'].mean()
+    avg_sleep_str = format_hours(avg_sleep)
+
+    # Add formatted string column
+    recent_data['formatted_sleep'] = recent_data['sleep_duration_hour'].apply(format_hours)
+
+    # Warm color for bars
+    fig = px.bar(recent_data, x='date_label', y='sleep_duration_hour',
+                 title=f'睡眠時間 (過去7日間)<br>平均: {avg_sleep_str}',
+                 text='formatted_sleep',
+                 labels={'date_label': '日付', 'sleep_duration_hour': '睡眠時間 (時間)', 'formatted_sleep': '時間'})
+    # Add rounded corners (marker_cornerradius)
+    # Border color changed to inner color (#FF9800)
+    fig.update_traces(textposition='outside', marker_color='#FF9800', marker_line_color='#FF9800', marker_line_width=1.5, marker_cornerradius=15) # Vibrant Orange
+
+    # Add horizontal line for average sleep
+    fig.add_hline(y=avg_sleep, line_dash="dash", line_color="#555555")
+
+    # Update hover template to show formatted time
+    fig.update_traces(hovertemplate='日付: %{x}<br>睡眠時間: %{text}')
+    fig.update_xaxes(title=None)
+    return update_chart_layout(fig)
+
+
+def create_sleep_debt_chart(timeline, ledger=None):
+    # Debt per night from the ledger (sleep_debt.DebtLedger, built over the full history).
+    # Without one, fall back to the per-night definition: 7.5 - sleep_duration, surplus = 0
+    df_sorted = timeline.frame
+    if ledger is None:
+        ledger = sleep_debt.DebtLedger(sleep_debt.LEGACY_MODEL)
+        ledger.sync(df_sorted['date_dt'], df_sorted['sleep_duration_hour'].to_numpy(dtype=float, na_value=np.nan))
+    model = ledger.model
+
+    # Create a temporary DF for plotting
+    plot_df = pd.DataFrame({
+        'date_label': df_sorted['date_label'],
+        'debt': ledger.debt_on(df_sorted['date_dt'])
+    })
+    plot_df['formatted_debt'] = plot_df['debt'].apply(format_hours)
+
+    if model.half_life_days == 0 and model.repayment == 0:
+        title = f'睡眠負債の推移 (理想: {model.target_hours:g}時間)'
+    else:
+        title = f'累積睡眠負債の推移 (目標: {model.target_hours:g}時間)'
+    fig = px.area(plot_df, x='date_label', y='debt',
+                  title=title,
+                  labels={'date_label': '日付', 'debt': '睡眠負債 (時間)'},
+                  custom_data=['formatted_debt']) # Pass formatted data
+    # Red/Salmon is already warm, keeping it as it represents "Debt/Warning"
+    fig.update_traces(line_color='#E64A19', fillcolor='rgba(255, 87, 34, 0.3)') # Darker Orange/Red
+    # Update hover to use formatted debt
+    fig.update_traces(hovertemplate='日付: %{x}<br>睡眠負債: %{customdata[0]}')
+    fig.update_xaxes(title=None)
+    return update_chart_layout(fig)
+
+
+def create_sleep_histogram(timeline, weekdays=None):
+    # weekdays (0 = Monday) restricts to those nights by merging the per-weekday counts
+    return _histogram_figure(timeline.sleep_histogram(weekdays), '睡眠時間の分布')
+
+
+TIER_LABELS = {'daily': '日ごと', 'weekly': '週平均', 'monthly': '月平均'}
+
+
+def _trend_figure(points, tier, title, y_label, color, hover_values, hover_label):
+    """Line of the trend points; weekly/monthly tiers also get a min-max band."""
+    hovertemplate = '日付: %{x|%Y/%m/%d}<br>' + hover_label + ': %{customdata[0]}'
+    if tier != 'daily':
+        hovertemplate += '<br>%{customdata[1]}晩'
+
+    fig = go.Figure()
+    if tier != 'daily':
+        fig.add_trace(go.Scatter(x=points['date'], y=points['max'], mode='lines', line_width=0,
+                                 showlegend=False, hoverinfo='skip'))
+        fig.add_trace(go.Scatter(x=points['date'], y=points['min'], mode='lines', line_width=0,
+                                 fill='tonexty', fillcolor='rgba(255, 152, 0, 0.15)',
+                                 showlegend=False, hoverinfo='skip'))
+
+    # Markers only while individual points are still distinguishable
+    fig.add_trace(go.Scatter(x=points['date'], y=points['mean'], mode='lines+markers' if len(points) <= 60 else 'lines',
+                             customdata=np.column_stack([hover_values, points['count']]),
+                             line=dict(color=color, width=3),
+                             marker=dict(size=8, color='white', line=dict(color=color, width=2)),
+                             hovertemplate=hovertemplate + '<extra></extra>', showlegend=False))
+    fig.update_layout(title=title, yaxis_title=y_label)
+    fig.update_xaxes(title=None)
+    return update_chart_layout(fig)
+
+
+def create_monthly_sleep_trend(timeline):
+    # Daily / LTTB-downsampled / weekly / monthly points depending on the selected range
+    points, tier = trend_tiers.trend_points(timeline, 'sleep_duration_hour')
+
+    return _trend_figure(points, tier, f'睡眠時間の推移 ({TIER_LABELS[tier]})', '睡眠時間 (時間)', '#FF9800',
+                         points['mean'].apply(format_hours), '睡眠時間')
+
+
+def create_sleep_score_trend(timeline):
+    # Check if score exists
+    if 'sleep_fit_score' not in timeline.frame.columns:
+        return None
+
+    points, tier = trend_tiers.trend_points(timeline, 'sleep_fit_score')
+
+    fig = _trend_figure(points, tier, f'推奨時間との一致度 ({TIER_LABELS[tier]})', '一致度 (%)', '#FFB74D',
+                        points['mean'].round(1).astype(str) + '%', '一致度')
+
+    # Set y-axis range 0-100 for percentage
+    fig.update_layout(yaxis_range=[0, 105])
+    return fig
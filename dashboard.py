@@ -1,6 +1,16 @@
+import datetime
+import os
+
 import streamlit as st
 import pandas as pd
-import plotly.express as px
+
+import charts
+import data_cache
+import figure_cache
+import ingest
+import panel_builder
+import sleep_debt
+import storage
 
 # Load the dataset
 # Adjust the path if necessary, but assuming it's in the same directory as per user usage
@@ -20,14 +30,6 @@ def calculate_sleep_duration(row):
     except Exception as e:
         return None
 
-def format_hours(hours):
-    """Convert decimal hours to XhYm format."""
-    if pd.isna(hours):
-        return ""
-    h = int(hours)
-    m = int((hours - h) * 60)
-    return f"{h}h{m}m"
-
 def hhmm_to_min(time_str):
     """Convert HH:MM:SS or HH:MM to minutes from 00:00."""
     if pd.isna(time_str):
@@ -67,17 +69,230 @@ def calculate_sleep_fit_score(row, target_start="23:30", target_end="07:30"):
     
     return min(100, (overlap / actual) * 100)
 
-def update_chart_layout(fig):
-    """Apply common layout settings."""
-    fig.update_layout(
-        paper_bgcolor="rgba(0,0,0,0)",
-        plot_bgcolor="rgba(0,0,0,0)",
-        font_color="#333333",
-        title_font_size=22,
-        height=320,
-        margin=dict(l=20, r=20, t=50, b=20)
-    )
-    return fig
+DEBT_MODES = ["その晩の不足分 (目標 - 睡眠時間)", "累積 (返済・減衰あり)"]
+
+
+def current_debt_model():
+    """Build the sleep_debt.DebtModel from the settings in session state."""
+    target = float(st.session_state.debt_target_hours)
+    if st.session_state.debt_mode == DEBT_MODES[0]:
+        return sleep_debt.LEGACY_MODEL._replace(target_hours=target)
+    half_life = int(st.session_state.debt_half_life_days)
+    return sleep_debt.DebtModel(target_hours=target, repayment=float(st.session_state.debt_repayment),
+                                half_life_days=half_life or None)
+
+
+def select_date_range(timeline):
+    """Sidebar picker for the displayed date range. Returns (start, end); None means open-ended."""
+    if not timeline.has_dates or len(timeline) == 0:
+        return None, None
+
+    first, last = timeline.first_date, timeline.last_date
+    option = st.sidebar.selectbox("表示期間", ["全期間", "過去7日間", "過去30日間", "期間を指定"])
+    if option == "過去7日間":
+        return last - pd.Timedelta(days=6), last
+    if option == "過去30日間":
+        return last - pd.Timedelta(days=29), last
+    if option == "期間を指定":
+        selected = st.sidebar.date_input("期間", value=(first.date(), last.date()),
+                                         min_value=first.date(), max_value=last.date())
+        # While the user is still picking, only the start date is set
+        if isinstance(selected, (tuple, list)):
+            if len(selected) == 2:
+                return selected[0], selected[1]
+            if len(selected) == 1:
+                return selected[0], None
+            return None, None
+        return selected, selected
+    return None, None
+
+def target_window():
+    """Current target window as ("HH:MM", "HH:MM")."""
+    return (st.session_state.target_start_time.strftime("%H:%M"),
+            st.session_state.target_end_time.strftime("%H:%M"))
+
+
+def target_window_inputs():
+    st.time_input("睡眠開始目標時間 (Target Start)", key="target_start_time")
+    st.time_input("睡眠終了目標時間 (Target End)", key="target_end_time")
+
+
+def debt_settings_inputs():
+    st.radio("計算方法", DEBT_MODES, key="debt_mode")
+    st.number_input("目標睡眠時間 (時間)", min_value=4.0, max_value=12.0, step=0.5, key="debt_target_hours")
+    if st.session_state.debt_mode == DEBT_MODES[1]:
+        st.slider("返済率 (目標より多く眠った分のうち負債の返済に充てる割合)", min_value=0.0, max_value=1.0,
+                  step=0.1, key="debt_repayment")
+        st.number_input("半減期 (日、0 は減衰なし)", min_value=0, max_value=365, step=1, key="debt_half_life_days")
+
+
+PANEL_EXECUTORS = {"スレッド (集計をパネル間で共有する)": 'thread',
+                   "プロセス (複数コアを使う。集計はプロセスごとに作り直す)": 'process'}
+
+
+def panel_build_settings():
+    """(max_workers, executor) for panel_builder from the settings in session state."""
+    return int(st.session_state.panel_workers), PANEL_EXECUTORS[st.session_state.panel_executor]
+
+
+def panel_settings_inputs():
+    st.number_input("パネルを作るワーカー数 (1 は順に作る)", min_value=1, max_value=max(1, os.cpu_count() or 1),
+                    step=1, key="panel_workers")
+    st.radio("並列化の方法", list(PANEL_EXECUTORS), key="panel_executor")
+
+# Settings each panel reads besides the data and the date range. A panel's figure is cached
+# per the values of exactly these, so changing one setting rebuilds only the panels that read it
+PANEL_DEPENDENCIES = {
+    'sleep_debt': ('debt_model',),
+    'score_trend': ('target_window',),
+}
+
+SETTING_VALUES = {
+    'debt_model': current_debt_model,
+    'target_window': target_window,
+}
+
+
+class DashboardPanels:
+    """
+    Data, date-range slice and figure cache shared by the dashboard panels of one full run.
+
+    prebuild() builds the figures of all panels concurrently (panel_builder) against the same
+    read-only timeline; plot() then only places them. Session state is read on the main thread
+    when a task is created, never inside the workers.
+    """
+    def __init__(self, data, start_date, end_date):
+        self.data = data
+        self.start_date, self.end_date = start_date, end_date
+        self.date_range = (str(start_date), str(end_date))
+        self.timeline = data.timeline.between(start_date, end_date)
+        self.timing = None
+        self._prebuilt = {}  # chart id -> (settings, figure)
+
+    def settings(self, chart_id):
+        return tuple(SETTING_VALUES[name]() for name in PANEL_DEPENDENCIES.get(chart_id, ()))
+
+    def task(self, chart_id, build, *args, timeline=None):
+        """
+        (settings, panel_builder.PanelTask) for prebuild(); settings are read here, on the main thread.
+        build and its arguments are module-level functions and picklable data, so the figure can
+        be built in a worker process.
+        """
+        timeline = self.timeline if timeline is None else timeline
+        settings = self.settings(chart_id)
+        key = (chart_id, self.data.version, (self.date_range,) + settings)
+        return settings, panel_builder.PanelTask(chart_id, key, build, (timeline,) + args)
+
+    def prebuild(self, tasks, max_workers=None, executor=None):
+        settings_workers, settings_executor = panel_build_settings()
+        figures, self.timing = panel_builder.build_panels(
+            [task for _, task in tasks], max_workers or settings_workers, executor or settings_executor)
+        self._prebuilt = {task.panel_id: (settings, figures[task.panel_id]) for settings, task in tasks}
+
+    def figure(self, chart_id, build, *args, timeline=None):
+        prebuilt = self._prebuilt.get(chart_id)
+        # A fragment rerun after a settings change no longer matches the prebuilt figure
+        if prebuilt is not None and prebuilt[0] == self.settings(chart_id):
+            return prebuilt[1]
+        # A single panel is built here on the main thread
+        _, task = self.task(chart_id, build, *args, timeline=timeline)
+        return figure_cache.cached_figure(*task.cache_key, lambda: task.build(*task.args))
+
+    def plot(self, chart_id, build, *args, timeline=None):
+        fig = self.figure(chart_id, build, *args, timeline=timeline)
+        if fig is not None:
+            st.plotly_chart(fig, use_container_width=True)
+
+
+def score_trend_timeline(panels):
+    """Displayed timeline with the sleep fit score for the current target window."""
+    # Scores cover the full history (cached per data version and window), so the scored
+    # timeline is cut to the displayed range afterwards and shares its trend tiers across reruns
+    start, end = target_window()
+    return data_cache.sleep_fit_timeline(panels.data, start, end).between(panels.start_date, panels.end_date)
+
+
+def current_debt_ledger(panels):
+    # The ledger covers the full history (cumulative debt) and is synced incrementally per data version
+    return data_cache.sleep_debt_ledger(panels.data, current_debt_model())
+
+
+@st.fragment
+def score_trend_panel(panels):
+    """Score trend with its own target-window inputs; editing them reruns only this panel."""
+    with st.popover("目標時間帯"):
+        target_window_inputs()
+    panels.plot('score_trend', charts.create_sleep_score_trend, timeline=score_trend_timeline(panels))
+
+
+@st.fragment
+def sleep_debt_panel(panels):
+    """Sleep debt with its own model settings; editing them reruns only this panel."""
+    with st.popover("睡眠負債の設定"):
+        debt_settings_inputs()
+    panels.plot('sleep_debt', charts.create_sleep_debt_chart, current_debt_ledger(panels))
+
+
+def display_weekly_quality_metrics(timeline):
+    # Get last 7 days
+    recent_data = timeline.last_nights(7)
+
+    # Calculate averages
+    # Columns: 寝つきの良さ, 寝起きの良さ, 日中の眠気
+    avg_onset = recent_data['寝つきの良さ'].mean()
+    avg_wake = recent_data['寝起きの良さ'].mean()
+    avg_drowsiness = recent_data['日中の眠気'].mean()
+
+    st.write("### 週間平均 (過去7日間)")
+
+    # Display metrics vertically
+    st.metric(label="寝つきの良さ (Sleep Onset Quality)", value=f"{avg_onset:.2f}")
+    st.metric(label="寝起きの良さ (Wake Up Quality)", value=f"{avg_wake:.2f}")
+    st.metric(label="日中の眠気 (Daytime Drowsiness)", value=f"{avg_drowsiness:.2f}")
+
+
+@st.fragment
+def fit_settings_section():
+    st.subheader("睡眠スコア設定")
+    st.write("推奨される睡眠時間帯を設定してください。")
+    target_window_inputs()
+
+    # What-if score and optimal window search (prefix sums over the noon-to-noon timeline)
+    try:
+        fit_index = data_cache.fit_score_index(data_cache.load_dashboard_data(DATA_FILE))
+    except FileNotFoundError:
+        fit_index = None
+
+    if fit_index is not None and fit_index.n_nights > 0:
+        current_start, current_end = target_window()
+        st.write(f"現在の設定での平均一致度: **{fit_index.mean_score(current_start, current_end):.1f}%** "
+                 f"({fit_index.n_nights} 日分)")
+
+        st.subheader("最適な時間帯の提案")
+        window_hours = st.slider("時間帯の長さ (時間)", min_value=4.0, max_value=12.0, value=8.0, step=0.5)
+        best_start, best_end, best_score = fit_index.optimal_window(int(window_hours * 60))
+        st.write(f"平均一致度が最も高い時間帯: **{best_start} 〜 {best_end}** (平均 {best_score:.1f}%)")
+
+        def apply_optimal_window():
+            # Runs before the next rerun, so the time_input keys can still be updated
+            st.session_state.target_start_time = datetime.datetime.strptime(best_start, "%H:%M").time()
+            st.session_state.target_end_time = datetime.datetime.strptime(best_end, "%H:%M").time()
+
+        st.button("この時間帯を設定する", on_click=apply_optimal_window)
+
+
+@st.fragment
+def debt_settings_section():
+    st.subheader("睡眠負債の設定")
+    debt_settings_inputs()
+
+
+@st.fragment
+def panel_settings_section():
+    st.subheader("パネルの構築")
+    st.write("キャッシュにない図を作るワーカーの数と方法です。プロセスは初回だけ起動に時間がかかります。")
+    panel_settings_inputs()
+
 
 def main():
     st.set_page_config(layout="wide")
@@ -121,8 +336,6 @@ h1, h2, h3 {
     # Sidebar Navigation
     page = st.sidebar.radio("メニュー", ["ダッシュボード", "設定", "データ入力"])
 
-    import datetime
-
     # Defaults
     default_start = datetime.time(23, 30)
     default_end = datetime.time(7, 30)
@@ -134,15 +347,26 @@ h1, h2, h3 {
         st.session_state.target_start_time = default_start
     if "target_end_time" not in st.session_state:
         st.session_state.target_end_time = default_end
+    # Sleep debt model (defaults to the per-night 7.5h definition)
+    if "debt_mode" not in st.session_state:
+        st.session_state.debt_mode = DEBT_MODES[0]
+    if "debt_target_hours" not in st.session_state:
+        st.session_state.debt_target_hours = sleep_debt.LEGACY_MODEL.target_hours
+    if "debt_repayment" not in st.session_state:
+        st.session_state.debt_repayment = 1.0
+    if "debt_half_life_days" not in st.session_state:
+        st.session_state.debt_half_life_days = 14
+    # Panel figures: worker count and executor (see panel_builder for threads vs processes)
+    if "panel_workers" not in st.session_state:
+        st.session_state.panel_workers = panel_builder.DEFAULT_WORKERS
+    if "panel_executor" not in st.session_state:
+        st.session_state.panel_executor = list(PANEL_EXECUTORS)[0]
 
     if page == "設定":
-        st.subheader("睡眠スコア設定")
-        st.write("推奨される睡眠時間帯を設定してください。")
-        
-        # Update session state via widget keys
-        # Set value kwarg even with key to ensure default applies if key is new
-        st.time_input("睡眠開始目標時間 (Target Start)", value=default_start, key="target_start_time")
-        st.time_input("睡眠終了目標時間 (Target End)", value=default_end, key="target_end_time")
+        # Each section is a fragment: editing it reruns only that section
+        fit_settings_section()
+        debt_settings_section()
+        panel_settings_section()
 
     if page == "データ入力":
         st.subheader("データアップロード")
@@ -162,9 +386,13 @@ h1, h2, h3 {
                 required_cols = ['タイムスタンプ', '日付', '就寝時間', '起床時間']
                 
                 if all(col in new_df.columns for col in required_cols):
-                    # Save the file
-                    new_df.to_csv(DATA_FILE, index=False)
-                    st.success(f"データが正常に更新されました: {DATA_FILE}")
+                    # Merge into the existing store keyed on 日付 and write only the delta
+                    result = ingest.merge_upload(storage.open_store(DATA_FILE), new_df)
+                    if result.changed:
+                        st.success(f"データが正常に更新されました: {DATA_FILE}")
+                    else:
+                        st.info(f"新しいデータはありませんでした: {DATA_FILE}")
+                    st.write(f"追加: {result.inserted} 件 / 更新: {result.updated} 件 / スキップ: {result.skipped} 件")
                     st.write("プレビュー:")
                     st.dataframe(new_df.head())
                 else:
@@ -174,10 +402,6 @@ h1, h2, h3 {
             except Exception as e:
                 st.error(f"ファイルの読み込みまたは保存中にエラーが発生しました: {e}")
 
-    # Get current values for calculation
-    target_start_str = st.session_state.target_start_time.strftime("%H:%M")
-    target_end_str = st.session_state.target_end_time.strftime("%H:%M")
-
     # Only load data and show dashboard if on dashboard page
     # However, for simplicity and to avoid reloading data issues if architecture changes,
     # we can load data always or just for dashboard.
@@ -186,218 +410,79 @@ h1, h2, h3 {
 
     if page == "ダッシュボード":
         try:
-            df = pd.read_csv(DATA_FILE)
-            
-            # Calculate sleep_duration_hour if it doesn't exist but the source columns do
-            if 'sleep_duration_hour' not in df.columns:
-                if '就寝時間' in df.columns and '起床時間' in df.columns:
-                    df['sleep_duration_hour'] = df.apply(calculate_sleep_duration, axis=1)
-
-            # Parse date and add weekday
-            if '日付' in df.columns:
-                df['date_dt'] = pd.to_datetime(df['日付'], format='%Y/%m/%d')
-                weekday_map = {0: '月', 1: '火', 2: '水', 3: '木', 4: '金', 5: '土', 6: '日'}
-                df['weekday'] = df['date_dt'].dt.dayofweek.map(weekday_map)
-                df['date_label'] = df['date_dt'].dt.strftime('%m/%d') + ' (' + df['weekday'] + ')'
+            # Parsed, derived and date-sorted data is cached per data version
+            # (mtime/size/content hash); treat it as read-only
+            data = data_cache.load_dashboard_data(DATA_FILE)
+            timeline = data.timeline
+            df = timeline.frame
             
             # Check if the required column exists (either originally or calculated)
             if 'sleep_duration_hour' in df.columns:
-                # Calculate sleep fit score using SETTINGS values
-                if '就寝時間' in df.columns and '起床時間' in df.columns:
-                    # Use lambda to pass the dynamic target times
-                    df['sleep_fit_score'] = df.apply(
-                        lambda row: calculate_sleep_fit_score(row, target_start=target_start_str, target_end=target_end_str), 
-                        axis=1
-                    )
-
-                # Create a function to generate the plot
-                def create_plot(title_suffix=""):
-                    valid_data = df['sleep_duration_hour'].dropna()
-                    # Warm color for histogram, outline only
-                    fig = px.histogram(valid_data, x="sleep_duration_hour",
-                                       title=f'睡眠時間の分布 {title_suffix}',
-                                       labels={'sleep_duration_hour': '睡眠時間 (時間)'})
-                    
-                    # 30 min bins, transparent fill, colored edge
-                    fig.update_traces(xbins=dict(size=0.5),
-                                      marker_color='rgba(0,0,0,0)',
-                                      marker_line_color='#EF6C00',
-                                      marker_line_width=3)
-                                      
-                    fig.update_layout(bargap=0, yaxis_title='頻度')
-                    return update_chart_layout(fig)
-
-                def create_weekly_bar_chart():
-                    # Get last 7 days
-                    df_sorted = df.sort_values('date_dt') # Ensure sorted
-                    recent_data = df_sorted.tail(7).copy() # Use copy to avoid SettingWithCopyWarning
-                    
-                    # Calculate average
-                    avg_sleep = recent_data['sleep_duration_hour'].mean()
-                    avg_sleep_str = format_hours(avg_sleep)
-                    
-                    # Add formatted string column
-                    recent_data['formatted_sleep'] = recent_data['sleep_duration_hour'].apply(format_hours)
-
-                    # Warm color for bars
-                    fig = px.bar(recent_data, x='date_label', y='sleep_duration_hour',
-                                 title=f'睡眠時間 (過去7日間)<br>平均: {avg_sleep_str}',
-                                 text='formatted_sleep',
-                                 labels={'date_label': '日付', 'sleep_duration_hour': '睡眠時間 (時間)', 'formatted_sleep': '時間'})
-                    # Add rounded corners (marker_cornerradius)
-                    # Border color changed to inner color (#FF9800)
-                    fig.update_traces(textposition='outside', marker_color='#FF9800', marker_line_color='#FF9800', marker_line_width=1.5, marker_cornerradius=15) # Vibrant Orange
-                    
-                    # Add horizontal line for average sleep
-                    fig.add_hline(y=avg_sleep, line_dash="dash", line_color="#555555")
-                    
-                    # Update hover template to show formatted time
-                    fig.update_traces(hovertemplate='日付: %{x}<br>睡眠時間: %{text}')
-                    fig.update_xaxes(title=None)
-                    return update_chart_layout(fig)
-
-                def display_weekly_quality_metrics():
-                    # Get last 7 days
-                    df_sorted = df.sort_values('date_dt')
-                    recent_data = df_sorted.tail(7)
-                    
-                    # Calculate averages
-                    # Columns: 寝つきの良さ, 寝起きの良さ, 日中の眠気
-                    avg_onset = recent_data['寝つきの良さ'].mean()
-                    avg_wake = recent_data['寝起きの良さ'].mean()
-                    avg_drowsiness = recent_data['日中の眠気'].mean()
-                    
-                    st.write("### 週間平均 (過去7日間)")
-                    
-                    # Display metrics vertically
-                    st.metric(label="寝つきの良さ (Sleep Onset Quality)", value=f"{avg_onset:.2f}")
-                    st.metric(label="寝起きの良さ (Wake Up Quality)", value=f"{avg_wake:.2f}")
-                    st.metric(label="日中の眠気 (Daytime Drowsiness)", value=f"{avg_drowsiness:.2f}")
-
-                def create_sleep_debt_chart():
-                    # Calculate debt: 7.5 - sleep_duration. If < 0 (surplus), set to 0.
-                    df_sorted = df.sort_values('date_dt')
-                    
-                    # Calculate debt
-                    debt_series = 7.5 - df_sorted['sleep_duration_hour']
-                    debt_series = debt_series.apply(lambda x: max(0, x))
-                    
-                    # Create a temporary DF for plotting
-                    plot_df = pd.DataFrame({
-                        'date_label': df_sorted['date_label'],
-                        'debt': debt_series
-                    })
-                    plot_df['formatted_debt'] = plot_df['debt'].apply(format_hours)
-                    
-                    fig = px.area(plot_df, x='date_label', y='debt',
-                                  title='睡眠負債の推移 (理想: 7.5時間)',
-                                  labels={'date_label': '日付', 'debt': '睡眠負債 (時間)'},
-                                  custom_data=['formatted_debt']) # Pass formatted data
-                    # Red/Salmon is already warm, keeping it as it represents "Debt/Warning"
-                    fig.update_traces(line_color='#E64A19', fillcolor='rgba(255, 87, 34, 0.3)') # Darker Orange/Red
-                    # Update hover to use formatted debt
-                    fig.update_traces(hovertemplate='日付: %{x}<br>睡眠負債: %{customdata[0]}')
-                    fig.update_xaxes(title=None)
-                    return update_chart_layout(fig)
-
-                def create_sleep_histogram():
-                    valid_data = df['sleep_duration_hour'].dropna()
-                    # Warm color for histogram, outline only
-                    fig = px.histogram(valid_data, x="sleep_duration_hour",
-                                       title='睡眠時間の分布',
-                                       labels={'sleep_duration_hour': '睡眠時間 (時間)'})
-                    
-                    # 30 min bins, transparent fill, colored edge
-                    fig.update_traces(xbins=dict(size=0.5),
-                                      marker_color='rgba(0,0,0,0)',
-                                      marker_line_color='#EF6C00',
-                                      marker_line_width=3)
-                                      
-                    fig.update_layout(bargap=0, yaxis_title='頻度')
-                    return update_chart_layout(fig)
-
-                def create_monthly_sleep_trend():
-                    # Get last 30 days
-                    df_sorted = df.sort_values('date_dt')
-                    recent_data = df_sorted.tail(30).copy()
-                    
-                    # Add formatted string column
-                    recent_data['formatted_sleep'] = recent_data['sleep_duration_hour'].apply(format_hours)
-                    
-                    fig = px.line(recent_data, x='date_label', y='sleep_duration_hour',
-                                  title='睡眠時間の推移 (過去30日間)',
-                                  markers=True,
-                                  labels={'date_label': '日付', 'sleep_duration_hour': '睡眠時間 (時間)'},
-                                  custom_data=['formatted_sleep'])
-                    
-                    # Style line and markers
-                    fig.update_traces(line_color='#FF9800', line_width=3, 
-                                      marker_size=8, marker_color='white', marker_line_color='#FF9800', marker_line_width=2,
-                                      hovertemplate='日付: %{x}<br>睡眠時間: %{customdata[0]}')
-                    
-                    fig.update_xaxes(title=None)
-                    return update_chart_layout(fig)
-
-                def create_sleep_score_trend():
-                    # Get last 30 days
-                    df_sorted = df.sort_values('date_dt')
-                    recent_data = df_sorted.tail(30).copy()
-                    
-                    # Check if score exists
-                    if 'sleep_fit_score' not in recent_data.columns:
-                        return None
-
-                    fig = px.line(recent_data, x='date_label', y='sleep_fit_score',
-                                  title='推奨時間との一致度 (過去30日間)',
-                                  markers=True,
-                                  labels={'date_label': '日付', 'sleep_fit_score': '一致度 (%)'})
-                    
-                    # Style line and markers
-                    fig.update_traces(line_color='#FFB74D', line_width=3, 
-                                      marker_size=8, marker_color='white', marker_line_color='#FFB74D', marker_line_width=2,
-                                      hovertemplate='日付: %{x}<br>一致度: %{y:.1f}%')
-                    
-                    # Set y-axis range 0-100 for percentage
-                    fig.update_layout(yaxis_range=[0, 105])
-                    
-                    fig.update_xaxes(title=None)
-                    return update_chart_layout(fig)
+                # Restrict every panel to the selected date range (binary-search slice, no re-sort).
+                # Figures are cached per (chart id, data version, values of the panel's declared
+                # dependencies); panels with in-place settings are fragments that rerun alone
+                start_date, end_date = select_date_range(timeline)
+                panels = DashboardPanels(data, start_date, end_date)
+                timeline = panels.timeline
+                df = timeline.frame
+                has_dates = 'date_dt' in df.columns
+                has_quality = all(col in df.columns for col in ['寝つきの良さ', '寝起きの良さ', '日中の眠気'])
+
+                # Build every figure concurrently from the same snapshot, then place them below
+                tasks = [
+                    panels.task('weekly_bar', charts.create_weekly_bar_chart) if has_dates
+                    else panels.task('plot_1', charts.create_plot, "(1)"),
+                    panels.task('sleep_debt', charts.create_sleep_debt_chart, current_debt_ledger(panels)) if has_dates
+                    else panels.task('plot_3', charts.create_plot, "(3)"),
+                    panels.task('score_trend', charts.create_sleep_score_trend, timeline=score_trend_timeline(panels)),
+                    panels.task('monthly_trend', charts.create_monthly_sleep_trend),
+                    panels.task('histogram', charts.create_sleep_histogram),
+                ]
+                if not has_quality:
+                    tasks.append(panels.task('plot_2', charts.create_plot, "(2)"))
+                panels.prebuild(tasks)
 
                 # Create 3 rows of 2 columns
                 # Row 1
                 c1, c2 = st.columns(2)
                 with c1:
-                    if 'date_dt' in df.columns:
-                        st.plotly_chart(create_weekly_bar_chart(), use_container_width=True)
+                    if has_dates:
+                        panels.plot('weekly_bar', charts.create_weekly_bar_chart)
                     else:
-                        st.plotly_chart(create_plot("(1)"), use_container_width=True)
+                        panels.plot('plot_1', charts.create_plot, "(1)")
                 with c2:
                     # Check if quality columns exist
-                    if all(col in df.columns for col in ['寝つきの良さ', '寝起きの良さ', '日中の眠気']):
+                    if has_quality:
                         # Use a container for metric card styling
                         with st.container():
-                             display_weekly_quality_metrics()
+                             display_weekly_quality_metrics(timeline)
                     else:
-                         st.plotly_chart(create_plot("(2)"), use_container_width=True)
+                         panels.plot('plot_2', charts.create_plot, "(2)")
 
                 # Row 2
                 c3, c4 = st.columns(2)
                 with c3:
-                    if 'date_dt' in df.columns:
-                        st.plotly_chart(create_sleep_debt_chart(), use_container_width=True)
+                    if has_dates:
+                        sleep_debt_panel(panels)
                     else:
-                        st.plotly_chart(create_plot("(3)"), use_container_width=True)
+                        panels.plot('plot_3', charts.create_plot, "(3)")
                 with c4:
                     # SWAPPED: Sleep Score Trend is now mostly here (Position 4)
-                    st.plotly_chart(create_sleep_score_trend(), use_container_width=True)
+                    score_trend_panel(panels)
                 
                 # Row 3
                 c5, c6 = st.columns(2)
                 with c5:
-                    st.plotly_chart(create_monthly_sleep_trend(), use_container_width=True)
+                    panels.plot('monthly_trend', charts.create_monthly_sleep_trend)
                 with c6:
                     # SWAPPED: Histogram is now here (Position 6)
-                    st.plotly_chart(create_sleep_histogram(), use_container_width=True)
+                    panels.plot('histogram', charts.create_sleep_histogram)
+
+                stats = figure_cache.cache_stats()
+                st.sidebar.caption(f"図キャッシュ: ヒット {stats['hits']} / ミス {stats['misses']} (保持 {stats['size']} 件)")
+                with st.sidebar.expander("パネル構築時間"):
+                    for line in panel_builder.format_timing(panels.timing):
+                        st.caption(line)
 
             else:
                 st.error(f"'{DATA_FILE}' に 'sleep_duration_hour' カラムが見つからないか計算できませんでした")
@@ -0,0 +1,290 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+import sleep_debt
+import sleep_metrics
+import storage
+from timeline import SleepTimeline
+
+WEEKDAY_MAP = {0: '月', 1: '火', 2: '水', 3: '木', 4: '金', 5: '土', 6: '日'}
+WEEKDAY_DTYPE = pd.CategoricalDtype([WEEKDAY_MAP[i] for i in range(7)], ordered=True)
+
+# date_label ('%m/%d (曜)') になりうる全 366 日 × 7 曜日のラベル。カテゴリは全フレームで共有し、
+# 各フレームは (うるう年の通し日 × 7 + 曜日) の int16 のコードだけを持つ
+_LEAP_MONTH_START = np.concatenate(([0], np.cumsum([31, 29, 31, 30, 31, 30, 31, 31, 30, 31, 30]))).astype(np.int16)
+DATE_LABEL_DTYPE = pd.CategoricalDtype(pd.Index(
+    [f"{d:%m/%d} ({WEEKDAY_MAP[wd]})" for d in pd.date_range('2000-01-01', '2000-12-31') for wd in range(7)],
+    dtype='str'))
+
+# ダッシュボードの各パネルが参照する列 (これ以外は読み込まない)
+DASHBOARD_COLUMNS = ['日付', '就寝時間', '起床時間', 'sleep_duration_hour'] + storage.SCORE_COLS
+
+
+class LRUCache:
+    """
+    上限付きの LRU キャッシュ。Streamlit はセッションごとにスレッドで
+    スクリプトを実行するため、ロックで保護しています。
+    """
+    def __init__(self, maxsize=32):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key in self._data:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return self._data[key]
+            self.misses += 1
+            return default
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+class DashboardData:
+    """
+    読み込み・派生列の計算・日付順のソートが済んだデータと、そのバージョン。
+    bed_min / wake_min は timeline.frame と同じ行順の int16 配列です。
+    """
+    def __init__(self, version, timeline, bed_min=None, wake_min=None, path=None):
+        self.version = version
+        self.path = path          # 読み込んだファイルの絶対パス (キャッシュのキー)
+        self.timeline = timeline  # 読み取り専用として扱うこと
+        self.bed_min = bed_min    # 就寝時間 (00:00 からの分)
+        self.wake_min = wake_min  # 起床時間 (00:00 からの分)
+
+    @property
+    def frame(self):
+        return self.timeline.frame
+
+
+# (path, mtime_ns, size) -> 内容のハッシュ
+_content_hashes = LRUCache(maxsize=64)
+# (path, version) -> DashboardData
+_frames = LRUCache(maxsize=8)
+# version -> FitScoreIndex (目標時間帯に依存しない前計算)
+_fit_indexes = LRUCache(maxsize=8)
+# (version, target_start, target_end) -> sleep_fit_score の配列
+_fit_scores = LRUCache(maxsize=32)
+# (version, target_start, target_end) -> sleep_fit_score 列を足した SleepTimeline
+_fit_timelines = LRUCache(maxsize=8)
+# (path, DebtModel) -> DebtLedger (データのバージョンが変わっても使い続け、変わった晩以降だけ計算し直す)
+_debt_ledgers = LRUCache(maxsize=8)
+# (path, version, DebtModel) -> 同期済みの DebtLedger のコピー (読み出し専用として渡す)
+_debt_snapshots = LRUCache(maxsize=16)
+# 同じ DebtLedger を複数のセッションが同時に sync しないようにする
+_debt_sync_lock = threading.Lock()
+
+
+def file_version(path):
+    """
+    ファイルの同一性を表すバージョン文字列を返します。
+
+    mtime/size が前回と同じなら stat だけで済ませ、変わった場合のみ
+    内容のハッシュを計算します。内容が同じなら (touch されただけでも)
+    同じバージョンになります。
+    """
+    st = os.stat(path)
+    stat_key = (os.path.abspath(path), st.st_mtime_ns, st.st_size)
+    version = _content_hashes.get(stat_key)
+    if version is None:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                digest.update(chunk)
+        version = digest.hexdigest()[:16]
+        _content_hashes.put(stat_key, version)
+    return version
+
+
+def _date_labels(dates):
+    """'%m/%d (曜)' の日付ラベルを DATE_LABEL_DTYPE の categorical (int16 のコード) で返します。"""
+    dates = pd.DatetimeIndex(dates)
+    month, day, weekday = (np.nan_to_num(np.asarray(v, dtype=float), nan=-1).astype(np.int16)
+                           for v in (dates.month, dates.day, dates.dayofweek))
+    day_of_year = _LEAP_MONTH_START[np.maximum(month, 1) - 1] + day - 1
+    codes = np.where(month >= 1, day_of_year * 7 + weekday, -1).astype(np.int16)  # 日付の欠損は -1 (NaN)
+    return pd.Categorical.from_codes(codes, dtype=DATE_LABEL_DTYPE)
+
+
+def derive_dashboard_columns(df):
+    """
+    型付きフレーム (storage 参照) にダッシュボード用の派生列
+    (sleep_duration_hour, date_dt, weekday, date_label) を追加します。
+    戻り値は (df, 就寝分, 起床分) で、時刻列がない場合の分は None です。
+
+    行ごとのメモリを抑えるため、weekday / date_label は共有のカテゴリを持つ categorical
+    (1 / 2 バイト/行)、就寝分・起床分は int16 で持ちます。date_dt は 日付 と同じ配列を参照します。
+    """
+    bed_min = wake_min = None
+    if '就寝時間' in df.columns and '起床時間' in df.columns:
+        bed_sec = df['就寝時間'].to_numpy(dtype=float, na_value=np.nan) * 60
+        wake_sec = df['起床時間'].to_numpy(dtype=float, na_value=np.nan) * 60
+        if 'sleep_duration_hour' not in df.columns:
+            df['sleep_duration_hour'] = sleep_metrics.sleep_duration_hours(bed_sec, wake_sec)
+        # 0〜1439 分 (正午基準にしても 4,319 分まで) なので int16 に収まる
+        bed_min = sleep_metrics.clock_minutes(bed_sec).astype(np.int16)
+        wake_min = sleep_metrics.clock_minutes(wake_sec).astype(np.int16)
+
+    if '日付' in df.columns:
+        df['date_dt'] = df['日付']
+        weekday = df['date_dt'].dt.dayofweek.to_numpy(dtype=float, na_value=np.nan)
+        df['weekday'] = pd.Categorical.from_codes(np.nan_to_num(weekday, nan=-1).astype(np.int8),
+                                                  dtype=WEEKDAY_DTYPE)
+        df['date_label'] = _date_labels(df['date_dt'])
+
+    return df, bed_min, wake_min
+
+
+def frame_memory(df):
+    """
+    列ごとのメモリ使用量 (バイト、文字列の中身も含む) を返します。
+    WEEKDAY_DTYPE / DATE_LABEL_DTYPE の列はコードの分だけ数えます (カテゴリは全フレームで共有)。
+    前の列と同じ配列を参照している日付列 (date_dt) は 0 とします。
+    """
+    usage = df.memory_usage(deep=True, index=False)
+    dates = []
+    for col in df.columns:
+        if df[col].dtype in (WEEKDAY_DTYPE, DATE_LABEL_DTYPE):
+            usage[col] = df[col].cat.codes.nbytes
+        elif pd.api.types.is_datetime64_any_dtype(df[col]):
+            values = df[col].to_numpy()
+            if any(np.shares_memory(values, other) for other in dates):
+                usage[col] = 0
+            dates.append(values)
+    return usage
+
+
+def read_dashboard_data(path, version=None):
+    """
+    データファイル (CSV / Parquet) からダッシュボードが使う列だけを読み込み、
+    派生列の計算と日付順のソートまで済ませた DashboardData を返します (キャッシュなし)。
+    """
+    frame = storage.open_store(path).read(columns=DASHBOARD_COLUMNS)
+    # ソートはバージョンごとに一度だけ。以降の期間指定は二分探索で切り出す
+    if '日付' in frame.columns:
+        frame = frame.sort_values('日付', kind='stable').reset_index(drop=True)
+    df, bed_min, wake_min = derive_dashboard_columns(frame)
+    return DashboardData(version, SleepTimeline(df), bed_min, wake_min, os.path.abspath(path))
+
+
+def load_dashboard_data(path):
+    """
+    read_dashboard_data() のキャッシュ付き版です。
+    同じバージョンのファイルに対してはキャッシュを返します。
+    """
+    version = file_version(path)
+    key = (os.path.abspath(path), version)
+    data = _frames.get(key)
+    if data is None:
+        data = read_dashboard_data(path, version)
+        _frames.put(key, data)
+    return data
+
+
+def fit_score_index(data):
+    """
+    データバージョンごとの FitScoreIndex を返します。時刻列がない場合は None です。
+    目標時間帯を変えたときの再計算や最適な時間帯の探索はこれを使います。
+    """
+    if data.bed_min is None:
+        return None
+    index = _fit_indexes.get(data.version)
+    if index is None:
+        index = sleep_metrics.FitScoreIndex(data.bed_min, data.wake_min)
+        _fit_indexes.put(data.version, index)
+    return index
+
+
+def sleep_fit_scores(data, target_start="23:30", target_end="07:30"):
+    """
+    目標時間帯ごとの sleep_fit_score を (データバージョン, 開始, 終了) 単位でキャッシュします。
+    時刻列がない場合は None を返します。
+    """
+    index = fit_score_index(data)
+    if index is None:
+        return None
+    key = (data.version, target_start, target_end)
+    scores = _fit_scores.get(key)
+    if scores is None:
+        scores = index.scores(target_start, target_end)
+        scores.setflags(write=False)
+        _fit_scores.put(key, scores)
+    return scores
+
+
+def sleep_fit_timeline(data, target_start="23:30", target_end="07:30"):
+    """
+    全期間のタイムラインに sleep_fit_score 列を足したものを (データバージョン, 開始, 終了) 単位で
+    キャッシュします。再実行のたびに同じタイムラインを使うので、集計も一度だけ作られます。
+    時刻列がない場合は data.timeline を返します。
+    """
+    key = (data.version, target_start, target_end)
+    timeline = _fit_timelines.get(key)
+    if timeline is None:
+        scores = sleep_fit_scores(data, target_start, target_end)
+        if scores is None:
+            return data.timeline
+        timeline = data.timeline.with_column('sleep_fit_score', scores)
+        _fit_timelines.put(key, timeline)
+    return timeline
+
+
+def sleep_debt_ledger(data, model=sleep_debt.LEGACY_MODEL):
+    """
+    data と同じ晩を持つ、モデルごとの睡眠負債の DebtLedger を返します。日付列がない場合は None です。
+
+    ファイル・モデルごとの DebtLedger を同期し、(ファイル, バージョン, モデル) ごとのコピーを返します。
+    新しいバージョンのデータでは、前のバージョンと一致する晩はそのまま使い、追加・変更された晩以降
+    だけを計算します。返したコピーは他のセッションの同期で変わらないので、そのまま読み出せます。
+    """
+    df = data.frame
+    if 'date_dt' not in df.columns or 'sleep_duration_hour' not in df.columns:
+        return None
+    key = (data.path, data.version, model)
+    snapshot = _debt_snapshots.get(key)
+    if snapshot is None:
+        with _debt_sync_lock:
+            ledger = _debt_ledgers.get((data.path, model))
+            if ledger is None:
+                ledger = sleep_debt.DebtLedger(model)
+                _debt_ledgers.put((data.path, model), ledger)
+            if ledger.version != data.version:
+                ledger.sync(df['date_dt'], df['sleep_duration_hour'].to_numpy(dtype=float, na_value=np.nan))
+                ledger.version = data.version
+            snapshot = ledger.snapshot()
+        _debt_snapshots.put(key, snapshot)
+    return snapshot
+
+
+def clear_caches():
+    """すべてのキャッシュを破棄します。"""
+    _content_hashes.clear()
+    _frames.clear()
+    _fit_indexes.clear()
+    _fit_timelines.clear()
+    _fit_scores.clear()
+    _debt_ledgers.clear()
+    _debt_snapshots.clear()
@@ -0,0 +1,172 @@
+"""
+humidity_viz.py が使う Vega のライブラリ (vega / vega-lite / vega-embed) を
+static/vega/ にダウンロードします。一度実行しておけば、ダッシュボードは CDN なしで動きます。
+
+    python fetch_vega_assets.py            # 未取得のファイルをダウンロードして検証する
+    python fetch_vega_assets.py --verify   # 取得済みのファイルを検証するだけ
+
+バージョンは VEGA_ASSETS に固定し (vega-lite は Altair が出力する spec のスキーマに合わせる)、
+各ファイルの SRI ハッシュ (sha384) を static/vega/vega-assets.lock.json に記録します。
+ロックファイルにハッシュがあるファイルは、ダウンロード時に一致しなければ保存しません。
+ロックファイルとダウンロードしたファイルはリポジトリにコミットしてください。
+
+注意: static/vega/ (ライブラリとロックファイル) はまだリポジトリにコミットされていません。
+コミットされるまで humidity_viz.py はオフラインでは動かず、CDN から読み込むかどうかを確認する警告を出します。
+ネットワークにつながる環境で一度このスクリプトを実行し、static/vega/ をコミットしてください。
+
+static/ は Streamlit の静的ファイル配信 (.streamlit/config.toml の enableStaticServing)
+で /app/static/ として配信されます。ファイルが無いときに CDN から読み込むのは、
+asset_sources(allow_cdn=True) で明示したときだけです。
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import urllib.request
+from collections import namedtuple
+
+CDN_BASE = "https://cdn.jsdelivr.net/npm"
+ASSET_DIR = os.path.join("static", "vega")
+STATIC_URL = "/app/static/vega"
+LOCK_FILE = "vega-assets.lock.json"
+
+# (パッケージ, バージョン, パッケージ内のパス, 保存するファイル名)。読み込む順に並べる
+VEGA_ASSETS = [
+    ("vega", "6.2.0", "build/vega.min.js", "vega.min.js"),
+    ("vega-lite", "6.4.1", "build/vega-lite.min.js", "vega-lite.min.js"),
+    ("vega-embed", "7.0.2", "build/vega-embed.min.js", "vega-embed.min.js"),
+]
+
+# ブラウザが読み込むスクリプト (integrity は SRI の値、不明なら None)
+AssetSource = namedtuple('AssetSource', ['url', 'integrity', 'local'])
+
+
+class MissingVegaAssets(FileNotFoundError):
+    """static/vega/ に必要なファイルが無い (CDN から読み込むことも許されていない)。"""
+
+
+def cdn_url(package, version, path):
+    return f"{CDN_BASE}/{package}@{version}/{path}"
+
+
+def sri_hash(body):
+    """<script integrity> に書く SRI の値 (sha384)。"""
+    return "sha384-" + base64.b64encode(hashlib.sha384(body).digest()).decode('ascii')
+
+
+def read_lock(asset_dir=ASSET_DIR):
+    """ロックファイルの {ファイル名: {'url', 'integrity'}}。無ければ空です。"""
+    path = os.path.join(asset_dir, LOCK_FILE)
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def _locked_integrity(lock, package, version, path, filename):
+    entry = lock.get(filename)
+    # バージョンを変えたら古いハッシュは使わない
+    if entry and entry.get('url') == cdn_url(package, version, path):
+        return entry.get('integrity')
+    return None
+
+
+def asset_sources(asset_dir=ASSET_DIR, allow_cdn=False):
+    """
+    ブラウザが読み込むスクリプトを読み込む順に AssetSource で返します。
+    ダウンロード済みのファイルはローカル (静的ファイル配信) の URL です。
+    無いファイルがあると MissingVegaAssets を送出し、allow_cdn=True のときだけ
+    代わりに固定したバージョンの CDN の URL を返します。
+    """
+    lock = read_lock(asset_dir)
+    sources, missing = [], []
+    for package, version, path, filename in VEGA_ASSETS:
+        integrity = _locked_integrity(lock, package, version, path, filename)
+        if os.path.exists(os.path.join(asset_dir, filename)):
+            sources.append(AssetSource(f"{STATIC_URL}/{filename}", integrity, True))
+        else:
+            missing.append(filename)
+            sources.append(AssetSource(cdn_url(package, version, path), integrity, False))
+    if missing and not allow_cdn:
+        raise MissingVegaAssets(f"{asset_dir} に {', '.join(missing)} がありません。"
+                                f"python fetch_vega_assets.py で取得してください")
+    return sources
+
+
+def fetch_assets(asset_dir=ASSET_DIR, force=False, timeout=30):
+    """
+    未取得のファイルをダウンロードします (force=True なら取得し直します)。保存したパスのリストを返します。
+    ロックファイルのハッシュと一致しなければ ValueError を送出し、ハッシュが無ければ記録します。
+    """
+    os.makedirs(asset_dir, exist_ok=True)
+    lock = read_lock(asset_dir)
+    saved = []
+    for package, version, path, filename in VEGA_ASSETS:
+        dest = os.path.join(asset_dir, filename)
+        if os.path.exists(dest) and not force:
+            continue
+        url = cdn_url(package, version, path)
+        with urllib.request.urlopen(url, timeout=timeout) as response:
+            body = response.read()
+        integrity = sri_hash(body)
+        expected = _locked_integrity(lock, package, version, path, filename)
+        if expected is not None and expected != integrity:
+            raise ValueError(f"{url} のハッシュがロックファイルと一致しません: {integrity} != {expected}")
+        # 書きかけのファイルを配信しないよう、一時ファイルに書いてから置き換える
+        tmp = dest + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(body)
+        os.replace(tmp, dest)
+        lock[filename] = {'url': url, 'integrity': integrity}
+        saved.append(dest)
+    if saved:
+        _write_lock(asset_dir, lock)
+    return saved
+
+
+def _write_lock(asset_dir, lock):
+    path = os.path.join(asset_dir, LOCK_FILE)
+    tmp = path + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(lock, f, indent=2, sort_keys=True)
+        f.write("\n")
+    os.replace(tmp, path)
+
+
+def verify_assets(asset_dir=ASSET_DIR):
+    """取得済みのファイルをロックファイルと照合し、問題のあるファイルとその理由の辞書を返します。"""
+    lock = read_lock(asset_dir)
+    problems = {}
+    for package, version, path, filename in VEGA_ASSETS:
+        dest = os.path.join(asset_dir, filename)
+        expected = _locked_integrity(lock, package, version, path, filename)
+        if not os.path.exists(dest):
+            problems[filename] = "ありません"
+        elif expected is None:
+            problems[filename] = f"ロックファイルに {package}@{version} のハッシュがありません"
+        else:
+            with open(dest, "rb") as f:
+                if sri_hash(f.read()) != expected:
+                    problems[filename] = "ハッシュが一致しません"
+    return problems
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Vega のライブラリを static/vega/ にダウンロードします")
+    parser.add_argument("--dir", default=ASSET_DIR)
+    parser.add_argument("--force", action="store_true", help="取得済みのファイルも取得し直す")
+    parser.add_argument("--verify", action="store_true", help="ダウンロードせず、取得済みのファイルを検証する")
+    args = parser.parse_args()
+    if not args.verify:
+        saved = fetch_assets(args.dir, force=args.force)
+        for path in saved:
+            print(f"保存しました: {path} ({os.path.getsize(path):,} bytes)")
+        if not saved:
+            print("すべて取得済みです")
+    problems = verify_assets(args.dir)
+    for filename, reason in problems.items():
+        print(f"  {filename}: {reason}")
+    if problems:
+        raise SystemExit(1)
+    print(f"{len(VEGA_ASSETS)} ファイルをロックファイル ({LOCK_FILE}) と照合しました")
@@ -0,0 +1,48 @@
+import plotly.io as pio
+
+from data_cache import LRUCache
+
+# (chart_id, data version, 依存する設定) -> シリアライズ済みの図 (JSON 文字列)
+# 図オブジェクトは可変なので、セッション間で共有せず JSON で保持して毎回復元する
+_figures = LRUCache(maxsize=64)
+
+
+def cached_figure(chart_id, version, settings, build):
+    """
+    チャート ID・データバージョン・そのチャートが依存する設定の組ごとに図をキャッシュします。
+
+    settings にはそのチャートが実際に参照する設定だけを渡してください
+    (例: 一致度の推移だけが目標時間帯を含む)。そうすることで、設定を変えたときに
+    無効になるのは影響を受けるチャートだけになります。
+    build() が None を返した場合はキャッシュしません。
+    """
+    fig = lookup(chart_id, version, settings)
+    if fig is not None:
+        return fig
+
+    fig = build()
+    if fig is not None:
+        store(chart_id, version, settings, fig.to_json())
+    return fig
+
+
+def lookup(chart_id, version, settings):
+    """キャッシュ済みの図を復元して返します。無ければ None です。"""
+    serialized = _figures.get((chart_id, version, settings))
+    if serialized is None:
+        return None
+    return pio.from_json(serialized, skip_invalid=True)
+
+
+def store(chart_id, version, settings, serialized):
+    """シリアライズ済みの図 (fig.to_json()) を保存します (ワーカープロセスで作った図用)。"""
+    _figures.put((chart_id, version, settings), serialized)
+
+
+def cache_stats():
+    """図キャッシュのヒット数・ミス数・保持数を返します。"""
+    return {'hits': _figures.hits, 'misses': _figures.misses, 'size': len(_figures)}
+
+
+def clear_figures():
+    _figures.clear()
@@ -4,6 +4,83 @@ import altair as alt
 from streamlit_elements import elements, mui, html, dashboard
 import json
 
+import weather_store
+from scrape_jma_humidity import TOKYO
+from fetch_vega_assets import MissingVegaAssets, asset_sources
+from sleep_weather import shared_view
+
+
+def load_sleep():
+    # dummy_sleep_data.csv は making_data.py が 2025年10月の気象データから作ったもの
+    df = pd.read_csv('dummy_sleep_data.csv')
+    df['Date'] = pd.Timestamp('2025-10-01') + pd.to_timedelta(df['Day'] - 1, unit='D')
+    return df
+
+
+def load_weather():
+    return weather_store.open_weather_store().read(TOKYO)
+
+
+# The six cards share one named dataset instead of each spec carrying its own copy
+DATASET_NAME = 'sleep_weather'
+CHART_COLUMNS = ['Day', 'Sleep_Time', 'Avg_Humidity', 'Avg_Temperature']
+
+
+def shared_data_spec(chart):
+    """Vega-Lite spec of an Altair chart with its inline data replaced by a reference to DATASET_NAME."""
+    spec = chart.to_dict()
+    spec.pop('datasets', None)
+    spec['data'] = {'name': DATASET_NAME}
+    return spec
+
+
+def vega_sources():
+    """
+    Script sources for the Vega libraries. The local copies from fetch_vega_assets.py are
+    used; the CDN is only used after the user explicitly opts in, since the page then
+    needs network access.
+    """
+    try:
+        return asset_sources()
+    except MissingVegaAssets as e:
+        st.warning(f"Vega のライブラリがローカルにありません: {e}")
+        if not st.checkbox("今回は CDN (jsDelivr) から読み込む", key='vega_allow_cdn'):
+            st.stop()
+        return asset_sources(allow_cdn=True)
+
+
+def embed_script(data, specs, sources):
+    """
+    One script for all cards: loads the Vega libraries once (checking their SRI hashes when
+    known) and embeds every spec when they have loaded, attaching the shared dataset. No polling.
+    """
+    sources = [{'src': s.url, 'integrity': s.integrity} for s in sources]
+    return f"""
+        (function() {{
+            const data = {data.to_json(orient='records')};
+            const specs = {json.dumps(specs)};
+            const sources = {json.dumps(sources)};
+            const load = ({{src, integrity}}) => new Promise((resolve, reject) => {{
+                const s = document.createElement('script');
+                s.src = src;
+                if (integrity) {{
+                    s.integrity = integrity;
+                    s.crossOrigin = 'anonymous';
+                }}
+                s.onload = resolve;
+                s.onerror = () => reject(new Error('failed to load ' + src));
+                document.head.appendChild(s);
+            }});
+            // Load in order (vega-lite and vega-embed depend on vega) and only once per frame
+            window.__vegaReady = window.__vegaReady ||
+                sources.reduce((ready, source) => ready.then(() => load(source)), Promise.resolve());
+            window.__vegaReady.then(() => Promise.all(Object.entries(specs).map(([uid, spec]) =>
+                window.vegaEmbed('#' + uid, {{...spec, datasets: {{{DATASET_NAME}: data}}}}, {{actions: false}})
+            ))).catch((err) => console.error(err));
+        }})();
+    """
+
+
 def main():
     st.set_page_config(layout="wide", page_title="生活の可視化")
     
@@ -29,11 +106,12 @@ def main():
     
     if 'sleep_time_val' not in st.session_state:
         st.session_state.sleep_time_val = 7.0
-    
+
+    sources = vega_sources()
+
     try:
-        df_sleep = pd.read_csv('dummy_sleep_data.csv')
-        df_weather = pd.read_csv('tokyo_humidity_2025_10.csv')
-        df_merged = pd.merge(df_sleep, df_weather, on='Day', how='left')
+        df_merged = shared_view('humidity_viz', 'dummy_sleep_data.csv', load_sleep,
+                                weather_store.WEATHER_FILE, load_weather).frame
         
         # Initialize dashboard layout for 3x3 grid
         # 12 columns total. 3 columns -> 4 units width each.
@@ -50,30 +128,10 @@ def main():
 
             ]
 
-        with elements("dashboard"):
-            # Load Vega libraries inside the iframe context
-            html.script(src="https://cdn.jsdelivr.net/npm/vega@5")
-            html.script(src="https://cdn.jsdelivr.net/npm/vega-lite@5")
-            html.script(src="https://cdn.jsdelivr.net/npm/vega-embed@6")
-
-            def render_altair(chart, uid):
-                spec = chart.to_dict()
-                with html.div(style={'width': '100%', 'height': '100%'}):
-                    html.div(id=uid, style={'width': '100%', 'height': '100%'})
-                    html.script(f"""
-                        (function() {{
-                            const spec = {json.dumps(spec)};
-                            const embed = () => {{
-                                if (window.vegaEmbed) {{
-                                    window.vegaEmbed('#{uid}', spec, {{actions: false}});
-                                }} else {{
-                                    setTimeout(embed, 100);
-                                }}
-                            }};
-                            embed();
-                        }})();
-                    """)
+        # Specs collected by create_chart_card and embedded together after the grid
+        specs = {}
 
+        with elements("dashboard"):
             with dashboard.Grid(st.session_state.layout):
                 
                 # Helper to create a card with a chart
@@ -81,14 +139,16 @@ def main():
                     with mui.Card(key=key, sx={"display": "flex", "flexDirection": "column", "height": "100%"}):
                         mui.CardHeader(title=title, titleTypographyProps={"variant": "subtitle1"})
                         with mui.CardContent(sx={"flex": 1, "minHeight": 0, "padding": "8px"}):
-                            render_altair(chart.properties(width='container', height='container'), f"vis_{key}")
+                            uid = f"vis_{key}"
+                            html.div(id=uid, style={'width': '100%', 'height': '100%'})
+                            specs[uid] = shared_data_spec(chart.properties(width='container', height='container'))
 
                 # Chart Definitions
                 base = alt.Chart(df_merged).encode(x=alt.X('Day', title='日'))
                 
                 # 1. Histogram
                 # 1. Histogram
-                hist = alt.Chart(df_sleep).mark_bar().encode(
+                hist = alt.Chart(df_merged).mark_bar().encode(
                     alt.X("Sleep_Time", bin=alt.Bin(step=0.5), title="睡眠時間", axis=alt.Axis(format='.1f')),
                     y=alt.Y('count()', title='頻度'),
                     tooltip=[alt.Tooltip("Sleep_Time", bin=True, title="睡眠時間 (範囲)"), 'count()']
@@ -121,6 +181,9 @@ def main():
                 )
                 create_chart_card("chart6", "ダミーデータ", scatter_temp)
 
+            # Data is shipped once for all six cards
+            html.script(embed_script(df_merged[CHART_COLUMNS], specs, sources))
+
 
 
     except FileNotFoundError as e:
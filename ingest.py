@@ -0,0 +1,80 @@
+import os
+
+import numpy as np
+
+import storage
+
+
+class IngestResult:
+    """アップロードの取り込み結果 (追加・更新・スキップした行数)。"""
+    def __init__(self, inserted=0, updated=0, skipped=0):
+        self.inserted = inserted
+        self.updated = updated
+        self.skipped = skipped
+
+    @property
+    def changed(self):
+        return self.inserted + self.updated > 0
+
+    def __repr__(self):
+        return f"IngestResult(inserted={self.inserted}, updated={self.updated}, skipped={self.skipped})"
+
+
+def _store_exists(store):
+    return os.path.exists(store.path)
+
+
+def merge_upload(store, uploaded):
+    """
+    アップロードされた行を既存のデータに 日付 をキーとしてマージします。
+
+    - 既存にない日付の行は追加 (inserted)
+    - 既存と同じ日付で、タイムスタンプがより新しく内容が異なる行は更新 (updated)
+    - それ以外 (既に持っている行・古い回答・アップロード内の重複) はスキップ (skipped)
+
+    書き込むのは追加・更新する行だけです。差分がなければファイルには触れないため、
+    ファイルのバージョンも変わらず、下流のキャッシュはそのまま使えます。
+    """
+    incoming = storage.to_typed_frame(uploaded)
+    n_uploaded = len(incoming)
+
+    # 同じ日付への再回答はタイムスタンプが最新のものを採用する
+    if storage.TIMESTAMP_COL in incoming.columns:
+        incoming = incoming.sort_values(storage.TIMESTAMP_COL, kind='stable')
+    incoming = storage.latest_per_date(incoming)
+    result = IngestResult(skipped=n_uploaded - len(incoming))
+
+    if not _store_exists(store):
+        store.write(incoming)
+        result.inserted = len(incoming)
+        return result
+
+    existing = store.read()
+    compare_cols = [c for c in incoming.columns if c in existing.columns and c != storage.DATE_COL]
+    merged = incoming[[storage.DATE_COL]].merge(
+        existing[[storage.DATE_COL] + compare_cols], on=storage.DATE_COL, how='left', indicator=True
+    )
+    is_new = (merged['_merge'] == 'left_only').to_numpy()
+
+    # 内容の比較は文字列表現で行う (<NA> 同士を等しいとみなすため)
+    changed = np.zeros(len(incoming), dtype=bool)
+    for col in compare_cols:
+        if col == storage.TIMESTAMP_COL:
+            continue
+        changed |= (incoming[col].astype(str).to_numpy() != merged[col].astype(str).to_numpy())
+
+    if storage.TIMESTAMP_COL in compare_cols:
+        existing_ts = merged[storage.TIMESTAMP_COL]
+        newer = (incoming[storage.TIMESTAMP_COL].to_numpy() > existing_ts.to_numpy()) | existing_ts.isna().to_numpy()
+    else:
+        newer = np.ones(len(incoming), dtype=bool)
+
+    is_update = ~is_new & changed & newer
+    delta = incoming[is_new | is_update]
+    if len(delta):
+        store.append(delta)
+
+    result.inserted = int(is_new.sum())
+    result.updated = int(is_update.sum())
+    result.skipped += len(incoming) - result.inserted - result.updated
+    return result
@@ -0,0 +1,361 @@
+"""
+気象庁の日別値を長期間さかのぼって取得し、weather_store に保存するバックフィルのジョブです。
+
+    python jma_backfill.py --from 2000-01 --to 2025-10 --rate 1 --workers 4
+
+(地点, 月) ごとの作業単位を計画し、全ワーカー合計で 1 秒あたり --rate 件までにリクエストを
+抑えて取得します。エラーはジッター付きの指数バックオフで再試行し、サーバーが 429/503 を返したら
+レートを一時的に下げます (Retry-After があれば秒数・日時のどちらの形式でもそれまで待ちます)。
+復号・解析できないページは再試行せず、その単位の失敗として記録します。
+保存済みの単位はチェックポイント (JSON) に記録するので、途中で止めても (Ctrl-C / kill) 同じコマンドで続きから再開できます。
+"""
+import argparse
+import datetime
+import email.utils
+import http.client
+import json
+import os
+import random
+import threading
+import time
+import urllib.error
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import pandas as pd
+
+import jma_cache
+import weather_store
+from jma_parser import parse_daily_table
+from scrape_jma_humidity import FETCH_ERRORS, JMA_BASE_URL, JMAClient, Station, _parse_year_month, fetch_daily_page
+
+DEFAULT_CHECKPOINT = 'backfill_checkpoint.json'
+
+# 時間をおけば成功しうる HTTP ステータス。それ以外 (404 など) は再試行しない
+RETRY_STATUS = {429, 500, 502, 503, 504}
+# サーバーが混雑を示すステータス。受け取ったらレートを下げる
+THROTTLE_STATUS = {429, 503}
+
+
+class TokenBucket:
+    """
+    全ワーカーで共有するリクエストのレート制限。
+    平均 rate 件/秒、最大 burst 件までの連続リクエストを許します
+    (各リクエストに送信時刻の枠を予約する方式なので、待ちの順番は到着順になります)。
+
+    throttle() でレートを半分にし、recover() で少しずつ元のレートに戻します。
+    """
+    def __init__(self, rate, burst=1, min_rate=None, clock=time.monotonic, sleep=time.sleep):
+        self.max_rate = rate
+        self.rate = rate
+        self.min_rate = min_rate or rate / 16
+        self.burst = burst
+        self._clock = clock
+        self._sleep = sleep
+        self._next = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """次のリクエストを送ってよい時刻まで待ちます。"""
+        with self._lock:
+            now = self._clock()
+            slot = max(self._next, now - (self.burst - 1) / self.rate)
+            self._next = slot + 1 / self.rate
+        if slot > now:
+            self._sleep(slot - now)
+
+    def throttle(self):
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+
+    def recover(self):
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.max_rate / 20)
+
+
+def backoff_delay(attempt, base, cap, rng=random):
+    """attempt 回目の再試行までの待ち時間 (秒)。0〜min(cap, base·2^attempt) の一様乱数 (full jitter)。"""
+    return rng.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def retry_after_seconds(value, now=None):
+    """
+    Retry-After ヘッダーの値を待ち時間 (秒) にします。秒数と HTTP-date の両方の形式に対応し、
+    解釈できない値や過去の日時は 0 です (例外は送出しません)。now は比較する UNIX 時刻 (テスト用)。
+    """
+    if not value:
+        return 0.0
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        when = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return 0.0
+    if when.tzinfo is None:
+        # HTTP-date は GMT。タイムゾーンのない日時も GMT とみなす
+        when = when.replace(tzinfo=datetime.timezone.utc)
+    return max(0.0, when.timestamp() - (time.time() if now is None else now))
+
+
+def unit_key(station, year, month):
+    return f"{station.prec_no}:{station.block_no}:{year:04d}-{month:02d}"
+
+
+class Checkpoint:
+    """
+    保存済み (done) と、再試行しても失敗した (failed) 作業単位の記録。
+    save() は一時ファイルに書いてから置き換えるので、途中で止まっても壊れません。
+    """
+    def __init__(self, path):
+        self.path = path
+        self.done = set()
+        self.failed = {}
+        if path and os.path.exists(path):
+            with open(path, encoding='utf-8') as f:
+                state = json.load(f)
+            self.done = set(state.get('done', []))
+            self.failed = dict(state.get('failed', {}))
+
+    def is_done(self, unit):
+        return unit_key(*unit) in self.done
+
+    def mark_done(self, units):
+        for unit in units:
+            key = unit_key(*unit)
+            self.done.add(key)
+            self.failed.pop(key, None)
+
+    def clear_failed(self, units):
+        for unit in units:
+            self.failed.pop(unit_key(*unit), None)
+
+    def mark_failed(self, unit, error):
+        self.failed[unit_key(*unit)] = error
+
+    def save(self):
+        if not self.path:
+            return
+        tmp = f"{self.path}.tmp"
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({'done': sorted(self.done), 'failed': self.failed}, f, ensure_ascii=False, indent=1)
+        os.replace(tmp, self.path)
+
+
+class BackfillJob:
+    """
+    (地点, 月) の作業単位をレート制限付きで取得し、store に保存するジョブ。
+
+    取得した月は flush_every 件ごとにまとめて store に upsert し、その後でチェックポイントに
+    記録します (チェックポイントにある単位は必ず store に保存済み)。当月・前月はまだ値が変わりうるので
+    チェックポイントには記録せず、次回の実行でも取り直します (jma_cache.is_closed_month)。
+    cache (jma_cache.PageCache) にあるページはリクエストせず、レート制限の対象にもなりません。
+    """
+    def __init__(self, store, stations, start, end, checkpoint=None, rate=1.0, burst=1, workers=4,
+                 max_retries=5, backoff_base=1.0, backoff_max=60.0, flush_every=24,
+                 base_url=JMA_BASE_URL, timeout=30, cache=None, today=None, seed=None,
+                 progress=None, progress_interval=10.0):
+        self.store = store
+        self.stations = stations
+        self.start = start
+        self.end = end
+        self.checkpoint = checkpoint if isinstance(checkpoint, Checkpoint) else Checkpoint(checkpoint)
+        self.bucket = TokenBucket(rate, burst)
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.flush_every = flush_every
+        self.base_url = base_url
+        self.timeout = timeout
+        self.cache = cache
+        self.today = today
+        self.progress = progress
+        self.progress_interval = progress_interval
+
+        self._rng = random.Random(seed)
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._clients = []
+        self.total = self.done = self.failed = 0
+        self.requests = self.retries = 0
+        self._started = None
+
+    def plan(self):
+        """
+        取得が必要で、チェックポイントにまだない作業単位 (station, year, month) のリスト。
+        当月・前月は (古いチェックポイントに記録されていても) 常に含めます。
+        """
+        units = []
+        for station in self.stations:
+            for year, month in self.store.missing_months(station, self.start, self.end, self.today):
+                unit = (station, year, month)
+                if not jma_cache.is_closed_month(year, month, self.today) or not self.checkpoint.is_done(unit):
+                    units.append(unit)
+        return units
+
+    def stop(self):
+        """実行中の単位が終わったところで止めます (保存・チェックポイントは行われます)。"""
+        self._stop.set()
+
+    def _client(self):
+        if not hasattr(self._local, 'client'):
+            self._local.client = JMAClient(self.base_url, self.timeout)
+            with self._lock:
+                self._clients.append(self._local.client)
+        return self._local.client
+
+    def _before_request(self):
+        self.bucket.acquire()
+        with self._lock:
+            self.requests += 1
+
+    def _work(self, unit):
+        """1 単位を取得・解析します。戻り値は (unit, DailyTable or None, エラー or None)。"""
+        station, year, month = unit
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if self._stop.is_set():
+                return unit, None, "中断"
+            retry_after = 0
+            try:
+                html_content = fetch_daily_page(self._client(), station, year, month,
+                                                self.cache, self._before_request)
+                self.bucket.recover()
+                return unit, parse_daily_table(html_content, year, month), None
+            except urllib.error.HTTPError as e:
+                error = e
+                if e.code not in RETRY_STATUS:
+                    break
+                if e.code in THROTTLE_STATUS:
+                    self.bucket.throttle()
+                retry_after = retry_after_seconds(e.headers.get('Retry-After')) if e.headers else 0
+            except (OSError, http.client.HTTPException) as e:
+                error = e
+            except FETCH_ERRORS as e:
+                # 復号・解析のエラーは同じページを取り直しても変わらないので、再試行せずに失敗として記録する
+                error = e
+                break
+            if attempt < self.max_retries:
+                with self._lock:
+                    self.retries += 1
+                    delay = backoff_delay(attempt, self.backoff_base, self.backoff_max, self._rng)
+                # stop() されたらすぐ起きる
+                self._stop.wait(max(delay, retry_after))
+        return unit, None, f"{type(error).__name__}: {error}"
+
+    def _flush(self, tables):
+        frames = []
+        for (station, _, _), table in tables:
+            if len(table):
+                frame = table.to_frame()
+                frame.insert(0, 'Block_No', station.block_no)
+                frame.insert(0, 'Prec_No', station.prec_no)
+                frames.append(frame)
+        if frames:
+            self.store.upsert(pd.concat(frames, ignore_index=True))
+        units = [unit for unit, _ in tables]
+        self.checkpoint.mark_done([u for u in units if jma_cache.is_closed_month(u[1], u[2], self.today)])
+        self.checkpoint.clear_failed(units)
+        self.checkpoint.save()
+        tables.clear()
+
+    def stats(self):
+        """進捗: 件数、スループット (単位/秒・リクエスト/秒)、残り時間の見込み (秒)。"""
+        elapsed = time.monotonic() - self._started if self._started else 0.0
+        finished = self.done + self.failed
+        remaining = self.total - finished
+        units_per_sec = finished / elapsed if elapsed > 0 else 0.0
+        return {
+            'total': self.total, 'done': self.done, 'failed': self.failed,
+            'requests': self.requests, 'retries': self.retries,
+            'elapsed_sec': round(elapsed, 3),
+            'units_per_sec': round(units_per_sec, 3),
+            'requests_per_sec': round(self.requests / elapsed, 3) if elapsed > 0 else 0.0,
+            'rate_limit': round(self.bucket.rate, 3),
+            'eta_sec': round(remaining / units_per_sec, 1) if units_per_sec > 0 else None,
+        }
+
+    def run(self, units=None):
+        """
+        units (省略時は plan()) を取得して保存し、最終的な stats() を返します。
+        KeyboardInterrupt を受けたら実行中の単位を待ち、保存とチェックポイントをしてから送出し直します。
+        """
+        units = self.plan() if units is None else units
+        self.total = len(units)
+        self.done = self.failed = self.requests = self.retries = 0
+        self._started = time.monotonic()
+        last_report = self._started
+        pending = []
+
+        pool = ThreadPoolExecutor(max_workers=self.workers)
+        try:
+            futures = [pool.submit(self._work, unit) for unit in units]
+            for future in as_completed(futures):
+                unit, table, error = future.result()
+                if table is not None:
+                    pending.append((unit, table))
+                    self.done += 1
+                elif error != "中断":
+                    self.checkpoint.mark_failed(unit, error)
+                    self.failed += 1
+                if len(pending) >= self.flush_every:
+                    self._flush(pending)
+                now = time.monotonic()
+                if self.progress and now - last_report >= self.progress_interval:
+                    self.progress(self.stats())
+                    last_report = now
+        except KeyboardInterrupt:
+            self.stop()
+            raise
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+            self._flush(pending)
+            for c in self._clients:
+                c.close()
+        return self.stats()
+
+
+def format_stats(stats):
+    eta = "-" if stats['eta_sec'] is None else time.strftime('%H:%M:%S', time.gmtime(stats['eta_sec']))
+    return (f"{stats['done'] + stats['failed']}/{stats['total']} 件 (失敗 {stats['failed']}) "
+            f"{stats['units_per_sec']:.2f} 件/秒, {stats['requests_per_sec']:.2f} req/秒 "
+            f"(上限 {stats['rate_limit']:.2f}), 再試行 {stats['retries']}, 残り {eta}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="気象庁の日別値をレート制限付きでバックフィルします (中断しても再開できます)。")
+    parser.add_argument('--stations', default="44:47662:東京")
+    parser.add_argument('--from', dest='start', type=_parse_year_month, required=True, help="開始月 (YYYY-MM)")
+    parser.add_argument('--to', dest='end', type=_parse_year_month, required=True, help="終了月 (YYYY-MM)")
+    parser.add_argument('--store', default=weather_store.WEATHER_FILE)
+    parser.add_argument('--checkpoint', default=DEFAULT_CHECKPOINT)
+    parser.add_argument('--rate', type=float, default=1.0, help="全体のリクエスト数の上限 (件/秒)")
+    parser.add_argument('--burst', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=4)
+    parser.add_argument('--max-retries', type=int, default=5)
+    parser.add_argument('--flush-every', type=int, default=24, help="この件数ごとに保存してチェックポイントを書く")
+    parser.add_argument('--base-url', default=JMA_BASE_URL)
+    parser.add_argument('--cache-dir', default=jma_cache.DEFAULT_CACHE_DIR)
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+
+    job = BackfillJob(
+        weather_store.open_weather_store(args.store),
+        [Station.parse(s) for s in args.stations.split(',')],
+        args.start, args.end, args.checkpoint,
+        rate=args.rate, burst=args.burst, workers=args.workers, max_retries=args.max_retries,
+        flush_every=args.flush_every, base_url=args.base_url,
+        cache=None if args.no_cache else jma_cache.PageCache(args.cache_dir),
+        progress=lambda stats: print(format_stats(stats), flush=True),
+    )
+    try:
+        stats = job.run()
+    except KeyboardInterrupt:
+        print(f"\n中断しました。{format_stats(job.stats())}")
+        print(f"同じコマンドで続きから再開できます ({args.checkpoint})")
+    else:
+        print(format_stats(stats))
+        for key, error in sorted(job.checkpoint.failed.items()):
+            print(f"  失敗: {key}: {error}")
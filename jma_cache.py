@@ -0,0 +1,162 @@
+"""
+気象庁ページの生 HTML をディスクに保存するキャッシュです。
+
+    cache = PageCache('jma_cache', ttl_sec=6 * 3600, max_bytes=512 * 2**20)
+    html = cache.get(station, 2015, 4)      # 無い/古い場合は None
+    cache.put(station, 2015, 4, html)
+
+キーは (ページ種別, 地点, 年, 月[, 日]) で、root/<府県番号>_<地点番号>/<種別>/<YYYY>-<MM>[-<DD>].html.gz
+に gzip で保存します (時別値ページは 1 日 1 ページなので日も含めます)。
+  - 前月より前の月 (確定した月) のページは、月が確定した後 (翌々月 1 日以降) に保存したものなら
+    変わらないので再取得しません。確定する前に保存したページは途中までの値なので、ttl_sec で扱います。
+  - 当月・前月 (と未来の月) は値が更新されうるので、ttl_sec を過ぎたら古いとみなします。
+  - 合計サイズが max_bytes を超えたら、最近使われていないページから削除します。
+"""
+import datetime
+import gzip
+import os
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_CACHE_DIR = "jma_cache"
+DEFAULT_TTL_SEC = 6 * 3600
+DEFAULT_MAX_BYTES = 512 * 2**20
+
+_SUFFIX = ".html.gz"
+
+
+def is_closed_month(year, month, today=None):
+    """(year, month) が前月より前、つまり今後変わらない月なら True を返します。"""
+    today = today or datetime.date.today()
+    prev_year, prev_month = (today.year - 1, 12) if today.month == 1 else (today.year, today.month - 1)
+    return (year, month) < (prev_year, prev_month)
+
+
+def month_closed_at(year, month):
+    """(year, month) が確定する時刻 (翌々月 1 日 0 時、ローカル時刻) の UNIX 時刻を返します。"""
+    year, month = (year + 1, month - 10) if month > 10 else (year, month + 2)
+    return time.mktime(datetime.date(year, month, 1).timetuple())
+
+
+class PageCache:
+    """
+    (ページ種別, 地点, 年, 月[, 日]) ごとの生 HTML を保持するディスクキャッシュ。
+    fetch_months のワーカースレッドから同時に使えます。
+    """
+    def __init__(self, root=DEFAULT_CACHE_DIR, ttl_sec=DEFAULT_TTL_SEC, max_bytes=DEFAULT_MAX_BYTES, today=None):
+        self.root = root
+        self.ttl_sec = ttl_sec
+        self.max_bytes = max_bytes
+        self.today = today  # テスト用。None なら実行時の日付
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        # 相対パス -> サイズ (bytes)。先頭ほど長く使われていない
+        self._entries = OrderedDict()
+        self._total = 0
+        self._scan()
+
+    def _scan(self):
+        """既存のファイルを更新時刻の古い順に読み込み、サイズを集計します。"""
+        if not os.path.isdir(self.root):
+            return
+        found = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(_SUFFIX):
+                    st = os.stat(os.path.join(dirpath, name))
+                    found.append((st.st_mtime, os.path.relpath(os.path.join(dirpath, name), self.root), st.st_size))
+        for _, rel, size in sorted(found):
+            self._entries[rel] = size
+            self._total += size
+
+    @staticmethod
+    def _relpath(station, year, month, kind, day=None):
+        name = f"{year:04d}-{month:02d}" if day is None else f"{year:04d}-{month:02d}-{day:02d}"
+        return os.path.join(f"{station.prec_no}_{station.block_no}", kind, name + _SUFFIX)
+
+    def _is_fresh(self, path, year, month):
+        mtime = os.path.getmtime(path)
+        # 確定した月でも、確定する前 (月の途中) に保存したページは TTL で再取得する
+        if is_closed_month(year, month, self.today) and mtime >= month_closed_at(year, month):
+            return True
+        return time.time() - mtime < self.ttl_sec
+
+    def get(self, station, year, month, kind="daily", allow_stale=False, day=None):
+        """
+        キャッシュ済みの HTML を返します。無い場合、または更新されうる月 (確定する前に保存したページを含む) で
+        ttl_sec を過ぎている場合は None です (allow_stale=True なら古くても返します)。
+        """
+        rel = self._relpath(station, year, month, kind, day)
+        path = os.path.join(self.root, rel)
+        try:
+            fresh = self._is_fresh(path, year, month)
+            if not fresh and not allow_stale:
+                with self._lock:
+                    self.stale += 1
+                return None
+            with gzip.open(path, 'rt', encoding='utf-8') as f:
+                html_content = f.read()
+        except (FileNotFoundError, EOFError, gzip.BadGzipFile):
+            with self._lock:
+                self.misses += 1
+            return None
+
+        with self._lock:
+            self.hits += 1
+            if rel in self._entries:
+                self._entries.move_to_end(rel)
+        return html_content
+
+    def put(self, station, year, month, html_content, kind="daily", day=None):
+        """HTML を保存し、必要なら古いページを削除して max_bytes 以内に収めます。"""
+        rel = self._relpath(station, year, month, kind, day)
+        path = os.path.join(self.root, rel)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+
+        # 書きかけのファイルを読まないよう、一時ファイルに書いてから置き換える
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with gzip.open(tmp, 'wt', encoding='utf-8') as f:
+            f.write(html_content)
+        os.replace(tmp, path)
+        size = os.path.getsize(path)
+
+        with self._lock:
+            self._total += size - self._entries.pop(rel, 0)
+            self._entries[rel] = size
+            self._evict(keep=rel)
+
+    def _evict(self, keep):
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            rel = next(iter(self._entries))
+            if rel == keep:
+                break
+            size = self._entries.pop(rel)
+            self._total -= size
+            self.evictions += 1
+            try:
+                os.remove(os.path.join(self.root, rel))
+            except FileNotFoundError:
+                pass
+
+    def total_bytes(self):
+        return self._total
+
+    def stats(self):
+        """ヒット数・ミス数・期限切れ数・削除数・保持数・合計サイズを返します。"""
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'stale': self.stale,
+                    'evictions': self.evictions, 'entries': len(self._entries), 'bytes': self._total}
+
+    def clear(self):
+        with self._lock:
+            for rel in self._entries:
+                try:
+                    os.remove(os.path.join(self.root, rel))
+                except FileNotFoundError:
+                    pass
+            self._entries.clear()
+            self._total = 0
@@ -0,0 +1,243 @@
+"""
+気象庁の日別値ページ (daily_s1.php)・時別値ページ (hourly_s1.php) の表を、
+列ごとの型付き配列に変換するパーサです。
+
+    table = parse_daily_table(html_content, 2025, 10)
+    table.values['Avg_Humidity']   # float64 の配列 (欠測は NaN)
+    table.flags['Avg_Humidity']    # uint8 の品質フラグ (FLAG_*)
+    df = table.to_frame()
+
+レスポンスを分割して受け取っても DailyTableParser.feed() に順に渡せば解析できます
+(完結した行 </tr> ごとに変換し、全行の文字列を保持しません)。
+"""
+import codecs
+import html
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# daily_s1.php の列 (左から順)。Day 以外は日ごとの値
+DAILY_COLUMNS = [
+    'Day',
+    'Pressure_Station', 'Pressure_Sea',                                     # 気圧 (hPa) 現地・海面 平均
+    'Precipitation_Total', 'Precipitation_Max_1h', 'Precipitation_Max_10min',  # 降水量 (mm)
+    'Avg_Temperature', 'Max_Temperature', 'Min_Temperature',                # 気温 (℃)
+    'Avg_Humidity', 'Min_Humidity',                                         # 湿度 (％)
+    'Avg_Wind_Speed', 'Max_Wind_Speed', 'Max_Wind_Direction',               # 風 (m/s)
+    'Max_Gust_Speed', 'Max_Gust_Direction',
+    'Sunshine_Duration',                                                    # 日照時間 (h)
+    'Snowfall', 'Max_Snow_Depth',                                           # 雪 (cm)
+    'Weather_Day', 'Weather_Night',                                         # 天気概況 昼・夜
+]
+TEXT_COLUMNS = {'Max_Wind_Direction', 'Max_Gust_Direction', 'Weather_Day', 'Weather_Night'}
+NUMERIC_COLUMNS = [c for c in DAILY_COLUMNS[1:] if c not in TEXT_COLUMNS]
+
+# hourly_s1.php の列 (左から順)。Hour は 1〜24 (24 は翌日 0 時の観測)
+HOURLY_COLUMNS = [
+    'Hour',
+    'Pressure_Station', 'Pressure_Sea',          # 気圧 (hPa)
+    'Precipitation',                             # 降水量 (mm、前 1 時間)
+    'Temperature', 'Dew_Point',                  # 気温・露点温度 (℃)
+    'Vapor_Pressure',                            # 蒸気圧 (hPa)
+    'Humidity',                                  # 湿度 (％)
+    'Wind_Speed', 'Wind_Direction',              # 風速 (m/s)・風向
+    'Sunshine_Duration',                         # 日照時間 (h)
+    'Solar_Radiation',                           # 全天日射量 (MJ/㎡)
+    'Snowfall', 'Snow_Depth',                    # 雪 (cm)
+    'Weather', 'Cloud_Cover',                    # 天気・雲量
+    'Visibility',                                # 視程 (km)
+]
+HOURLY_TEXT_COLUMNS = {'Wind_Direction', 'Weather', 'Cloud_Cover'}
+HOURLY_NUMERIC_COLUMNS = [c for c in HOURLY_COLUMNS[1:] if c not in HOURLY_TEXT_COLUMNS]
+
+# 品質フラグ (気象庁の値の後ろに付く記号)
+FLAG_OK = 0
+FLAG_QUASI = 1           # ")" 準正常値 (欠測が許容範囲内)
+FLAG_INSUFFICIENT = 2    # "]" 資料不足値
+FLAG_QUESTIONABLE = 3    # "#" 疑問値
+FLAG_MISSING = 4         # "×" "///" 空欄 など、値がない
+FLAG_NO_PHENOMENON = 5   # "--" 該当現象なし (降水・降雪がなかった等)。値は NaN
+_SUFFIX_FLAGS = {')': FLAG_QUASI, ']': FLAG_INSUFFICIENT, '#': FLAG_QUESTIONABLE}
+
+# 少なくともこの列数がある行 (日照時間まで) を日別値の行とみなす
+MIN_CELLS = DAILY_COLUMNS.index('Sunshine_Duration') + 1
+# 時別値は湿度まであれば採用する
+HOURLY_MIN_CELLS = HOURLY_COLUMNS.index('Humidity') + 1
+
+_ROW_END = re.compile(r'</tr\s*>', re.IGNORECASE)
+_CELL = re.compile(r'<td\b[^>]*>(.*?)</td\s*>', re.IGNORECASE | re.DOTALL)
+_TAG = re.compile(r'<[^>]*>')
+_FLAGGED_NUMBER = re.compile(r'^(-?\d+(?:\.\d*)?)\s*([)\]#])?$')
+
+
+def _cell_text(raw):
+    if '<' in raw:
+        raw = _TAG.sub('', raw)
+    if '&' in raw:
+        raw = html.unescape(raw)
+    return raw.strip()
+
+
+def parse_value(text):
+    """セルの文字列を (値, フラグ) に変換します。数値でなければ値は NaN です。"""
+    try:
+        return float(text), FLAG_OK
+    except ValueError:
+        pass
+    if text == '--':
+        return np.nan, FLAG_NO_PHENOMENON
+    m = _FLAGGED_NUMBER.match(text)
+    if m is None:
+        return np.nan, FLAG_MISSING
+    return float(m.group(1)), _SUFFIX_FLAGS.get(m.group(2), FLAG_OK)
+
+
+class DailyTable(namedtuple('DailyTable', ['year', 'month', 'days', 'values', 'flags', 'text'])):
+    """
+    1 か月分の日別値。
+    days は日 (int16)、values は数値列 -> float64 配列、flags は数値列 -> uint8 配列、
+    text は文字列の列 (風向・天気概況) -> object 配列です。
+    """
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.days)
+
+    def to_frame(self):
+        """Date 列と各列、数値列ごとの <列名>_Flag 列を持つ DataFrame を返します。"""
+        data = {'Date': pd.to_datetime({'year': np.full(len(self), self.year),
+                                        'month': np.full(len(self), self.month),
+                                        'day': self.days})}
+        for name in DAILY_COLUMNS[1:]:
+            if name in TEXT_COLUMNS:
+                data[name] = pd.Categorical(self.text[name])
+            else:
+                data[name] = self.values[name]
+                data[f'{name}_Flag'] = self.flags[name]
+        return pd.DataFrame(data)
+
+
+class HourlyTable(namedtuple('HourlyTable', ['year', 'month', 'day', 'hours', 'values', 'flags', 'text'])):
+    """
+    1 日分の時別値。hours は 1〜24 (int16)、values / flags / text は DailyTable と同じ形式です。
+    """
+    __slots__ = ()
+
+    def __len__(self):
+        return len(self.hours)
+
+    def to_frame(self):
+        """Time 列 (観測時刻。24 時は翌日 0 時) と各列、数値列ごとの <列名>_Flag 列を持つ DataFrame。"""
+        day = pd.Timestamp(year=self.year, month=self.month, day=self.day)
+        data = {'Time': day + pd.to_timedelta(self.hours.astype(np.int64), unit='h')}
+        for name in HOURLY_COLUMNS[1:]:
+            if name in HOURLY_TEXT_COLUMNS:
+                data[name] = pd.Categorical(self.text[name])
+            else:
+                data[name] = self.values[name]
+                data[f'{name}_Flag'] = self.flags[name]
+        return pd.DataFrame(data)
+
+
+class DailyTableParser:
+    """
+    日別値ページを分割して受け取りながら解析するパーサ。
+    feed() で文字列を順に渡し、最後に close() で DailyTable を受け取ります。
+    """
+    COLUMNS = DAILY_COLUMNS
+    TEXT = TEXT_COLUMNS
+    MIN_CELLS = MIN_CELLS
+
+    def __init__(self, year, month):
+        self.year = year
+        self.month = month
+        self._buffer = ''
+        # バイト列のチャンクの境界でマルチバイト文字が分かれても正しく復号する
+        self._decoder = codecs.getincrementaldecoder('utf-8')()
+        self._days = []
+        numeric = [c for c in self.COLUMNS[1:] if c not in self.TEXT]
+        self._values = {name: [] for name in numeric}
+        self._flags = {name: [] for name in numeric}
+        self._text = {name: [] for name in self.TEXT}
+
+    def feed(self, chunk):
+        if isinstance(chunk, bytes):
+            chunk = self._decoder.decode(chunk)
+        self._buffer += chunk
+        # 完結した行だけを処理し、途中の行はバッファに残す
+        end = 0
+        for m in _ROW_END.finditer(self._buffer):
+            self._handle_row(self._buffer[end:m.start()])
+            end = m.end()
+        if end:
+            self._buffer = self._buffer[end:]
+
+    def _handle_row(self, row_html):
+        cells = _CELL.findall(row_html)
+        if len(cells) < self.MIN_CELLS:
+            return
+        day_str = _cell_text(cells[0])
+        if not day_str.isdigit():
+            return
+        n_columns = len(self.COLUMNS)
+        cells = [_cell_text(c) for c in cells[1:n_columns]]
+        cells += [''] * (n_columns - 1 - len(cells))
+
+        self._days.append(int(day_str))
+        for name, text in zip(self.COLUMNS[1:], cells):
+            if name in self.TEXT:
+                self._text[name].append(text or None)
+            else:
+                value, flag = parse_value(text)
+                self._values[name].append(value)
+                self._flags[name].append(flag)
+
+    def _arrays(self):
+        return (np.array(self._days, dtype=np.int16),
+                {name: np.array(v, dtype=np.float64) for name, v in self._values.items()},
+                {name: np.array(v, dtype=np.uint8) for name, v in self._flags.items()},
+                {name: np.array(v, dtype=object) for name, v in self._text.items()})
+
+    def close(self):
+        self.feed(self._decoder.decode(b'', final=True))
+        self._buffer = ''
+        return DailyTable(self.year, self.month, *self._arrays())
+
+
+class HourlyTableParser(DailyTableParser):
+    """時別値ページ用のパーサ。先頭の列が日ではなく時 (1〜24) です。close() は HourlyTable を返します。"""
+    COLUMNS = HOURLY_COLUMNS
+    TEXT = HOURLY_TEXT_COLUMNS
+    MIN_CELLS = HOURLY_MIN_CELLS
+
+    def __init__(self, year, month, day):
+        super().__init__(year, month)
+        self.day = day
+
+    def close(self):
+        self.feed(self._decoder.decode(b'', final=True))
+        self._buffer = ''
+        return HourlyTable(self.year, self.month, self.day, *self._arrays())
+
+
+def parse_daily_table(source, year, month):
+    """
+    日別値ページを DailyTable に変換します。
+    source は HTML 全体の文字列、または文字列/バイト列のチャンクの iterable です。
+    """
+    return _parse(DailyTableParser(year, month), source)
+
+
+def parse_hourly_table(source, year, month, day):
+    """時別値ページを HourlyTable に変換します。source は parse_daily_table と同じです。"""
+    return _parse(HourlyTableParser(year, month, day), source)
+
+
+def _parse(parser, source):
+    if isinstance(source, (str, bytes)):
+        source = [source]
+    for chunk in source:
+        parser.feed(chunk)
+    return parser.close()
@@ -0,0 +1,182 @@
+"""
+保存した気象庁のページを返すローカルのサーバーです (オフラインでの確認・テスト用)。
+
+    python jma_stub_server.py --pages tests/fixtures/jma --port 8765
+    python scrape_jma_humidity.py --from 2025-10 --to 2025-11 --base-url http://127.0.0.1:8765 --no-cache
+
+pages ディレクトリの
+  daily_s1_<府県番号>_<地点番号>_<年>_<月>.html
+  hourly_s1_<府県番号>_<地点番号>_<年>_<月>_<日>.html
+を、daily_s1.php / hourly_s1.php の同じクエリへの応答として返します (ないページは 404)。
+HTTP/1.1 の keep-alive に対応し、受けたリクエスト数と接続数を数えます。
+
+再試行やレート制限を確かめるため、障害を注入できます。
+  - latency: 各応答の前に待つ秒数
+  - fail_rate / fail_status: この確率で fail_status (既定 503) を返す
+  - inject(filename, status, headers, times): そのページへの次の times 回のリクエストに status を返す
+    (headers に Retry-After などを渡せます)
+
+    with StubJMAServer('tests/fixtures/jma') as server:
+        fetch_months([TOKYO], [(2025, 10)], base_url=server.base_url)
+        server.requests, server.connections
+"""
+import argparse
+import os
+import random
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PAGE_KINDS = {'daily_s1.php': 'daily_s1', 'hourly_s1.php': 'hourly_s1'}
+
+
+def page_filename(path):
+    """リクエストのパス (クエリ付き) に対応する保存ページのファイル名。対応しないパスは None です。"""
+    parts = urllib.parse.urlsplit(path)
+    kind = PAGE_KINDS.get(parts.path.rsplit('/', 1)[-1])
+    if kind is None:
+        return None
+    query = dict(urllib.parse.parse_qsl(parts.query, keep_blank_values=True))
+    keys = ['prec_no', 'block_no', 'year', 'month'] + (['day'] if kind == 'hourly_s1' else [])
+    try:
+        return '_'.join([kind] + [str(int(query[k])) for k in keys]) + '.html'
+    except (KeyError, ValueError):
+        return None
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        super().setup()
+        self.server.stub._count_connection()
+
+    def do_GET(self):
+        stub = self.server.stub
+        stub._count_request(self.path)
+        filename = page_filename(self.path)
+        if stub.latency:
+            time.sleep(stub.latency)
+        failure = stub._next_failure(filename)
+        if failure is not None:
+            status, headers = failure
+            self._send(status, b'error', headers)
+            return
+        body = stub.read_page(filename) if filename else None
+        if body is None:
+            self._send(404, b'not found')
+        else:
+            self._send(200, body)
+
+    def _send(self, status, body, headers=()):
+        self.send_response(status)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        for name, value in headers:
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class StubJMAServer:
+    """
+    pages_dir の保存ページを返す HTTP サーバー。start() / stop() またはコンテキストマネージャで使います。
+    latency・fail_rate・inject() で遅延や 429/503 などの障害を注入できます。
+    """
+    handler_class = _Handler
+
+    def __init__(self, pages_dir, host='127.0.0.1', port=0, latency=0.0, fail_rate=0.0, fail_status=503, seed=None):
+        self.pages_dir = pages_dir
+        self.latency = latency
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.requests = 0      # 受けたリクエスト数
+        self.connections = 0   # 受け付けた TCP 接続数 (keep-alive なら requests より少ない)
+        self.paths = []        # 受けたリクエストのパス (順番どおり)
+        self.times = []        # リクエストを受けた時刻 (time.monotonic()、paths と同じ順)
+        self._failures = {}    # ファイル名 -> 返す障害 [(status, headers), ...]
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._httpd = ThreadingHTTPServer((host, port), self.handler_class)
+        self._httpd.daemon_threads = True
+        self._httpd.stub = self
+        self._thread = None
+
+    @property
+    def base_url(self):
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def read_page(self, filename):
+        path = os.path.join(self.pages_dir, filename)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def inject(self, filename, status, headers=None, times=1):
+        """filename のページへの次の times 回のリクエストに、本文の代わりに status を返します。"""
+        headers = list((headers or {}).items())
+        with self._lock:
+            self._failures.setdefault(filename, []).extend([(status, headers)] * times)
+
+    def _next_failure(self, filename):
+        with self._lock:
+            queued = self._failures.get(filename)
+            if queued:
+                return queued.pop(0)
+            if self.fail_rate and self._rng.random() < self.fail_rate:
+                return self.fail_status, []
+        return None
+
+    def _count_connection(self):
+        with self._lock:
+            self.connections += 1
+
+    def _count_request(self, path):
+        with self._lock:
+            self.requests += 1
+            self.paths.append(path)
+            self.times.append(time.monotonic())
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self.base_url
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="保存した気象庁のページを返すローカルのサーバー")
+    parser.add_argument('--pages', default=os.path.join('tests', 'fixtures', 'jma'), help="保存ページのディレクトリ")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--latency', type=float, default=0.0, help="各応答の前に待つ秒数")
+    parser.add_argument('--fail-rate', type=float, default=0.0, help="この確率で --fail-status を返す (0〜1)")
+    parser.add_argument('--fail-status', type=int, default=503)
+    args = parser.parse_args()
+
+    server = StubJMAServer(args.pages, args.host, args.port, args.latency, args.fail_rate, args.fail_status)
+    print(f"{server.base_url} で {args.pages} のページを返します (Ctrl+C で終了)")
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server._httpd.server_close()
@@ -1,19 +1,50 @@
+import argparse
+import functools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import numpy as np
-import matplotlib.pyplot as plt
+
+import weather_store
+from scrape_jma_humidity import TOKYO
+
+# ダミーデータの元にする気象データ (weather_store の地点と期間)。
+# 作業ディレクトリによらず、このスクリプトと同じ場所のファイルを読む
+WEATHER_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), weather_store.WEATHER_FILE)
+WEATHER_STATION = TOKYO
+WEATHER_START = '2025-10-01'
+WEATHER_END = '2025-10-31'
+
+# 睡眠時間生成のパラメータ (generate_dummy_data と generate_population で共通)
+TARGET_MEAN = 7.0
+CORRELATION_STRENGTH = -0.05 # 湿度が上がると睡眠時間が少し下がる（またはその逆）適当な係数
+NOISE_STD = 1.0 # ノイズの標準偏差
+
+def load_weather():
+    """
+    WEATHER_STATION の WEATHER_START〜WEATHER_END の日別値を weather_store (WEATHER_FILE) から読み込みます。
+    平均湿度のある行が 1 行もなければ ValueError を送出します。
+    """
+    df = weather_store.open_weather_store(WEATHER_FILE).read(WEATHER_STATION, WEATHER_START, WEATHER_END)
+    if not df['Avg_Humidity'].notna().any():
+        raise ValueError(f"{WEATHER_FILE} に {WEATHER_STATION.name} の {WEATHER_START}〜{WEATHER_END} の"
+                         f"平均湿度がありません (weather_store.py で取得してください)")
+    return df
 
 def generate_dummy_data():
     # 湿度データを読み込む
-    humidity_df = pd.read_csv('tokyo_humidity_2025_10.csv')
+    humidity_df = load_weather()
     
     # 湿度データが存在する日数分だけ生成
-    days = humidity_df['Day'].values
-    humidities = humidity_df['Avg_Humidity'].values
+    days = humidity_df['Date'].dt.day.values
+    humidities = humidity_df['Avg_Humidity'].to_numpy(dtype=float)
     
     # パラメータ設定
-    target_mean = 7.0
-    correlation_strength = -0.05 # 湿度が上がると睡眠時間が少し下がる（またはその逆）適当な係数
-    noise_std = 1.0 # ノイズの標準偏差
+    target_mean = TARGET_MEAN
+    correlation_strength = CORRELATION_STRENGTH
+    noise_std = NOISE_STD
     
     # 湿度の平均からの偏差
     humidity_mean = np.mean(humidities)
@@ -54,10 +85,145 @@ def generate_dummy_data():
     
     return df
 
+# ------------------------------------------------------------
+# 負荷試験用: 複数ユーザー × 複数年の data_tent.csv 形式データ
+# ------------------------------------------------------------
+
+DATA_TENT_COLUMNS = ['タイムスタンプ', '日付', '就寝時間', '起床時間', '昼寝の時間',
+                     '寝つきの良さ', '寝起きの良さ', '日中の眠気', '目が覚めた回数']
+
+# 分 -> 'H:MM:00' (data_tent.csv の時刻表記)
+CLOCK_STRINGS = np.array([f"{m // 60}:{m % 60:02d}:00" for m in range(1440)], dtype=object)
+
+@functools.lru_cache(maxsize=4)
+def synthetic_humidity(start, n_days, seed=0):
+    """
+    日別の平均湿度を合成します。季節変動 (7月頃が最大) に日々の揺らぎ (AR(1) 相当) を加え、
+    10月の水準とばらつきを weather_store の実測値 (load_weather) に合わせます。
+    戻り値は (日付の DatetimeIndex, 湿度の配列) です。
+    """
+    observed = load_weather()['Avg_Humidity'].astype(float)
+    dates = pd.date_range(start, periods=n_days, freq='D')
+
+    def seasonal(day_of_year):
+        return 12 * np.sin(2 * np.pi * (day_of_year - 105) / 365.25)
+
+    base = observed.mean() - seasonal(288)  # 10/15 頃の季節成分を差し引いた基準値
+
+    # 指数減衰カーネルとの畳み込みで AR(1) 相当の揺らぎを作る
+    phi = 0.6
+    rng = np.random.default_rng(seed)
+    eps = rng.normal(0, observed.std() * np.sqrt(1 - phi ** 2), n_days)
+    noise = np.convolve(eps, phi ** np.arange(30))[:n_days]
+
+    humidity = base + seasonal(dates.dayofyear.to_numpy()) + noise
+    return dates, np.clip(humidity, 10, 100)
+
+def generate_user_nights(rng, dates, humidity, profile):
+    """
+    1 ユーザー分の連続した期間 (dates) の睡眠データを data_tent.csv 形式で作ります。
+    profile はユーザー固有のパラメータ (平均睡眠時間・就寝時刻・湿度への感度など) です。
+    """
+    n = len(dates)
+    humidity_deviation = humidity - humidity.mean()
+    # 金曜・土曜の夜は遅く寝て長く眠る
+    weekend = np.isin(dates.dayofweek.to_numpy(), [4, 5])
+
+    hours = (profile['mean_hours']
+             + humidity_deviation * profile['humidity_sensitivity']
+             + weekend * profile['weekend_extra_hours']
+             + rng.normal(0, profile['noise_std'], n))
+    # 15分刻み (0.25時間) に丸める
+    hours = np.clip(np.round(hours * 4) / 4, 3, 12)
+
+    bed = (profile['bed_min'] + weekend * profile['weekend_shift_min']
+           + rng.normal(0, 30, n))
+    bed = (np.round(bed / 5).astype(int) * 5) % 1440
+    wake = (bed + (hours * 60).astype(int)) % 1440
+    nap = np.where(rng.random(n) < 0.8, 0, rng.choice([15, 30, 45, 60], n))
+
+    def score(center):
+        return np.clip(np.round(center + rng.normal(0, 1, n)), 1, 5).astype(int)
+
+    # 回答時刻: 翌日の起床から 0〜4 時間後
+    answered = (dates + pd.Timedelta(days=1)
+                + pd.to_timedelta(wake * 60 + rng.integers(0, 4 * 3600, n), unit='s'))
+
+    return pd.DataFrame({
+        'タイムスタンプ': answered.strftime('%Y/%m/%d %H:%M:%S'),
+        '日付': dates.strftime('%Y/%m/%d'),
+        '就寝時間': CLOCK_STRINGS[bed],
+        '起床時間': CLOCK_STRINGS[wake],
+        '昼寝の時間': CLOCK_STRINGS[nap],
+        '寝つきの良さ': score(3 - humidity_deviation * 0.03),
+        '寝起きの良さ': score(3 + (hours - TARGET_MEAN) * 0.6),
+        '日中の眠気': score(3 - (hours - TARGET_MEAN) * 0.6),
+        '目が覚めた回数': rng.poisson(0.4 + 0.02 * np.clip(humidity - 70, 0, None)).astype(float),
+    }, columns=DATA_TENT_COLUMNS)
+
+def write_user_dataset(user_idx, out_dir, start, n_days, seed=0, chunk_days=365):
+    """
+    1 ユーザー分のデータを chunk_days 日ずつ生成して CSV に追記します
+    (全期間を 1 つの DataFrame にしない)。ワーカープロセスで実行され、書いた行数を返します。
+    同じ seed・引数なら同じ内容になります。
+    """
+    dates, humidity = synthetic_humidity(start, n_days, seed)
+    rng = np.random.default_rng([seed, user_idx])
+    profile = {
+        'mean_hours': rng.normal(TARGET_MEAN, 0.5),
+        'humidity_sensitivity': rng.normal(CORRELATION_STRENGTH, 0.02),
+        'noise_std': NOISE_STD * rng.uniform(0.5, 1.0),
+        'weekend_extra_hours': rng.uniform(0, 1.0),
+        'bed_min': rng.normal(23.75 * 60, 40),
+        'weekend_shift_min': rng.uniform(0, 90),
+    }
+
+    path = os.path.join(out_dir, f"user_{user_idx:06d}.csv")
+    for i in range(0, n_days, chunk_days):
+        chunk = generate_user_nights(rng, dates[i:i + chunk_days], humidity[i:i + chunk_days], profile)
+        chunk.to_csv(path, mode='w' if i == 0 else 'a', header=(i == 0), index=False)
+    return n_days
+
+def generate_population(n_users, years, out_dir, start='2020-01-01', seed=0, workers=None, chunk_days=365):
+    """
+    n_users 人 × years 年分のデータを out_dir/user_NNNNNN.csv に書き出します。
+    ユーザー単位でプロセスプールに分散し、書いた総行数を返します。
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    start_ts = pd.Timestamp(start)
+    n_days = (start_ts + pd.DateOffset(years=years) - start_ts).days
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rows = pool.map(write_user_dataset, range(n_users),
+                        [out_dir] * n_users, [start] * n_users, [n_days] * n_users,
+                        [seed] * n_users, [chunk_days] * n_users,
+                        chunksize=max(1, n_users // (4 * (workers or os.cpu_count() or 1))))
+        return sum(rows)
+
 if __name__ == "__main__":
-    df = generate_dummy_data()
+    parser = argparse.ArgumentParser(description="ダミーの睡眠データを生成します。")
+    subparsers = parser.add_subparsers(dest='command')
+    population = subparsers.add_parser('population', help="複数ユーザー × 複数年の data_tent.csv 形式データを生成")
+    population.add_argument('--users', type=int, default=100)
+    population.add_argument('--years', type=int, default=1)
+    population.add_argument('--out', default='population')
+    population.add_argument('--start', default='2020-01-01')
+    population.add_argument('--seed', type=int, default=0)
+    population.add_argument('--workers', type=int, default=None)
+    population.add_argument('--chunk-days', type=int, default=365)
+    args = parser.parse_args()
+
+    if args.command == 'population':
+        t0 = time.perf_counter()
+        total = generate_population(args.users, args.years, args.out, args.start,
+                                    args.seed, args.workers, args.chunk_days)
+        elapsed = time.perf_counter() - t0
+        print(f"{args.users} ユーザー / {total:,} 行を {args.out} に書き出しました "
+              f"({elapsed:.1f} 秒, {total / elapsed:,.0f} 行/秒)")
+    else:
+        df = generate_dummy_data()
     
-    # CSVとして保存
-    output_file = 'dummy_sleep_data.csv'
-    df.to_csv(output_file, index=False)
-    print(f"\n{output_file} に保存しました。")
+        # CSVとして保存
+        output_file = 'dummy_sleep_data.csv'
+        df.to_csv(output_file, index=False)
+        print(f"\n{output_file} に保存しました。")
@@ -0,0 +1,163 @@
+"""
+ダッシュボードの各パネルの図を並行して作ります。
+
+    tasks = [PanelTask('weekly_bar', ('weekly_bar', version, settings), charts.create_weekly_bar_chart, (timeline,)),
+             ...]
+    figures, timing = build_panels(tasks, max_workers=4)
+    figures['weekly_bar']          # 図 (配置はメインスクリプトで行う)
+    format_timing(timing)          # パネルごとの所要時間と、直列に作った場合との比較
+
+figure_cache にある図 (cache_key が一致するもの) はメインスレッドで復元し、無い図だけをワーカーで作ります。
+図の JSON への変換 (キャッシュに保存する形) もワーカーで行い、メインスレッドはキャッシュに書くだけです。
+  - executor='thread' (既定): ワーカースレッドで作ります。図の組み立て (Plotly の検証) は GIL を持ったまま
+    なので複数コアは使えませんが、タイムラインの日・週・月の集計やヒストグラムの索引をパネル間で共有できます。
+  - executor='process': ワーカープロセスで作って JSON で受け取り、figure_cache に保存します。複数コアを
+    使えますが、集計・索引はプロセスごとに作り直し、図は JSON で受け渡します。build と args (タイムラインなど)
+    は pickle できる必要があります。ワーカープロセスはモジュール内で使い回します (初回だけ起動に時間がかかります)。
+max_workers=1 のときはメインスレッドで順に作ります。Streamlit の API はワーカーから呼びません。
+どちらが速いかはデータの大きさとコア数によるので、bench_dashboard.py の panels_* で比べてください。
+"""
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import plotly.io as pio
+
+import figure_cache
+
+EXECUTORS = ('process', 'thread')
+DEFAULT_WORKERS = min(6, os.cpu_count() or 1)
+DEFAULT_EXECUTOR = 'thread'
+
+# cache_key: figure_cache のキー (chart_id, version, settings)。None ならキャッシュしない
+# build(*args) が図 (または None) を返す
+PanelTask = namedtuple('PanelTask', 'panel_id cache_key build args')
+
+# wall: 全パネルを作り終えるまでの経過時間、panels: パネル ID -> そのパネルにかかった時間
+# workers / executor: 実際に使ったワーカー数と方式 ('serial' はメインスレッドで順に作った)
+# cached: キャッシュから復元したパネル数
+PanelTiming = namedtuple('PanelTiming', 'wall panels workers executor cached')
+
+_pool = None
+_pool_key = None  # (ワーカー数, 既定のテンプレート名)
+_pool_lock = threading.Lock()
+
+
+def _init_worker(template_name, template):
+    # 呼び出し側と同じ既定のテンプレートで図を作る (Streamlit は import 時に独自のテンプレートを既定にする)
+    if template_name not in pio.templates:
+        pio.templates[template_name] = template
+    pio.templates.default = template_name
+
+
+def _process_pool(workers):
+    """ワーカー数 workers のプロセスプールを返します (数か既定のテンプレートが変わったときだけ作り直す)。"""
+    global _pool, _pool_key
+    template_name = pio.templates.default
+    with _pool_lock:
+        if _pool is None or _pool_key != (workers, template_name):
+            if _pool is not None:
+                _pool.shutdown(wait=False, cancel_futures=True)
+            # Streamlit のサーバーはスレッドを持つので fork ではなく spawn で起動する
+            _pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=_init_worker,
+                                        initargs=(template_name, pio.templates[template_name]))
+            _pool_key = (workers, template_name)
+        return _pool
+
+
+def shutdown_pool():
+    """使い回しているワーカープロセスを終了します。"""
+    global _pool, _pool_key
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=True, cancel_futures=True)
+        _pool, _pool_key = None, None
+
+
+def _build(build, args):
+    """ワーカースレッドで図を作り、(図, JSON, 所要時間) を返します。"""
+    start = time.perf_counter()
+    fig = build(*args)
+    return fig, (None if fig is None else fig.to_json()), time.perf_counter() - start
+
+
+def _build_json(build, args):
+    """ワーカープロセスで図を作り、JSON にして返します (figure_cache と同じ形で受け渡す)。"""
+    start = time.perf_counter()
+    fig = build(*args)
+    return (None if fig is None else fig.to_json()), time.perf_counter() - start
+
+
+def build_panels(tasks, max_workers=DEFAULT_WORKERS, executor=DEFAULT_EXECUTOR):
+    """
+    PanelTask のリストを実行し、(パネル ID -> 図, PanelTiming) を返します。
+    キャッシュにない図だけを max_workers 個のワーカー (executor は 'process' か 'thread') で作ります。
+    build() の例外はそのまま送出します。
+    """
+    if executor not in EXECUTORS:
+        raise ValueError(f"executor は {EXECUTORS} のいずれかです: {executor}")
+    start = time.perf_counter()
+    results = {}
+    cold = []
+    for task in tasks:
+        lookup_start = time.perf_counter()
+        fig = figure_cache.lookup(*task.cache_key) if task.cache_key is not None else None
+        if fig is not None:
+            results[task.panel_id] = fig, time.perf_counter() - lookup_start
+        else:
+            cold.append(task)
+    cached = len(results)
+
+    workers = min(max(1, max_workers), len(cold))
+    if workers <= 1:
+        executor = 'serial'
+        for task in cold:
+            results[task.panel_id] = _store(task, *_build(task.build, task.args))
+    elif executor == 'thread':
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [(task, pool.submit(_build, task.build, task.args)) for task in cold]
+            for task, future in futures:
+                results[task.panel_id] = _store(task, *future.result())
+    else:
+        try:
+            pool = _process_pool(workers)
+            futures = [(task, pool.submit(_build_json, task.build, task.args)) for task in cold]
+            for task, future in futures:
+                serialized, sec = future.result()
+                fig = None if serialized is None else pio.from_json(serialized, skip_invalid=True)
+                results[task.panel_id] = _store(task, fig, serialized, sec)
+        except BrokenProcessPool:
+            # ワーカープロセスが落ちた (メモリ不足など)。プールは次回作り直し、残りはここで順に作る
+            shutdown_pool()
+            executor = 'serial'
+            for task in cold:
+                if task.panel_id not in results:
+                    results[task.panel_id] = _store(task, *_build(task.build, task.args))
+    wall = time.perf_counter() - start
+
+    # tasks の順に並べる
+    figures = {task.panel_id: results[task.panel_id][0] for task in tasks}
+    timing = PanelTiming(wall, {task.panel_id: results[task.panel_id][1] for task in tasks}, workers, executor, cached)
+    return figures, timing
+
+
+def _store(task, fig, serialized, sec):
+    """ワーカーが JSON にした図をキャッシュに書き、(図, 所要時間) を返します。"""
+    if serialized is not None and task.cache_key is not None:
+        figure_cache.store(*task.cache_key, serialized)
+    return fig, sec
+
+
+def format_timing(timing):
+    """パネルごとの所要時間と、合計 (直列に作った場合の目安) に対する経過時間の比を文字列にします。"""
+    serial = sum(timing.panels.values())
+    lines = [f"{panel_id}: {sec * 1000:.1f} ms" for panel_id, sec in timing.panels.items()]
+    speedup = serial / timing.wall if timing.wall > 0 else float('nan')
+    lines.append(f"合計 {serial * 1000:.1f} ms / 経過 {timing.wall * 1000:.1f} ms "
+                 f"({timing.workers} ワーカー ({timing.executor}), キャッシュ {timing.cached} 件, {speedup:.1f} 倍)")
+    return lines
@@ -5,10 +5,28 @@ import numpy as np
 import plotly.express as px
 import plotly.graph_objects as go
 
+import weather_store
+from scrape_jma_humidity import TOKYO
+from sleep_correlation import lag_correlations, lagged_weather, rolling_correlations
+from sleep_histogram import BinnedHistogram
+from sleep_weather import shared_view
+from trend_tiers import MAX_POINTS, lttb
+
 st.set_page_config(layout="wide")
 
 st.title("生活可視化のためのダッシュボード")
 
+def load_trend():
+    # sleep_data_31days_full.csv は 2025年10月 (day = 日) のデータ
+    df = pd.read_csv('sleep_data_31days_full.csv').rename(columns={'day': 'Day'})
+    df['Date'] = pd.Timestamp('2025-10-01') + pd.to_timedelta(df['Day'] - 1, unit='D')
+    return df
+
+
+def load_weather():
+    return weather_store.open_weather_store().read(TOKYO)
+
+
 # ==========[Layout]==========
 tab_selection = st.sidebar.radio("タブ切り替え", ["総合", "習慣"])
 
@@ -24,14 +42,18 @@ elif tab_selection == "総合":
     with left:
         st.subheader("睡眠時間分布")
         df_sleep = pd.read_csv('sleep_data_31days_full.csv')
-        
-        mean_val = df_sleep['sleep_duration_hour'].mean()
-        std_val = df_sleep['sleep_duration_hour'].std()
-        
+        # 0.5 時間幅のビンで集計し、ブラウザにはビンと度数だけを送る
+        sleep_hist = BinnedHistogram().add(df_sleep['sleep_duration_hour'])
+
+        mean_val = sleep_hist.mean
+        std_val = sleep_hist.std
+
         c1, c2 = st.columns([3, 1])
         with c1:
-            hist_fig = px.histogram(df_sleep, x="sleep_duration_hour", nbins=10)
-            hist_fig.update_layout(margin=dict(l=0, r=0, t=30, b=0))
+            hist_fig = go.Figure(go.Bar(x=(sleep_hist.edges[:-1] + sleep_hist.edges[1:]) / 2, y=sleep_hist.counts,
+                                        width=sleep_hist.bin_size))
+            hist_fig.update_layout(bargap=0, xaxis_title='sleep_duration_hour', yaxis_title='count',
+                                   margin=dict(l=0, r=0, t=30, b=0))
             st.plotly_chart(hist_fig, use_container_width=True)
         with c2:
             st.metric("Mean", f"{mean_val:.2f}")
@@ -50,19 +72,20 @@ elif tab_selection == "総合":
     # ---------------------------
     with center:
         st.subheader("睡眠時間傾向")
-        df_trend = pd.read_csv('sleep_data_31days_full.csv')
-        df_trend = df_trend.rename(columns={'day': 'Day'})
-        df_weather = pd.read_csv('tokyo_humidity_2025_10.csv')
-        df_merged = pd.merge(df_trend, df_weather, on='Day', how='left')
+        df_merged = shared_view('sample', 'sleep_data_31days_full.csv', load_trend,
+                                weather_store.WEATHER_FILE, load_weather).frame
 
         metric = st.selectbox("比較するデータ", ["なし", "平均湿度", "平均気温"])
+        # 長期間のデータは形を保ったまま MAX_POINTS 点に間引いて送る
+        df_trend = df_merged.iloc[lttb(df_merged['Date'].to_numpy().astype('datetime64[D]').astype(np.int64),
+                                       df_merged['sleep_duration_hour'], MAX_POINTS)]
 
         fig = go.Figure()
 
         # Primary Axis: Sleep Time (Line)
         fig.add_trace(go.Scatter(
-            x=df_merged['Day'],
-            y=df_merged['sleep_duration_hour'],
+            x=df_trend['Day'],
+            y=df_trend['sleep_duration_hour'],
             name='睡眠時間',
             mode='lines+markers',
             line=dict(color='#5276A7')
@@ -83,8 +106,8 @@ elif tab_selection == "総合":
                 y_range = [0, 35]
 
             fig.add_trace(go.Scatter(
-                x=df_merged['Day'],
-                y=df_merged[y_col],
+                x=df_trend['Day'],
+                y=df_trend[y_col],
                 name=metric,
                 yaxis='y2',
                 mode='lines+markers',
@@ -127,6 +150,50 @@ elif tab_selection == "総合":
                               labels={'sleep_duration_hour': '睡眠時間 (時間)', y_col_corr: y_label_corr})
         st.plotly_chart(fig_corr, use_container_width=True)
 
+        # Lag correlation: sleep metric vs every weather variable, 0-7 days before
+        st.subheader("気象データとの相関 (ラグ別)")
+        sleep_metrics_corr = {'睡眠時間': 'sleep_duration_hour', '就寝時刻': 'bedtime_hour',
+                              '起床時刻': 'wake_time_hour', '入眠の質': 'sleep_onset_quality',
+                              '目覚めの質': 'wake_quality'}
+        lag_metric = st.selectbox("睡眠の指標", list(sleep_metrics_corr), key="lag_metric")
+        df_weather_all = load_weather()
+        weather_vars = [c for c in weather_store.NUMERIC_COLUMNS if df_weather_all[c].notna().any()]
+        lag_result = lag_correlations(df_merged, df_weather_all, list(sleep_metrics_corr.values()), weather_vars)
+        i_metric = lag_result.sleep_cols.index(sleep_metrics_corr[lag_metric])
+
+        fig_lag = go.Figure(go.Heatmap(
+            z=lag_result.r[:, i_metric, :].T,
+            x=[f"{lag}日前" for lag in lag_result.lags],
+            y=weather_vars,
+            zmin=-1, zmax=1, colorscale='RdBu_r',
+            customdata=np.stack([lag_result.ci_low[:, i_metric, :].T, lag_result.ci_high[:, i_metric, :].T,
+                                 lag_result.n[:, i_metric, :].T], axis=-1),
+            hovertemplate="%{y} (%{x})<br>r = %{z:.2f}<br>95%CI [%{customdata[0]:.2f}, %{customdata[1]:.2f}]"
+                          "<br>n = %{customdata[2]}<extra></extra>"
+        ))
+        fig_lag.update_layout(margin=dict(l=0, r=0, t=10, b=0), height=60 + 40 * len(weather_vars))
+        st.plotly_chart(fig_lag, use_container_width=True)
+
+        # Rolling correlation: the same pair over the most recent nights only
+        roll_var_col, roll_lag_col, roll_window_col = st.columns(3)
+        roll_var = roll_var_col.selectbox("気象データ", weather_vars, key="roll_var")
+        roll_lag = roll_lag_col.selectbox("ラグ", lag_result.lags, format_func=lambda lag: f"{lag}日前",
+                                          key="roll_lag")
+        roll_window = roll_window_col.slider("窓 (晩)", 7, 28, 14, key="roll_window")
+        df_roll = df_merged.sort_values('Date')
+        r_roll = rolling_correlations(
+            df_roll[sleep_metrics_corr[lag_metric]].to_numpy(dtype=float, na_value=np.nan),
+            lagged_weather(df_roll['Date'], df_weather_all, [roll_var], [roll_lag])[0],
+            roll_window)[:, 0, 0]
+
+        fig_roll = go.Figure(go.Scatter(
+            x=df_roll['Date'], y=r_roll, mode='lines+markers', line=dict(color='#3E7CB1'),
+            hovertemplate="%{x|%m/%d}<br>r = %{y:.2f}<extra></extra>"
+        ))
+        fig_roll.update_layout(yaxis=dict(title=f'直近 {roll_window} 晩の r', range=[-1, 1]),
+                               margin=dict(l=0, r=0, t=10, b=0), height=240)
+        st.plotly_chart(fig_roll, use_container_width=True)
+
 
         # Heatmap
         st.subheader("集中力ヒートマップ")
@@ -1,5 +1,8 @@
+import numpy as np
 import pandas as pd
 
+import sleep_metrics
+
 def hhmm_to_min(hhmm: str) -> int:
     h, m = map(int, hhmm.split(":"))
     return h * 60 + m
@@ -13,29 +16,24 @@ def add_sleep_fit_score(df: pd.DataFrame, target_start="23:30", target_end="08:0
     if te <= ts:
         te += 1440  # 想定区間が跨ぐ
 
-    scores = []
-    overlaps = []
-    actuals = []
-
-    for _, r in df.iterrows():
-        bs = hhmm_to_min(r["bedtime_hhmm"])
-        we = hhmm_to_min(r["wake_time_hhmm"])
-
-        # 実睡眠区間が跨ぐ場合（cross_day_wake=1）または we<=bs を保険で処理
-        if int(r.get("cross_day_wake", 0)) == 1 or we <= bs:
-            we += 1440
+    bs = sleep_metrics.clock_minutes(sleep_metrics.parse_clock_seconds(df["bedtime_hhmm"]))
+    we = sleep_metrics.clock_minutes(sleep_metrics.parse_clock_seconds(df["wake_time_hhmm"]))
 
-        actual = we - bs
-        overlap = interval_overlap(bs, we, ts, te)
+    # 実睡眠区間が跨ぐ場合（cross_day_wake=1）または we<=bs を保険で処理
+    if "cross_day_wake" in df.columns:
+        cross_day = df["cross_day_wake"].astype(int).to_numpy() == 1
+    else:
+        cross_day = np.zeros(len(df), dtype=bool)
+    we = np.where(cross_day | (we <= bs), we + 1440, we)
 
-        score = 0 if actual == 0 else 100 * overlap / actual
+    actuals = we - bs
+    overlaps = sleep_metrics.interval_overlap(bs, we, ts, te)
 
-        actuals.append(actual)
-        overlaps.append(overlap)
-        scores.append(score)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scores = np.where(actuals == 0, 0, 100 * overlaps / actuals)
 
     df = df.copy()
     df["actual_sleep_min"] = actuals
     df["target_overlap_min"] = overlaps
-    df["sleep_fit_score"] = [round(s, 1) for s in scores]
+    df["sleep_fit_score"] = np.round(scores, 1)
     return df
@@ -1,161 +1,361 @@
-import urllib.request
+import argparse
+import http.client
 import urllib.error
-from html.parser import HTMLParser
+import urllib.parse
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 import csv
 import ssl
+import threading
 
-class JMAHTMLParser(HTMLParser):
+import numpy as np
+
+from jma_cache import DEFAULT_CACHE_DIR, DEFAULT_MAX_BYTES, DEFAULT_TTL_SEC, PageCache
+from jma_parser import parse_daily_table, parse_hourly_table
+
+JMA_BASE_URL = "https://www.data.jma.go.jp"
+DAILY_PATH = "/obd/stats/etrn/view/daily_s1.php"
+HOURLY_PATH = "/obd/stats/etrn/view/hourly_s1.php"
+
+# 取得単位 (地点, 年, 月 / 日) ごとに記録して処理を続ける例外:
+# 通信・HTTP のエラーに加え、応答を復号できない (UnicodeDecodeError) ・解析できない (ValueError) 場合
+FETCH_ERRORS = (OSError, http.client.HTTPException, ValueError, LookupError)
+
+
+class Station(namedtuple('Station', ['prec_no', 'block_no', 'name'])):
+    """気象庁の観測地点 (府県番号 prec_no と地点番号 block_no)。"""
+    __slots__ = ()
+
+    def __new__(cls, prec_no, block_no, name=""):
+        return super().__new__(cls, int(prec_no), int(block_no), name)
+
+    @classmethod
+    def parse(cls, text):
+        """'44:47662' または '44:47662:東京' 形式の文字列から作ります。"""
+        return cls(*text.split(':', 2))
+
+
+TOKYO = Station(44, 47662, "東京")
+
+
+def daily_page_path(station, year, month):
+    """日別値ページ (daily_s1.php) のパスを返します。"""
+    # view= は表示オプションですが、空でもデフォルト表示になります
+    return (f"{DAILY_PATH}?prec_no={station.prec_no}&block_no={station.block_no}"
+            f"&year={year}&month={month}&day=&view=")
+
+
+def hourly_page_path(station, year, month, day):
+    """時別値ページ (hourly_s1.php) のパスを返します。"""
+    return (f"{HOURLY_PATH}?prec_no={station.prec_no}&block_no={station.block_no}"
+            f"&year={year}&month={month}&day={day}&view=")
+
+
+def parse_daily_page(html_content, year, month):
+    """
+    日別値ページの HTML から (日付, 平均湿度, 平均気温, 日照時間) のタプルのリストを取り出します。
+    3 つのうちどれかが欠測の日は含めません。全列が必要な場合は jma_parser.parse_daily_table を使ってください。
+    """
+    table = parse_daily_table(html_content, year, month)
+    humidity = table.values['Avg_Humidity']
+    temperature = table.values['Avg_Temperature']
+    sunshine = table.values['Sunshine_Duration']
+    # sunshine could be 0.0, so checking NaN (not falsiness) is important
+    valid = ~(np.isnan(humidity) | np.isnan(temperature) | np.isnan(sunshine))
+
+    return [(f"{year}/{month}/{day}", hum, temp, sun) for day, hum, temp, sun in zip(
+        table.days[valid].tolist(), humidity[valid].tolist(),
+        temperature[valid].tolist(), sunshine[valid].tolist())]
+
+
+class JMAClient:
+    """
+    気象庁サーバーへの keep-alive 接続を保持する HTTP クライアントです。
+    1 つの接続を使い回すので、スレッドごとに 1 つ作ってください。
+
+    base_url を差し替えると、保存したページを返すローカルのサーバーに向けられます。
+    """
+    def __init__(self, base_url=JMA_BASE_URL, timeout=30):
+        parts = urllib.parse.urlsplit(base_url)
+        self.base_url = base_url.rstrip('/')
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self._conn = None
+
+    def _connect(self):
+        if self.scheme == 'https':
+            # SSL証明書エラーを回避するためのコンテキストを作成（一部の環境で必要）
+            return http.client.HTTPSConnection(self.host, self.port, timeout=self.timeout,
+                                               context=ssl._create_unverified_context())
+        return http.client.HTTPConnection(self.host, self.port, timeout=self.timeout)
+
+    def get(self, path):
+        """
+        path を GET して本文 (str) を返します。200 以外は urllib.error.HTTPError を送出します。
+        本文は Content-Type の charset (なければ UTF-8) で復号し、できなければ UnicodeDecodeError を送出します。
+        """
+        # サーバー側で keep-alive 接続が切られていた場合に備えて 1 回だけ再接続する
+        for attempt in range(2):
+            if self._conn is None:
+                self._conn = self._connect()
+            try:
+                self._conn.request('GET', path, headers={'Connection': 'keep-alive'})
+                response = self._conn.getresponse()
+                body = response.read()
+            except (http.client.RemoteDisconnected, http.client.CannotSendRequest,
+                    ConnectionResetError, BrokenPipeError):
+                self.close()
+                if attempt:
+                    raise
+                continue
+            except BaseException:
+                # タイムアウトなどで応答を読みかけた接続は使い回さない (次のリクエストが別の月の失敗になる)
+                self.close()
+                raise
+
+            if response.will_close:
+                self.close()
+            if response.status != 200:
+                raise urllib.error.HTTPError(self.base_url + path, response.status, response.reason,
+                                             response.headers, None)
+            return body.decode(response.headers.get_content_charset() or 'utf-8')
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+class MonthResult(namedtuple('MonthResult', ['station', 'year', 'month', 'rows', 'error'])):
+    """1 地点 1 か月分の取得結果。失敗した場合は rows が None で error にメッセージが入ります。"""
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def iter_months(start, end):
+    """(年, 月) の start から end まで (両端を含む) を順に返します。"""
+    year, month = start
+    while (year, month) <= tuple(end):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def fetch_daily_page(client, station, year, month, cache=None, before_request=None):
+    """
+    日別値ページの HTML を返します。cache にあればそれを使い、なければ client で取得して保存します。
+    before_request はネットワークに取りに行く直前にだけ呼ばれます (レート制限用)。
+    """
+    html_content = cache.get(station, year, month) if cache else None
+    if html_content is None:
+        if before_request is not None:
+            before_request()
+        html_content = client.get(daily_page_path(station, year, month))
+        if cache:
+            cache.put(station, year, month, html_content)
+    return html_content
+
+
+def fetch_months(stations, months, max_workers=8, base_url=JMA_BASE_URL, timeout=30, cache=None, offline=False,
+                 parse=parse_daily_page):
     """
-    気象庁のHTMLテーブルを解析するためのパーサクラスです。
-    HTMLParserを継承して、テーブルの行とセルのデータを抽出します。
+    複数地点 × 複数月の日別値ページを、上限付きのスレッドプールで並行して取得・解析します。
+
+    各スレッドは自分の JMAClient (keep-alive 接続) を使い回します。
+    (地点, 年, 月) ごとに FETCH_ERRORS (通信・復号・解析のエラー) を捕捉して MonthResult.error に記録するので、
+    一部の失敗で全体が止まることはありません。
+    cache (jma_cache.PageCache) を渡すと、キャッシュにある確定月のページは取得しません。
+    offline=True ならネットワークを使わず、キャッシュ済みのページだけを解析し直します。
+    parse(html, year, month) の戻り値が MonthResult.rows になります
+    (既定は parse_daily_page。全列が必要なら jma_parser.parse_daily_table)。
+    戻り値は stations × months の順の MonthResult のリストです。
+    """
+    units = [(station, year, month) for station in stations for year, month in months]
+
+    def work(client, unit):
+        station, year, month = unit
+        try:
+            if offline:
+                html_content = cache.get(station, year, month, allow_stale=True) if cache else None
+                if html_content is None:
+                    return MonthResult(station, year, month, None, "キャッシュにありません")
+            else:
+                html_content = fetch_daily_page(client(), station, year, month, cache)
+            return MonthResult(station, year, month, parse(html_content, year, month), None)
+        except FETCH_ERRORS as e:
+            return MonthResult(station, year, month, None, f"{type(e).__name__}: {e}")
+
+    return _run_with_clients(work, units, max_workers, base_url, timeout)
+
+
+def _run_with_clients(work, units, max_workers, base_url, timeout):
+    """
+    work(client, unit) を units の各要素についてスレッドプールで実行し、結果を units の順で返します。
+    client() はそのスレッド専用の JMAClient (keep-alive 接続) を返し、最後にまとめて閉じます。
+    """
+    local = threading.local()
+    clients = []
+    clients_lock = threading.Lock()
+
+    def client():
+        if not hasattr(local, 'client'):
+            local.client = JMAClient(base_url, timeout)
+            with clients_lock:
+                clients.append(local.client)
+        return local.client
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as pool:
+            return list(pool.map(lambda unit: work(client, unit), units))
+    finally:
+        for c in clients:
+            c.close()
+
+
+class DayResult(namedtuple('DayResult', ['station', 'date', 'table', 'error'])):
+    """1 地点 1 日分の時別値の取得結果。失敗した場合は table が None で error にメッセージが入ります。"""
+    __slots__ = ()
+
+    @property
+    def ok(self):
+        return self.error is None
+
+
+def fetch_hourly_page(client, station, date, cache=None, before_request=None):
+    """時別値ページの HTML を返します (fetch_daily_page の時別値版)。"""
+    year, month, day = date.year, date.month, date.day
+    html_content = cache.get(station, year, month, kind="hourly", day=day) if cache else None
+    if html_content is None:
+        if before_request is not None:
+            before_request()
+        html_content = client.get(hourly_page_path(station, year, month, day))
+        if cache:
+            cache.put(station, year, month, html_content, kind="hourly", day=day)
+    return html_content
+
+
+def fetch_hourly(stations, dates, max_workers=8, base_url=JMA_BASE_URL, timeout=30, cache=None):
     """
-    def __init__(self):
-        super().__init__()
-        self.in_row = False          # 行(tr)の中にいるかどうかのフラグ
-        self.current_row_data = []   # 現在処理中の行のデータリスト
-        self.current_cell_text = ""  # 現在処理中のセルのテキスト
-        self.rows = []               # 全行のデータを格納するリスト
-        self.in_cell = False         # セル(td/th)の中にいるかどうかのフラグ
-
-    def handle_starttag(self, tag, attrs):
-        # <tr>タグの開始：新しい行の始まり
-        if tag == 'tr':
-            self.in_row = True
-            self.current_row_data = []
-        # <td>または<th>タグの開始：新しいセルの始まり
-        elif tag in ('td', 'th'):
-            if self.in_row:
-                self.in_cell = True
-                self.current_cell_text = ""
-
-    def handle_endtag(self, tag):
-        # <tr>タグの終了：行の終わり。データをrowsに追加
-        if tag == 'tr':
-            if self.in_row:
-                self.in_row = False
-                if self.current_row_data:
-                    self.rows.append(self.current_row_data)
-        # <td>または<th>タグの終了：セルの終わり。テキストを行データに追加
-        elif tag in ('td', 'th'):
-            if self.in_cell:
-                self.in_cell = False
-                self.current_row_data.append(self.current_cell_text.strip())
-
-    def handle_data(self, data):
-        # セル内のテキストデータを取得
-        if self.in_cell:
-            self.current_cell_text += data
-
-def scrape_tokyo_humidity(year, month):
+    複数地点 × 複数日の時別値ページを並行して取得・解析します (1 日 1 ページ)。
+    dates は datetime.date / pd.Timestamp の iterable です。
+    戻り値は stations × dates の順の DayResult (table は jma_parser.HourlyTable) のリストです。
+    """
+    units = [(station, date) for station in stations for date in dates]
+
+    def work(client, unit):
+        station, date = unit
+        try:
+            html_content = fetch_hourly_page(client(), station, date, cache)
+            return DayResult(station, date, parse_hourly_table(html_content, date.year, date.month, date.day), None)
+        except FETCH_ERRORS as e:
+            return DayResult(station, date, None, f"{type(e).__name__}: {e}")
+
+    return _run_with_clients(work, units, max_workers, base_url, timeout)
+
+
+def scrape_tokyo_humidity(year, month, cache=None):
     """
     指定された年と月の東京都の日別平均相対湿度をスクレイピングします。
     
     Args:
         year (int): 対象の年
         month (int): 対象の月
+        cache (PageCache): 生ページのキャッシュ。None ならキャッシュしない
         
     Returns:
-        list: (日, 湿度) のタプルのリスト。失敗した場合はNone。
+        list: (日付, 湿度, 気温, 日照時間) のタプルのリスト。失敗した場合はNone。
     """
     # 東京 (prec_no=44, block_no=47662) の日別データのURL
-    # view= は表示オプションですが、空でもデフォルト表示になります
-    url = f"https://www.data.jma.go.jp/obd/stats/etrn/view/daily_s1.php?prec_no=44&block_no=47662&year={year}&month={month}&day=&view="
-    print(f"データを取得中: {url}")
-
-    # SSL証明書エラーを回避するためのコンテキストを作成（一部の環境で必要）
-    ssl_context = ssl._create_unverified_context()
+    path = daily_page_path(TOKYO, year, month)
+    html_content = cache.get(TOKYO, year, month) if cache else None
+    if html_content is not None:
+        print(f"キャッシュを使用: {year}年{month}月")
+        return parse_daily_page(html_content, year, month)
+    print(f"データを取得中: {JMA_BASE_URL}{path}")
 
+    client = JMAClient()
     try:
         # URLを開いてHTMLコンテンツを取得
-        with urllib.request.urlopen(url, context=ssl_context) as response:
-            html_content = response.read().decode('utf-8')
-        
-        # HTMLパーサを初期化してデータを解析
-        parser = JMAHTMLParser()
-        parser.feed(html_content)
-        
-        data = []
-        # 解析された行データをループ処理して、必要なデータを抽出
-        # データの構造（列のインデックス）は気象庁のページ構造に基づいています
-        # 列0: 日付
-        # ...
-        # 列9: 平均湿度 (0始まりのインデックスで9番目、つまり10列目)
-        
-        for row in parser.rows:
-            # 行の列数が十分か、かつ最初の列が数値（日付）かを確認
-            if len(row) > 10:
-                try:
-                    # 日付の抽出（余計な文字が含まれる場合があるので数字のみ抽出）
-                    day_str = ''.join(filter(str.isdigit, row[0]))
-                    if not day_str:
-                        continue
-                    day = int(day_str)
-                    
-                    # 湿度はインデックス9にあります
-                    humidity_str = row[9]
-                    # 気温はインデックス6にあります
-                    temp_str = row[6]
-                    # 日照時間はインデックス16にあります
-                    sunshine_str = row[16]
-                    
-                    # 湿度の文字列が空でないか確認
-                    if not humidity_str:
-                        continue
-                        
-                    # 数値部分を抽出（品質情報フラグ ')' や ']' などを除去するため）
-                    def extract_float(val_str):
-                        clean_str = ""
-                        for char in val_str:
-                            if char.isdigit() or char == '.' or char == '-': # マイナス記号も考慮
-                                clean_str += char
-                            elif char == ' ':
-                                continue
-                            else:
-                                pass
-                        try:
-                            return float(clean_str)
-                        except ValueError:
-                            return None
-
-                    humidity = extract_float(humidity_str)
-                    temperature = extract_float(temp_str)
-                    sunshine = extract_float(sunshine_str)
-                    
-                    # sunshine could be 0.0, so checking "is not None" is important
-                    if humidity is not None and temperature is not None and sunshine is not None:
-                        # 日付フォーマットを作成 (YYYY/MM/DD)
-                        date_str = f"{year}/{month}/{day}"
-                        data.append((date_str, humidity, temperature, sunshine))
-                        
-                except ValueError:
-                    continue
-        
-        return data
+        html_content = client.get(path)
+        if cache:
+            cache.put(TOKYO, year, month, html_content)
+        return parse_daily_page(html_content, year, month)
 
-    except urllib.error.URLError as e:
-        print(f"URLエラーが発生しました: {e}")
+    except FETCH_ERRORS as e:
+        print(f"取得・解析でエラーが発生しました: {type(e).__name__}: {e}")
         return None
+    finally:
+        client.close()
+
+def _parse_year_month(text):
+    year, month = text.split('-')
+    return int(year), int(month)
+
 
 if __name__ == "__main__":
-    # 例: 2024年11月のデータを取得
-    year = 2025
-    month = 10
+    parser = argparse.ArgumentParser(description="気象庁の日別値 (湿度・気温・日照時間) を取得します。")
+    parser.add_argument('--stations', default="44:47662:東京",
+                        help="カンマ区切りの地点 (府県番号:地点番号[:名前])")
+    parser.add_argument('--from', dest='start', type=_parse_year_month, help="開始月 (YYYY-MM)。指定すると一括取得")
+    parser.add_argument('--to', dest='end', type=_parse_year_month, help="終了月 (YYYY-MM)")
+    parser.add_argument('--workers', type=int, default=8, help="同時に取得する数")
+    parser.add_argument('--base-url', default=JMA_BASE_URL)
+    parser.add_argument('--out', default="jma_daily.csv")
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR, help="生ページのキャッシュ先")
+    parser.add_argument('--ttl-hours', type=float, default=DEFAULT_TTL_SEC / 3600,
+                        help="当月・前月のページを再取得するまでの時間")
+    parser.add_argument('--cache-max-mb', type=float, default=DEFAULT_MAX_BYTES / 2**20,
+                        help="キャッシュの上限サイズ (MB)")
+    parser.add_argument('--no-cache', action='store_true', help="キャッシュを使わない")
+    parser.add_argument('--offline', action='store_true', help="キャッシュ済みのページだけを解析し直す")
+    args = parser.parse_args()
+
+    cache = None if args.no_cache else PageCache(args.cache_dir, args.ttl_hours * 3600,
+                                                   int(args.cache_max_mb * 2**20))
+
+    if args.start:
+        stations = [Station.parse(s) for s in args.stations.split(',')]
+        months = list(iter_months(args.start, args.end or args.start))
+        results = fetch_months(stations, months, args.workers, args.base_url,
+                               cache=cache, offline=args.offline)
+
+        with open(args.out, 'w', newline='', encoding='utf-8') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Prec_No', 'Block_No', 'Date', 'Avg_Humidity', 'Avg_Temperature', 'Sunshine_Duration'])
+            for r in results:
+                if r.ok:
+                    writer.writerows((r.station.prec_no, r.station.block_no) + row for row in r.rows)
+                else:
+                    print(f"取得失敗: {r.station.prec_no}:{r.station.block_no} {r.year}/{r.month}: {r.error}")
+        n_ok = sum(r.ok for r in results)
+        print(f"{n_ok}/{len(results)} か月分を取得し、{args.out} に保存しました。")
+        if cache:
+            print(f"キャッシュ: {cache.stats()}")
+    else:
+        # 例: 2024年11月のデータを取得
+        year = 2025
+        month = 10
     
-    print(f"{year}年{month}月の東京都の湿度・気温・日照時間データをスクレイピングします...")
-    result = scrape_tokyo_humidity(year, month)
+        print(f"{year}年{month}月の東京都の湿度・気温・日照時間データをスクレイピングします...")
+        result = scrape_tokyo_humidity(year, month, cache)
     
-    if result:
-        print("\n日付 | 平均湿度 (%) | 平均気温 (℃) | 日照時間 (h)")
-        print("-----------|--------------|--------------|-------------")
-        for date_str, hum, temp, sun in result:
-            print(f"{date_str:<10} | {hum:<12} | {temp:<12} | {sun}")
+        if result:
+            print("\n日付 | 平均湿度 (%) | 平均気温 (℃) | 日照時間 (h)")
+            print("-----------|--------------|--------------|-------------")
+            for date_str, hum, temp, sun in result:
+                print(f"{date_str:<10} | {hum:<12} | {temp:<12} | {sun}")
             
-        # CSVファイルに保存
-        filename = "tokyo_humidity.csv"
-        with open(filename, 'w', newline='', encoding='utf-8') as f:
-            writer = csv.writer(f)
-            writer.writerow(['Date', 'Avg_Humidity', 'Avg_Temperature', 'Sunshine_Duration'])
-            writer.writerows(result)
-        print(f"\nファイルに保存しました: {filename}")
-    else:
-        print("データが見つからないか、エラーが発生しました。")
+            # 気象データのストアに保存 (同じ日の行は上書き)
+            import pandas as pd
+            import weather_store
+
+            df = pd.DataFrame(result, columns=['Date', 'Avg_Humidity', 'Avg_Temperature', 'Sunshine_Duration'])
+            df['Prec_No'], df['Block_No'] = TOKYO.prec_no, TOKYO.block_no
+            weather_store.open_weather_store().upsert(df)
+            print(f"\nファイルに保存しました: {weather_store.WEATHER_FILE}")
+        else:
+            print("データが見つからないか、エラーが発生しました。")
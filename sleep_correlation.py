@@ -0,0 +1,217 @@
+"""
+睡眠の指標と気象の変数の相関を、ラグ (何日前の天気か) ごとにまとめて計算するモジュールです。
+
+    result = lag_correlations(sleep_frame, weather, ['sleep_duration_hour', 'wake_quality'],
+                              ['Avg_Humidity', 'Avg_Temperature'], lags=range(8))
+    result.r[lag, i, j]   # 睡眠の指標 i と、lag 日前の気象の変数 j の相関係数
+    result.ci_low / result.ci_high / result.n / result.p_value
+
+ラグ l の組は「その晩の睡眠」と「l 日前の日別値」です。欠測は組ごとに除きます (pairwise)。
+全指標 × 全変数の和・二乗和・積和を行列積でまとめて求めるので、ラグごとに 1 回の計算で済みます。
+信頼区間は Fisher の z 変換 (z = artanh r、標準誤差 1/√(n-3)) による近似です。
+
+rolling_correlations() は直近 window 晩の相関を全ての晩について累積和で求め、
+RollingCorrelation は新しい晩を append() するたびに直近 window 晩の相関を O(ラグ数 × 指標数 × 変数数) で更新します。
+"""
+import math
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+DEFAULT_LAGS = range(8)
+Z_95 = 1.959963984540054
+
+# r / n / ci_low / ci_high / p_value の形は (ラグ数, 睡眠の指標数, 気象の変数数)
+LagCorrelation = namedtuple('LagCorrelation', 'lags sleep_cols weather_cols r n ci_low ci_high p_value')
+
+
+def _day_numbers(dates):
+    return pd.DatetimeIndex(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def lagged_weather(sleep_dates, weather, weather_cols, lags=DEFAULT_LAGS, date_col='Date'):
+    """
+    睡眠の各晩について、lag 日前の気象の値を並べた配列 (ラグ数, 晩数, 変数数) を返します。
+    気象の日付を日数の添字にして引くので、どちらかの日が抜けていても日付どおりに対応します。
+    日付が NaT の晩は NaN のままです。
+    """
+    lags = np.asarray(list(lags), dtype=np.int64)
+    sleep_dates = pd.DatetimeIndex(sleep_dates)
+    # NaT は日数にすると int64 の最小値になり、添字の計算があふれるので除く
+    valid = ~sleep_dates.isna()
+    days = _day_numbers(sleep_dates[valid])
+    weather = weather[weather[date_col].notna()].drop_duplicates(date_col, keep='last')
+    weather_days = _day_numbers(weather[date_col])
+    values = weather[list(weather_cols)].to_numpy(dtype=float, na_value=np.nan)
+
+    out = np.full((len(lags), len(sleep_dates), len(weather_cols)), np.nan)
+    if not len(days) or not len(weather_days):
+        return out
+    base = min(days.min() - lags.max(), weather_days.min())
+    grid = np.full((max(days.max(), weather_days.max()) - base + 1, len(weather_cols)), np.nan)
+    grid[weather_days - base] = values
+    for k, lag in enumerate(lags):
+        out[k, valid] = grid[days - lag - base]
+    return out
+
+
+def _center(a, axis):
+    """欠測を除いた平均を引きます (全て欠測の列はそのまま NaN)。"""
+    valid = ~np.isnan(a)
+    count = valid.sum(axis=axis, keepdims=True)
+    mean = np.where(valid, a, 0.0).sum(axis=axis, keepdims=True) / np.maximum(count, 1)
+    return a - mean
+
+
+def _pairwise_sums(x, y):
+    """
+    x (晩数, p) と y (晩数, q) の全ての組について、両方が欠測でない晩の
+    件数・和・二乗和・積和を (p, q) の配列で返します。
+    """
+    mx, my = ~np.isnan(x), ~np.isnan(y)
+    x0, y0 = np.where(mx, x, 0.0), np.where(my, y, 0.0)
+    mxf, myf = mx.astype(float), my.astype(float)
+    n = mxf.T @ myf
+    sx = x0.T @ myf
+    sy = mxf.T @ y0
+    sxx = (x0 * x0).T @ myf
+    syy = mxf.T @ (y0 * y0)
+    sxy = x0.T @ y0
+    return n, sx, sy, sxx, syy, sxy
+
+
+def _corr_from_sums(n, sx, sy, sxx, syy, sxy):
+    with np.errstate(invalid='ignore', divide='ignore'):
+        cov = n * sxy - sx * sy
+        var = (n * sxx - sx * sx) * (n * syy - sy * sy)
+        r = cov / np.sqrt(var)
+    r = np.where((n >= 2) & (var > 0), r, np.nan)
+    return np.clip(r, -1.0, 1.0)
+
+
+def fisher_interval(r, n, z_crit=Z_95):
+    """Fisher の z 変換による相関係数の信頼区間 (既定は 95%) と、無相関の検定の p 値 (正規近似) を返します。"""
+    r = np.asarray(r, dtype=float)
+    n = np.asarray(n, dtype=float)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        z = np.arctanh(np.clip(r, -0.9999999, 0.9999999))
+        se = np.where(n > 3, 1.0 / np.sqrt(n - 3), np.nan)
+        low, high = np.tanh(z - z_crit * se), np.tanh(z + z_crit * se)
+        p_value = np.vectorize(math.erfc, otypes=[float])(np.nan_to_num(np.abs(z) / se / math.sqrt(2)))
+    p_value = np.where(np.isnan(se) | np.isnan(r), np.nan, p_value)
+    return low, high, p_value
+
+
+def lag_correlations(sleep, weather, sleep_cols, weather_cols, lags=DEFAULT_LAGS, date_col='Date',
+                     weather_date_col='Date'):
+    """
+    睡眠の指標 sleep_cols と、0..max(lags) 日前の気象の変数 weather_cols の相関を全ての組について計算します。
+    sleep は日付列 date_col を持つ晩ごとのフレーム、weather は 1 地点分の日別値です。
+    """
+    lags = list(lags)
+    # 平均を引いてから和をとり、大きな値どうしの引き算による桁落ちを避ける
+    x = _center(sleep[list(sleep_cols)].to_numpy(dtype=float, na_value=np.nan), axis=0)
+    y = _center(lagged_weather(sleep[date_col], weather.rename(columns={weather_date_col: 'Date'}),
+                               weather_cols, lags), axis=1)
+
+    shape = (len(lags), len(sleep_cols), len(weather_cols))
+    r, n = np.full(shape, np.nan), np.zeros(shape)
+    for k in range(len(lags)):
+        sums = _pairwise_sums(x, y[k])
+        n[k] = sums[0]
+        r[k] = _corr_from_sums(*sums)
+    ci_low, ci_high, p_value = fisher_interval(r, n)
+    return LagCorrelation(lags, list(sleep_cols), list(weather_cols), r, n.astype(np.int64),
+                          ci_low, ci_high, p_value)
+
+
+def rolling_correlations(x, y, window, min_periods=3):
+    """
+    晩の順に並んだ x (晩数, p) と y (晩数, q) について、各晩までの直近 window 晩の相関を
+    (晩数, p, q) の配列で返します。累積和の差で求めるので、window の大きさに関係なく O(晩数 × p × q) です。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    if x.ndim == 1:
+        x = x[:, None]
+    if y.ndim == 1:
+        y = y[:, None]
+    x, y = _center(x, axis=0), _center(y, axis=0)
+    both = ~np.isnan(x)[:, :, None] & ~np.isnan(y)[:, None, :]
+    xv = np.where(both, x[:, :, None], 0.0)
+    yv = np.where(both, y[:, None, :], 0.0)
+
+    def windowed(a):
+        c = np.concatenate([np.zeros((1,) + a.shape[1:]), np.cumsum(a, axis=0)])
+        lo = np.maximum(np.arange(1, len(a) + 1) - window, 0)
+        return c[1:] - c[lo]
+
+    n = windowed(both.astype(float))
+    r = _corr_from_sums(n, windowed(xv), windowed(yv), windowed(xv * xv), windowed(yv * yv), windowed(xv * yv))
+    return np.where(n >= min_periods, r, np.nan)
+
+
+class RollingCorrelation:
+    """
+    直近 window 晩の、睡眠の指標 × (lag 日前の) 気象の変数の相関を逐次更新します。
+
+        rc = RollingCorrelation(window=28, n_sleep=2, n_weather=3, lags=range(8))
+        for sleep_row, weather_row in nights:    # 晩の順 (1 晩ずつ、抜けた日は NaN の行)
+            rc.append(sleep_row, weather_row)
+        rc.r   # (ラグ数, 2, 3)
+
+    weather_row はその晩の日付の日別値です。ラグ l の相手は l 晩前に渡した weather_row なので、
+    晩は日付の抜けなく渡してください。追加のたびに窓から出る晩の分を引き、入る晩の分を足します。
+    """
+    def __init__(self, window, n_sleep, n_weather, lags=DEFAULT_LAGS, min_periods=3):
+        self.window = window
+        self.lags = np.asarray(list(lags), dtype=np.int64)
+        self.min_periods = min_periods
+        self.nights = 0
+        shape = (len(self.lags), n_sleep, n_weather)
+        self._sums = np.zeros((6,) + shape)  # n, sx, sy, sxx, syy, sxy
+        self._x = np.full((window, n_sleep), np.nan)
+        # weather は窓から出る晩の最大ラグ分まで保持する
+        self._y = np.full((window + int(self.lags.max()) + 1, n_weather), np.nan)
+
+    def _contribution(self, x, ys):
+        # x: (p,), ys: (ラグ数, q) -> 6 つの和への寄与 (6, ラグ数, p, q)
+        both = ~np.isnan(x)[None, :, None] & ~np.isnan(ys)[:, None, :]
+        xv = np.where(both, x[None, :, None], 0.0)
+        yv = np.where(both, ys[:, None, :], 0.0)
+        return np.stack([both.astype(float), xv, yv, xv * xv, yv * yv, xv * yv])
+
+    def _lagged(self, t):
+        # t 晩目の組の相手 (t - lag 晩目の weather)。まだ無い晩は NaN
+        ylen = len(self._y)
+        src = t - self.lags
+        ys = self._y[src % ylen]
+        ys[src < 0] = np.nan
+        return ys
+
+    def append(self, sleep_row, weather_row):
+        """1 晩分の睡眠の指標と、同じ日付の気象の値を追加します。"""
+        t = self.nights
+        x = np.asarray(sleep_row, dtype=float)
+        self._y[t % len(self._y)] = np.asarray(weather_row, dtype=float)
+        if t >= self.window:
+            # 窓から出る晩 (t - window) の組を引く
+            old = t - self.window
+            self._sums -= self._contribution(self._x[old % self.window], self._lagged(old))
+        self._x[t % self.window] = x
+        self._sums += self._contribution(x, self._lagged(t))
+        self.nights += 1
+
+    @property
+    def n(self):
+        return np.rint(self._sums[0]).astype(np.int64)
+
+    @property
+    def r(self):
+        r = _corr_from_sums(*self._sums)
+        return np.where(self._sums[0] >= self.min_periods, r, np.nan)
+
+    def interval(self):
+        """現在の窓の相関係数の 95% 信頼区間と p 値を返します。"""
+        return fisher_interval(self.r, self.n)
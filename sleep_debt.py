@@ -0,0 +1,208 @@
+"""
+睡眠負債の計算です。
+
+    model = DebtModel(target_hours=7.5, repayment=1.0, half_life_days=14)
+    ledger = DebtLedger(model)
+    ledger.extend(dates, hours)          # 晩ごとの睡眠時間 (日付順)
+    ledger.append('2025-10-31', 6.5)     # 新しい晩は前の晩の負債から O(1) で更新
+    ledger.between('2025-10-01', '2025-10-31')
+    ledger.debt_on(dates)                # 各日付時点の負債
+
+晩 t の負債は、前の晩の負債を経過日数 g だけ減衰させ、その晩の不足分を足したものです。
+
+    負債_t = max(0, 負債_{t-1} × 0.5^(g / half_life_days) + 不足_t)
+    不足_t = target_hours - 睡眠時間_t       (不足した晩)
+           = repayment × (target_hours - 睡眠時間_t)  (目標より多く眠った晩。負の値で負債を返済する)
+
+睡眠時間が欠損した晩は不足 0 (減衰だけ) とします。
+half_life_days=None は減衰なし、half_life_days=0 は前の晩を持ち越さない (その晩の不足分のみ) です。
+LEGACY_MODEL は従来の定義「7.5h - 睡眠時間 = 睡眠負債 (不足分のみ)」です。
+"""
+import threading
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+DebtModel = namedtuple('DebtModel', 'target_hours repayment half_life_days', defaults=(7.5, 1.0, None))
+
+# 従来の定義 (その晩の 7.5h - 睡眠時間、余剰は 0)
+LEGACY_MODEL = DebtModel(target_hours=7.5, repayment=0.0, half_life_days=0)
+
+
+def retention(model, days):
+    """days 日経過したときに負債が残る割合。"""
+    if model.half_life_days is None:
+        return 1.0
+    if model.half_life_days == 0:
+        return 0.0 if days > 0 else 1.0
+    return 0.5 ** (days / model.half_life_days)
+
+
+def night_debt(model, previous_debt, gap_days, hours):
+    """前の晩の負債・経過日数・その晩の睡眠時間から、その晩の負債を返します。"""
+    if np.isnan(hours):
+        change = 0.0
+    else:
+        change = model.target_hours - hours
+        if change < 0:
+            change *= model.repayment
+    return max(0.0, previous_debt * retention(model, gap_days) + change)
+
+
+def _day_numbers(dates):
+    return pd.DatetimeIndex(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+class DebtLedger:
+    """
+    日付順の晩ごとの (日付, 睡眠時間, 負債) を保持します。
+
+    末尾への追加 (append) は最後の晩の負債から計算するので O(1) (配列は倍々で確保) です。
+    既存の晩より前の日付を追加・更新した場合は、その晩以降だけを計算し直します。
+    """
+    def __init__(self, model=LEGACY_MODEL, capacity=64):
+        self.model = model
+        self.version = None  # 同期したデータのバージョン (data_cache が使う)
+        self._n = 0
+        self._days = np.empty(capacity, dtype=np.int64)
+        self._hours = np.empty(capacity)
+        self._debt = np.empty(capacity)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return self._n
+
+    def __getstate__(self):
+        # ワーカープロセスへ渡すとき (ロックは送れないので受け取った側で作り直す)
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _reserve(self, n):
+        if n > len(self._days):
+            size = max(n, 2 * len(self._days))
+            for name in ('_days', '_hours', '_debt'):
+                grown = np.empty(size, dtype=getattr(self, name).dtype)
+                grown[:self._n] = getattr(self, name)[:self._n]
+                setattr(self, name, grown)
+
+    def _push(self, day, hours):
+        # 末尾の晩の次に追加する (day は末尾より後)
+        i = self._n
+        self._reserve(i + 1)
+        if i == 0:
+            debt = night_debt(self.model, 0.0, 0, hours)
+        else:
+            debt = night_debt(self.model, self._debt[i - 1], day - self._days[i - 1], hours)
+        self._days[i], self._hours[i], self._debt[i] = day, hours, debt
+        self._n = i + 1
+
+    def _truncate(self, n):
+        self._n = min(self._n, n)
+
+    def append(self, date, hours):
+        """1 晩分を追加します。同じ日付の晩があれば置き換えます。"""
+        day = _day_numbers([date])[0]
+        hours = float('nan') if pd.isna(hours) else float(hours)
+        with self._lock:
+            if self._n == 0 or day > self._days[self._n - 1]:
+                self._push(day, hours)
+                return
+            # 既存の晩以前: その位置から後ろを計算し直す
+            i = int(np.searchsorted(self._days[:self._n], day, 'left'))
+            rest_days = self._days[i:self._n].copy()
+            rest_hours = self._hours[i:self._n].copy()
+            if rest_days[0] == day:
+                rest_days, rest_hours = rest_days[1:], rest_hours[1:]
+            self._truncate(i)
+            self._push(day, hours)
+            for d, h in zip(rest_days, rest_hours):
+                self._push(d, h)
+
+    def extend(self, dates, hours):
+        """日付順の複数の晩を追加します。"""
+        days = _day_numbers(dates)
+        hours = np.asarray(hours, dtype=float)
+        with self._lock:
+            in_order = (np.diff(days) > 0).all() and (self._n == 0 or days[0] > self._days[self._n - 1])
+            if in_order:
+                self._reserve(self._n + len(days))
+                for d, h in zip(days, hours):
+                    self._push(d, h)
+                return
+        for d, h in zip(days, hours):
+            self.append(np.datetime64(int(d), 'D'), h)
+
+    def sync(self, dates, hours):
+        """
+        保持している晩を (dates, hours) と同じ内容にします。dates は昇順で重複なしとします。
+        先頭から一致する晩はそのまま使い、最初に食い違った晩以降だけを計算し直します。
+        """
+        days = _day_numbers(dates)
+        hours = np.asarray(hours, dtype=float)
+        valid = days != np.iinfo(np.int64).min  # 日付のない行は除く
+        days, hours = days[valid], hours[valid]
+        with self._lock:
+            n = min(self._n, len(days))
+            same = (self._days[:n] == days[:n]) & ((self._hours[:n] == hours[:n])
+                                                  | (np.isnan(self._hours[:n]) & np.isnan(hours[:n])))
+            first_diff = n if same.all() else int(np.argmin(same))
+            self._truncate(first_diff)
+            for d, h in zip(days[first_diff:], hours[first_diff:]):
+                self._push(d, h)
+
+    def snapshot(self):
+        """
+        現在の晩と負債をコピーした DebtLedger を返します。コピーは元の ledger の
+        その後の sync / append の影響を受けないので、別のスレッドから読み出しても安全です。
+        """
+        with self._lock:
+            copy = DebtLedger(self.model, capacity=max(self._n, 1))
+            n = self._n
+            copy._days[:n], copy._hours[:n], copy._debt[:n] = self._days[:n], self._hours[:n], self._debt[:n]
+            copy._n = n
+            copy.version = self.version
+        return copy
+
+    @property
+    def latest(self):
+        """最後の晩の負債 (晩がなければ 0)。"""
+        return float(self._debt[self._n - 1]) if self._n else 0.0
+
+    def between(self, start=None, end=None):
+        """[start, end] の晩の date / sleep_hours / debt を二分探索で切り出します。"""
+        days = self._days[:self._n]
+        lo = 0 if start is None else np.searchsorted(days, _day_numbers([start])[0], 'left')
+        hi = self._n if end is None else np.searchsorted(days, _day_numbers([end])[0], 'right')
+        return pd.DataFrame({
+            'date': days[lo:hi].astype('datetime64[D]').astype('datetime64[ns]'),
+            'sleep_hours': self._hours[lo:hi],
+            'debt': self._debt[lo:hi],
+        })
+
+    def debt_on(self, dates):
+        """
+        各日付時点の負債を返します。その日以前の最後の晩の負債を、経過日数だけ減衰させた値です。
+        最初の晩より前・日付が欠損している場合は NaN です。
+        """
+        days = _day_numbers(dates)
+        stored = self._days[:self._n]
+        i = np.searchsorted(stored, days, 'right') - 1
+        found = (i >= 0) & (days != np.iinfo(np.int64).min)
+        safe = np.where(found, i, 0)
+        if not self._n:
+            return np.full(len(days), np.nan)
+        gap = days - stored[safe]
+        model = self.model
+        if model.half_life_days is None:
+            factor = np.ones(len(days))
+        elif model.half_life_days == 0:
+            factor = np.where(gap > 0, 0.0, 1.0)
+        else:
+            factor = 0.5 ** (gap / model.half_life_days)
+        return np.where(found, self._debt[safe] * factor, np.nan)
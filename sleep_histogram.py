@@ -0,0 +1,221 @@
+"""
+睡眠時間のヒストグラムをサーバー側で集計するモジュールです。
+
+    hist = BinnedHistogram(bin_size=0.5).add(values)
+    hist.edges, hist.counts       # チャートに渡すのはビンの端と度数だけ (晩数によらず一定の大きさ)
+    hist.merge(other)             # 同じビン幅のヒストグラムは度数を足すだけでまとめられる
+
+ビンは bin_size の倍数で区切り、[k × bin_size, (k + 1) × bin_size) に入る値を数えます
+(np.histogram と同じく左端を含む)。平均・標準偏差は個数・合計・二乗和から求めます。
+
+HistogramIndex は日付順の晩ごとの値と、月 × 曜日ごとの度数を持ち、
+期間・曜日を指定したヒストグラムを「範囲内の月の度数の和 + 端の月の晩の集計」で返します。
+"""
+import numpy as np
+import pandas as pd
+
+BIN_SIZE = 0.5
+
+
+class BinnedHistogram:
+    """
+    ビン幅 bin_size の度数分布。度数は最小・最大のビン番号の間だけ配列で持ち、
+    範囲外の値が来たら配列を広げます。add() / remove() / merge() は自身を返します。
+    """
+    def __init__(self, bin_size=BIN_SIZE):
+        self.bin_size = bin_size
+        self._first = 0                           # _counts[0] のビン番号
+        self._counts = np.zeros(0, dtype=np.int64)
+        self.n = 0
+        self.total = 0.0
+        self.total_sq = 0.0
+
+    def _ensure(self, lo, hi):
+        """ビン番号 lo..hi を配列に含めます。"""
+        if not len(self._counts):
+            self._first = lo
+            self._counts = np.zeros(hi - lo + 1, dtype=np.int64)
+            return
+        last = self._first + len(self._counts) - 1
+        if lo < self._first or hi > last:
+            new_first = min(lo, self._first)
+            grown = np.zeros(max(hi, last) - new_first + 1, dtype=np.int64)
+            grown[self._first - new_first:self._first - new_first + len(self._counts)] = self._counts
+            self._first, self._counts = new_first, grown
+
+    def add_bins(self, bins, weight=1):
+        """ビン番号の配列で度数を足します (モーメントは更新しません)。"""
+        bins = np.asarray(bins, dtype=np.int64)
+        if len(bins):
+            lo, hi = int(bins.min()), int(bins.max())
+            self._ensure(lo, hi)
+            self._counts += weight * np.bincount(bins - self._first, minlength=len(self._counts))
+        return self
+
+    def add(self, values):
+        """値を追加します。NaN は数えません。"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.add_bins(np.floor(values / self.bin_size).astype(np.int64))
+        self.n += len(values)
+        self.total += float(values.sum())
+        self.total_sq += float((values * values).sum())
+        return self
+
+    def remove(self, values):
+        """add() した値を取り除きます (晩の値を更新するときは remove してから add します)。"""
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.add_bins(np.floor(values / self.bin_size).astype(np.int64), weight=-1)
+        self.n -= len(values)
+        self.total -= float(values.sum())
+        self.total_sq -= float((values * values).sum())
+        return self
+
+    def merge(self, other):
+        """同じビン幅のヒストグラムの度数を足し合わせます。"""
+        if other.bin_size != self.bin_size:
+            raise ValueError("ビン幅が異なるヒストグラムはまとめられません")
+        if len(other._counts):
+            self._ensure(other._first, other._first + len(other._counts) - 1)
+            offset = other._first - self._first
+            self._counts[offset:offset + len(other._counts)] += other._counts
+        self.n += other.n
+        self.total += other.total
+        self.total_sq += other.total_sq
+        return self
+
+    def _trimmed(self):
+        nonzero = np.flatnonzero(self._counts)
+        if not len(nonzero):
+            return self._first, self._counts[:0]
+        return self._first + nonzero[0], self._counts[nonzero[0]:nonzero[-1] + 1]
+
+    @property
+    def counts(self):
+        """先頭・末尾の空のビンを除いた度数。"""
+        return self._trimmed()[1]
+
+    @property
+    def edges(self):
+        """counts に対応するビンの端 (len(counts) + 1 個)。"""
+        first, counts = self._trimmed()
+        if not len(counts):
+            return np.empty(0)
+        return (first + np.arange(len(counts) + 1)) * self.bin_size
+
+    @property
+    def mean(self):
+        return self.total / self.n if self.n else float('nan')
+
+    @property
+    def std(self):
+        """標本標準偏差 (pandas の std と同じ ddof=1)。"""
+        if self.n < 2:
+            return float('nan')
+        mean = self.total / self.n
+        return float(np.sqrt(max(0.0, (self.total_sq - self.n * mean * mean) / (self.n - 1))))
+
+    def to_dict(self):
+        return {'edges': [round(float(e), 2) for e in self.edges], 'counts': self.counts.tolist()}
+
+
+def _day_numbers(dates):
+    return pd.DatetimeIndex(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+def _month_numbers(days):
+    return days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+
+
+class HistogramIndex:
+    """
+    日付ごとの値から、期間・曜日を指定したヒストグラムを返すための索引。
+
+        index = HistogramIndex(frame['date_dt'], frame['sleep_duration_hour'])
+        index.histogram('2024-01-01', '2024-12-31')           # 期間
+        index.histogram(weekdays=[5, 6])                      # 土日 (0 = 月曜)
+        index.add(new_dates, new_values)                      # 新しい晩の分だけ更新
+
+    晩ごとの値を日付順に持ち、月 × 曜日ごとの度数を前計算します。
+    期間の内側にある月は前計算した度数を足し合わせ、端の月だけ晩を数えます。
+    """
+    def __init__(self, dates=None, values=None, bin_size=BIN_SIZE):
+        self.bin_size = bin_size
+        self._days = np.empty(0, dtype=np.int64)
+        self._values = np.empty(0)
+        self._months = {}  # 月番号 -> 曜日ごとの BinnedHistogram (7 個)
+        if dates is not None:
+            self.add(dates, values)
+
+    def __len__(self):
+        return len(self._days)
+
+    def add(self, dates, values):
+        """晩を追加します。日付が欠損した行と値が NaN の行は数えません。"""
+        days = _day_numbers(dates)
+        values = np.asarray(values, dtype=float)
+        keep = (days != np.iinfo(np.int64).min) & ~np.isnan(values)
+        days, values = days[keep], values[keep]
+        if not len(days):
+            return self
+
+        # 日付順を保って挿入する (末尾への追加なら並べ替えは新しい分だけ)
+        order = np.argsort(days, kind='stable')
+        days, values = days[order], values[order]
+        if len(self._days) and days[0] < self._days[-1]:
+            pos = np.searchsorted(self._days, days, 'right')
+            self._days = np.insert(self._days, pos, days)
+            self._values = np.insert(self._values, pos, values)
+        else:
+            self._days = np.concatenate([self._days, days])
+            self._values = np.concatenate([self._values, values])
+
+        months = _month_numbers(days)
+        weekdays = (days + 3) % 7  # 1970-01-01 は木曜日
+        for month in np.unique(months):
+            hists = self._months.get(month)
+            if hists is None:
+                hists = [BinnedHistogram(self.bin_size) for _ in range(7)]
+                self._months[month] = hists
+            in_month = months == month
+            for wd in np.unique(weekdays[in_month]):
+                hists[wd].add(values[in_month & (weekdays == wd)])
+        return self
+
+    def histogram(self, start=None, end=None, weekdays=None):
+        """[start, end] (両端を含む) の晩のうち、曜日が weekdays (0 = 月曜) の晩のヒストグラムを返します。"""
+        weekdays = range(7) if weekdays is None else list(weekdays)
+        hist = BinnedHistogram(self.bin_size)
+        if not len(self._days):
+            return hist
+        lo_day = self._days[0] if start is None else _day_numbers([start])[0]
+        hi_day = self._days[-1] if end is None else _day_numbers([end])[0]
+        if hi_day < lo_day:
+            return hist
+
+        def month_start(month):
+            return np.datetime64(int(month), 'M').astype('datetime64[D]').astype(np.int64)
+
+        first_month, last_month = (int(m) for m in _month_numbers(np.array([lo_day, hi_day])))
+        # 月全体が期間に入る月は前計算した度数を足し、月の途中で切れる端の月は晩を数える
+        whole_from = first_month if lo_day == month_start(first_month) else first_month + 1
+        whole_to = last_month if hi_day == month_start(last_month + 1) - 1 else last_month - 1
+        for month, hists in self._months.items():
+            if whole_from <= month <= whole_to:
+                for wd in weekdays:
+                    hist.merge(hists[wd])
+
+        partial = []
+        if first_month == last_month and whole_from > whole_to:
+            # 1 つの月の途中だけの期間 (1 日から月の途中まで、月の途中から月末までを含む)
+            partial.append((lo_day, hi_day))
+        else:
+            if whole_from > first_month:
+                partial.append((lo_day, month_start(first_month + 1) - 1))
+            if whole_to < last_month:
+                partial.append((month_start(last_month), hi_day))
+        for lo, hi in partial:
+            i, j = np.searchsorted(self._days, lo, 'left'), np.searchsorted(self._days, hi, 'right')
+            hist.add(self._values[i:j][np.isin((self._days[i:j] + 3) % 7, weekdays)])
+        return hist
@@ -0,0 +1,194 @@
+import numpy as np
+import pandas as pd
+
+# 分単位のタイムライン定数
+# 「正午〜翌正午」を1日とする (dashboard.calculate_sleep_fit_score と同じ定義)
+NOON_MIN = 720
+DAY_MIN = 1440
+DAY_SEC = 86400
+
+# H:MM または H:MM:SS 形式 (Googleフォームの出力は 0:00:00 のように時が1桁)
+_CLOCK_PATTERN = r'^\s*(\d{1,2}):(\d{1,2})(?::(\d{1,2}))?\s*$'
+
+
+def parse_clock_seconds(values):
+    """
+    時刻文字列の列を 00:00 からの経過秒 (float64) の配列に変換します。
+    解析できない値・欠損値は NaN になります。
+
+    同じ時刻は何度も出現するため、ユニークな値だけを解析して
+    インデックスで展開します (行ごとの pd.to_datetime を避ける)。
+    """
+    series = pd.Series(values, copy=False)
+    codes, uniques = pd.factorize(series, use_na_sentinel=True)
+    if len(uniques) == 0:
+        return np.full(len(series), np.nan)
+
+    parts = pd.Series(uniques, dtype=object).astype(str).str.extract(_CLOCK_PATTERN)
+    h = pd.to_numeric(parts[0]).to_numpy(dtype=float)
+    m = pd.to_numeric(parts[1]).to_numpy(dtype=float)
+    s = pd.to_numeric(parts[2]).fillna(0).to_numpy(dtype=float)
+
+    unique_sec = h * 3600 + m * 60 + s
+    valid = (h < 24) & (m < 60) & (s < 60)
+    unique_sec[~valid] = np.nan
+
+    # codes == -1 は欠損値。末尾に NaN を追加してそこを指すようにする
+    lookup = np.append(unique_sec, np.nan)
+    return lookup[codes]
+
+
+def clock_minutes(seconds):
+    """経過秒の配列を分 (int64) に変換します。欠損は 0 (00:00) として扱います。"""
+    seconds = np.asarray(seconds, dtype=float)
+    return np.floor(np.nan_to_num(seconds, nan=0.0) / 60).astype(np.int64)
+
+
+def parse_sleep_times(df, bed_col='就寝時間', wake_col='起床時間'):
+    """
+    就寝時間・起床時間の列を一度だけ解析し、(就寝秒, 起床秒) の配列を返します。
+    """
+    return parse_clock_seconds(df[bed_col]), parse_clock_seconds(df[wake_col])
+
+
+def interval_overlap(a1, a2, b1, b2):
+    """区間 [a1, a2) と [b1, b2) の重なりの長さ (配列対応版)。"""
+    return np.maximum(0, np.minimum(a2, b2) - np.maximum(a1, b1))
+
+
+def to_noon_timeline(minutes):
+    """12:00 より前の時刻に 1440 を足し、「正午〜翌正午」のタイムラインに載せます。"""
+    minutes = np.asarray(minutes)
+    return np.where(minutes < NOON_MIN, minutes + DAY_MIN, minutes)
+
+
+def sleep_duration_hours(bed_sec, wake_sec):
+    """
+    就寝・起床の経過秒から睡眠時間 (時間) を計算します。
+    起床が就寝より前なら翌日とみなします。どちらかが欠損なら NaN です。
+    """
+    bed_sec = np.asarray(bed_sec, dtype=float)
+    wake_sec = np.asarray(wake_sec, dtype=float)
+    wake_sec = np.where(wake_sec < bed_sec, wake_sec + DAY_SEC, wake_sec)
+    return (wake_sec - bed_sec) / 3600
+
+
+def sleep_interval_minutes(bed_min, wake_min):
+    """
+    就寝・起床の分を正午基準のタイムライン上の区間 [bs, we) に変換します。
+    起床が就寝以前なら 24時間後とみなします。
+    """
+    bs = to_noon_timeline(bed_min)
+    we = to_noon_timeline(wake_min)
+    we = np.where(we <= bs, we + DAY_MIN, we)
+    return bs, we
+
+
+def target_window_minutes(target_start="23:30", target_end="07:30"):
+    """目標時間帯 ("HH:MM") を正午基準のタイムライン上の (ts, te) に変換します。"""
+    ts = int(clock_minutes(parse_clock_seconds([target_start]))[0])
+    te = int(clock_minutes(parse_clock_seconds([target_end]))[0])
+    if ts < NOON_MIN: ts += DAY_MIN
+    if te < NOON_MIN: te += DAY_MIN
+    if te <= ts: te += DAY_MIN
+    return ts, te
+
+
+def sleep_fit_scores(bed_min, wake_min, target_start="23:30", target_end="07:30"):
+    """
+    目標時間帯との一致度を全行まとめて計算します。
+    Score = (Overlap Duration / Actual Sleep Duration) * 100
+
+    bed_min / wake_min は clock_minutes の結果で、欠損・解析できない時刻は 0 (00:00) です。
+    dashboard.calculate_sleep_fit_score は欠損を 00:00 とする点は同じですが、
+    '25:00:00' のような範囲外の時刻も 1500 分として計算するため、その行だけ結果が異なります。
+    """
+    ts, te = target_window_minutes(target_start, target_end)
+    bs, we = sleep_interval_minutes(bed_min, wake_min)
+
+    actual = we - bs
+    overlap = interval_overlap(bs, we, ts, te)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        score = np.minimum(100, (overlap / actual) * 100)
+    return np.where(actual == 0, 0, score)
+
+
+def add_sleep_metrics(df, target_start="23:30", target_end="07:30"):
+    """
+    sleep_duration_hour と sleep_fit_score を追加したコピーを返します。
+    就寝時間・起床時間の列がない場合はそのまま返します。
+    """
+    if '就寝時間' not in df.columns or '起床時間' not in df.columns:
+        return df
+
+    bed_sec, wake_sec = parse_sleep_times(df)
+    df = df.copy()
+    if 'sleep_duration_hour' not in df.columns:
+        df['sleep_duration_hour'] = sleep_duration_hours(bed_sec, wake_sec)
+    df['sleep_fit_score'] = sleep_fit_scores(
+        clock_minutes(bed_sec), clock_minutes(wake_sec), target_start, target_end
+    )
+    return df
+
+
+def minutes_to_hhmm(minutes):
+    """タイムライン上の分を "HH:MM" 形式に戻します (1440 以上は翌日として扱う)。"""
+    minutes = int(minutes) % DAY_MIN
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class FitScoreIndex:
+    """
+    各晩の睡眠区間を正午基準の分タイムライン上に前計算したインデックス。
+
+    区間 [bs, we) に重み 1/actual を載せた占有密度の累積和 (prefix sum) を持つため、
+    任意の目標時間帯 [ts, te) について
+      - 各晩のスコアは O(1) で求まり (scores)
+      - 全晩の平均スコアは累積和の差 1 回で求まります (mean_score)。
+    これにより、長さ L の全候補時間帯を一度に評価できます (optimal_window)。
+    """
+    # 就寝は [720, 2160)、起床は就寝から最大 1440 分後なので 3600 分までで足りる
+    TIMELINE_LEN = NOON_MIN + 2 * DAY_MIN + 1
+
+    def __init__(self, bed_min, wake_min):
+        self.bs, self.we = sleep_interval_minutes(bed_min, wake_min)
+        self.actual = self.we - self.bs
+        self.n_nights = len(self.bs)
+
+        weights = 1.0 / self.actual
+        n = self.TIMELINE_LEN
+        diff = (np.bincount(self.bs, weights=weights, minlength=n + 1)
+                - np.bincount(self.we, weights=weights, minlength=n + 1))
+        density = np.cumsum(diff)[:n]
+        self._prefix = np.concatenate(([0.0], np.cumsum(density)))
+
+    def scores(self, target_start="23:30", target_end="07:30"):
+        """全晩の sleep_fit_score (sleep_fit_scores と同じ値) を返します。"""
+        ts, te = target_window_minutes(target_start, target_end)
+        overlap = interval_overlap(self.bs, self.we, ts, te)
+        return np.minimum(100, (overlap / self.actual) * 100)
+
+    def _window_means(self, ts, te):
+        if self.n_nights == 0:
+            return np.zeros(np.shape(ts))
+        return (self._prefix[te] - self._prefix[ts]) * 100 / self.n_nights
+
+    def mean_score(self, target_start="23:30", target_end="07:30"):
+        """全晩の平均スコアを O(1) で返します。"""
+        ts, te = target_window_minutes(target_start, target_end)
+        return float(self._window_means(ts, te))
+
+    def optimal_window(self, length_min, step=1):
+        """
+        長さ length_min 分の目標時間帯のうち、平均スコアが最大になるものを探します。
+        戻り値は (開始 "HH:MM", 終了 "HH:MM", 平均スコア) です。
+        """
+        length_min = int(length_min)
+        if not 0 < length_min <= DAY_MIN:
+            raise ValueError(f"length_min は 1〜{DAY_MIN} 分で指定してください: {length_min}")
+        ts = np.arange(NOON_MIN, NOON_MIN + DAY_MIN, step)
+        means = self._window_means(ts, ts + length_min)
+        best = int(np.argmax(means))
+        start = int(ts[best])
+        return minutes_to_hhmm(start), minutes_to_hhmm(start + length_min), float(means[best])
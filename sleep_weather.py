@@ -0,0 +1,359 @@
+"""
+睡眠データと気象データを結び付けるモジュールです。
+
+join_weather() / SleepWeatherView は、睡眠の各行に同じ日付 (暦日) の日別値を結び付けます。
+その日の気象データがない場合は、最も近い日 (match='nearest') や直前の日 (match='backward')
+で補うこともできます。SleepWeatherView は結合結果を保持し、睡眠の行や気象の日が
+追加されたときは影響を受ける行だけを結合し直します。
+
+    view = SleepWeatherView(weather, columns=['Avg_Humidity', 'Avg_Temperature'], match='nearest', tolerance_days=2)
+    view.add_sleep(sleep_frame)
+    view.frame   # 睡眠の列 + Weather_Date + 気象の列
+
+sleep_window_weather() は、各晩の実際の睡眠区間 (就寝時間 → 起床時間) に重なる時別値を集計し、
+「眠っている間の平均湿度」「眠っている間の最高気温」のような晩ごとの値を返します。
+
+    hourly = weather_store.open_hourly_store().read(TOKYO, '2025-01-01', '2025-12-31')
+    features = sleep_window_weather(sleep_frame, hourly, columns=['Humidity', 'Temperature'])
+    # -> Humidity_mean / Humidity_max / ... (sleep_frame と同じ行順)
+
+晩ごとに時別値を絞り込むのではなく、観測時刻で二分探索して区間の添字を求め、
+平均は累積和、最大・最小はスパーステーブルでまとめて計算します。
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+import data_cache
+import sleep_metrics
+
+STATS = ('mean', 'max', 'min')
+MATCH_MODES = ('exact', 'nearest', 'backward')
+WEATHER_DATE_COL = 'Weather_Date'
+
+
+def sleep_windows(frame, date_col='日付', bed_col='就寝時間', wake_col='起床時間'):
+    """
+    型付きフレーム (storage.to_typed_frame) から各晩の睡眠区間を datetime64[m] の (開始, 終了) で返します。
+    日付はその晩の日付 (就寝が 0 時以降なら翌日の就寝) とし、時刻が欠損した晩は NaT です。
+    """
+    bed = frame[bed_col].to_numpy(dtype=float, na_value=np.nan)
+    wake = frame[wake_col].to_numpy(dtype=float, na_value=np.nan)
+    bs, we = sleep_metrics.sleep_interval_minutes(bed, wake)
+
+    day = frame[date_col].to_numpy().astype('datetime64[m]').astype(np.int64)
+    valid = ~(np.isnan(bs) | np.isnan(we)) & (frame[date_col].notna().to_numpy())
+    start = np.where(valid, day + np.nan_to_num(bs).astype(np.int64), 0)
+    end = np.where(valid, day + np.nan_to_num(we).astype(np.int64), 0)
+    nat = np.datetime64('NaT', 'm')
+    return (np.where(valid, start.astype('datetime64[m]'), nat),
+            np.where(valid, end.astype('datetime64[m]'), nat))
+
+
+class IntervalAggregator:
+    """
+    観測時刻順に並んだ値について、任意の区間の平均・最大・最小を 1 区間 O(1) で返す索引です。
+      - 平均: 値と有効な観測数の累積和 (prefix sum) の差
+      - 最大・最小: スパーステーブル (長さ 2^k の区間の値を前計算し、重なる 2 区間で答える)
+    欠測 (NaN) は無視します。
+    """
+    def __init__(self, times, values):
+        self.times = np.asarray(times, dtype='datetime64[m]')
+        if len(self.times) > 1 and (np.diff(self.times.astype(np.int64)) < 0).any():
+            raise ValueError("times は昇順に並べてください")
+        values = np.asarray(values, dtype=float)
+        valid = ~np.isnan(values)
+        self._sum = np.concatenate(([0.0], np.cumsum(np.where(valid, values, 0.0))))
+        self._count = np.concatenate(([0], np.cumsum(valid)))
+        self._max = self._sparse_table(values, np.fmax)
+        self._min = self._sparse_table(values, np.fmin)
+
+    @staticmethod
+    def _sparse_table(values, op):
+        # table[k][i] = op(values[i : i + 2^k])
+        table = [values]
+        width = 1
+        while 2 * width <= len(values):
+            prev = table[-1]
+            table.append(op(prev[:-width], prev[width:]))
+            width *= 2
+        return table
+
+    def window_index(self, starts, ends):
+        """
+        各区間 [start, end] に対応する観測の添字範囲 [lo, hi) を返します。
+        時別値は瞬間値なので、区間の直前・直後の観測 (就寝時・起床時の状態) も含めます。
+        区間が観測のある期間に収まらない晩は lo == hi (結果は NaN) になります。
+        """
+        starts = np.asarray(starts, dtype='datetime64[m]')
+        ends = np.asarray(ends, dtype='datetime64[m]')
+        n = len(self.times)
+        lo = np.searchsorted(self.times, starts, 'right') - 1
+        hi = np.searchsorted(self.times, ends, 'left') + 1
+        covered = (lo >= 0) & (hi <= n) & ~np.isnat(starts) & ~np.isnat(ends)
+        return np.where(covered, lo, 0), np.where(covered, hi, 0)
+
+    def mean(self, lo, hi):
+        count = self._count[hi] - self._count[lo]
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.where(count > 0, (self._sum[hi] - self._sum[lo]) / count, np.nan)
+
+    def max(self, lo, hi):
+        return self._query(self._max, np.fmax, lo, hi)
+
+    def min(self, lo, hi):
+        return self._query(self._min, np.fmin, lo, hi)
+
+    @staticmethod
+    def _query(table, op, lo, hi):
+        length = hi - lo
+        result = np.full(len(lo), np.nan)
+        nonempty = length > 0
+        level = np.zeros(len(lo), dtype=np.int64)
+        level[nonempty] = np.floor(np.log2(length[nonempty])).astype(np.int64)
+        # 区間の長さのレベル (高々 log2(n) 通り) ごとにまとめて引く
+        for k in np.unique(level[nonempty]):
+            idx = np.flatnonzero(nonempty & (level == k))
+            row = table[k]
+            result[idx] = op(row[lo[idx]], row[hi[idx] - (1 << k)])
+        return result
+
+
+def sleep_window_weather(sleep_frame, hourly, columns=('Humidity', 'Temperature'), stats=STATS,
+                         time_col='Time'):
+    """
+    各晩の睡眠区間に重なる時別値 (hourly、1 地点分) を集計します。
+    戻り値は sleep_frame と同じ index を持ち、<列名>_<mean|max|min> の列を持つ DataFrame です。
+    """
+    hourly = hourly.sort_values(time_col, kind='stable')
+    times = hourly[time_col].to_numpy().astype('datetime64[m]')
+    starts, ends = sleep_windows(sleep_frame)
+
+    out = {}
+    lo = hi = None
+    for col in columns:
+        index = IntervalAggregator(times, hourly[col].to_numpy(dtype=float, na_value=np.nan))
+        if lo is None:
+            lo, hi = index.window_index(starts, ends)
+        for stat in stats:
+            out[f'{col}_{stat}'] = getattr(index, stat)(lo, hi)
+    return pd.DataFrame(out, index=sleep_frame.index)
+
+
+def _day_numbers(dates):
+    """日付の配列を 1970-01-01 からの日数 (int64) に変換します。NaT は最小値になります。"""
+    return pd.DatetimeIndex(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+_NO_DAY = np.iinfo(np.int64).min
+
+
+def match_dates(sleep_days, weather_days, match='exact', tolerance_days=None):
+    """
+    睡眠の日 (sleep_days) ごとに対応する気象の日の添字を返します (昇順の weather_days に対する添字、なければ -1)。
+      exact    : 同じ日
+      nearest  : 最も近い日 (同じ距離なら前の日)
+      backward : その日以前で最も近い日 (as-of)
+    tolerance_days を指定すると、それより離れた日は対応なしになります。
+    """
+    if match not in MATCH_MODES:
+        raise ValueError(f"match は {MATCH_MODES} のいずれかです: {match}")
+    sleep_days = np.asarray(sleep_days, dtype=np.int64)
+    weather_days = np.asarray(weather_days, dtype=np.int64)
+    n = len(weather_days)
+    valid = sleep_days != _NO_DAY
+    if n == 0:
+        return np.full(len(sleep_days), -1)
+
+    right = np.searchsorted(weather_days, sleep_days, 'right')
+    before = right - 1  # sleep_day 以前で最後の日
+    has_before = before >= 0
+    before_dist = np.where(has_before, sleep_days - weather_days[np.clip(before, 0, n - 1)], np.inf)
+
+    if match == 'exact':
+        idx = np.where(has_before & (before_dist == 0), before, -1)
+        return np.where(valid, idx, -1)
+
+    if match == 'backward':
+        idx, dist = np.where(has_before, before, -1), before_dist
+    else:
+        has_after = right < n
+        after_dist = np.where(has_after, weather_days[np.clip(right, 0, n - 1)] - sleep_days, np.inf)
+        use_after = after_dist < before_dist
+        idx = np.where(use_after, right, np.where(has_before, before, -1))
+        dist = np.minimum(before_dist, after_dist)
+    if tolerance_days is not None:
+        idx = np.where(dist <= tolerance_days, idx, -1)
+    return np.where(valid, idx, -1)
+
+
+def join_weather(sleep, weather, columns=('Avg_Humidity', 'Avg_Temperature'), match='exact',
+                 tolerance_days=None, sleep_date_col='Date', weather_date_col='Date'):
+    """
+    sleep の各行に、暦日で対応する weather (1 地点分の日別値) の columns を付けたコピーを返します。
+    対応した気象データの日付を Weather_Date 列に入れます (対応なしは NaT / NaN)。
+    """
+    weather = weather.drop_duplicates(weather_date_col, keep='last').sort_values(weather_date_col)
+    weather_days = _day_numbers(weather[weather_date_col])
+    idx = match_dates(_day_numbers(sleep[sleep_date_col]), weather_days, match, tolerance_days)
+
+    out = sleep.copy()
+    hit = idx >= 0
+    safe = np.where(hit, idx, 0)
+    out[WEATHER_DATE_COL] = pd.to_datetime(np.where(hit, weather_days[safe], _NO_DAY).astype('datetime64[D]')
+                                           .astype('datetime64[ns]')).where(hit)
+    for col in columns:
+        values = weather[col].to_numpy(dtype=float, na_value=np.nan)
+        out[col] = np.where(hit, values[safe] if len(values) else np.nan, np.nan)
+    return out
+
+
+class SleepWeatherView:
+    """
+    睡眠の行と日別の気象データを暦日で結合した結果を保持する「実体化ビュー」。
+
+    add_sleep() は追加・更新された睡眠の行だけを結合して反映し、add_weather() は追加・更新された
+    気象の日によって対応先が変わる行 (その日に対応していた行と、より近い日ができた行) だけを
+    結合し直します。どちらも全体を merge し直すことはありません。
+    睡眠の行は key_cols (既定は日付列。複数ユーザーなら ['user_id', 'Date'] など) で一意とみなします。
+    睡眠ファイル全体を読み直したときは sync_sleep() で、ファイルから消えた行も削除します。
+    """
+    def __init__(self, weather=None, columns=('Avg_Humidity', 'Avg_Temperature'), match='exact',
+                 tolerance_days=None, sleep_date_col='Date', weather_date_col='Date', key_cols=None):
+        if match not in MATCH_MODES:
+            raise ValueError(f"match は {MATCH_MODES} のいずれかです: {match}")
+        self.columns = list(columns)
+        self.match = match
+        self.tolerance_days = tolerance_days
+        self.sleep_date_col = sleep_date_col
+        self.weather_date_col = weather_date_col
+        self.key_cols = list(key_cols or [sleep_date_col])
+        self.version = 0  # 内容が変わるたびに増える (キャッシュのキー用)
+        self._weather_days = np.empty(0, dtype=np.int64)
+        self._weather_values = {col: np.empty(0) for col in self.columns}
+        self._frame = None
+        self._lock = threading.Lock()
+        if weather is not None:
+            self.add_weather(weather)
+
+    @property
+    def frame(self):
+        """結合済みのフレーム (日付順)。読み取り専用として扱ってください。"""
+        if self._frame is None:
+            return pd.DataFrame(columns=self.key_cols + [WEATHER_DATE_COL] + self.columns)
+        return self._frame
+
+    def between(self, start=None, end=None):
+        """日付が [start, end] (両端を含む) の行を二分探索で切り出します。"""
+        frame = self.frame
+        dates = frame[self.sleep_date_col].to_numpy()
+        lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), 'left')
+        hi = len(frame) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), 'right')
+        return frame.iloc[lo:hi]
+
+    def _attach(self, rows, sleep_days):
+        """rows に気象の列を付けます (rows は変更されます)。"""
+        idx = match_dates(sleep_days, self._weather_days, self.match, self.tolerance_days)
+        hit = idx >= 0
+        safe = np.where(hit, idx, 0)
+        matched = np.where(hit, self._weather_days[safe] if len(self._weather_days) else 0, 0)
+        rows[WEATHER_DATE_COL] = pd.Series(matched.astype('datetime64[D]').astype('datetime64[ns]'),
+                                           index=rows.index).where(hit)
+        for col in self.columns:
+            values = self._weather_values[col]
+            rows[col] = np.where(hit, values[safe] if len(values) else np.nan, np.nan)
+        return rows
+
+    def add_sleep(self, rows):
+        """睡眠の行を追加します。key_cols が既存の行と同じ行は置き換えます。"""
+        self._merge_sleep(rows, replace=False)
+
+    def sync_sleep(self, rows):
+        """
+        睡眠の行を rows (睡眠ファイル全体) に合わせます。rows にある行は add_sleep() と同じく
+        追加・置き換えし、rows にないキーの行 (ファイルから消えた晩・日付が変わった晩の元の行) は削除します。
+        """
+        self._merge_sleep(rows, replace=True)
+
+    def _merge_sleep(self, rows, replace):
+        rows = rows.copy()
+        self._attach(rows, _day_numbers(rows[self.sleep_date_col]))
+        with self._lock:
+            frame = self._frame
+            # replace なら rows がファイル全体なので、既存の行は残さない (消えたキーの行もここで落ちる)
+            if frame is not None and len(frame) and not replace:
+                new_keys = pd.MultiIndex.from_frame(rows[self.key_cols])
+                old_keys = pd.MultiIndex.from_frame(frame[self.key_cols])
+                frame = frame[~old_keys.isin(new_keys)]
+                frame = pd.concat([frame, rows], ignore_index=True)
+            else:
+                frame = rows.reset_index(drop=True)
+            self._frame = frame.sort_values(self.sleep_date_col, kind='stable', ignore_index=True)
+            self.version += 1
+
+    def add_weather(self, weather):
+        """気象の日を追加・更新し、対応先が変わる睡眠の行だけを結合し直します。"""
+        weather = weather.drop_duplicates(self.weather_date_col, keep='last')
+        new_days = _day_numbers(weather[self.weather_date_col])
+        order = np.argsort(new_days, kind='stable')
+        new_days = new_days[order]
+        new_values = {col: weather[col].to_numpy(dtype=float, na_value=np.nan)[order] for col in self.columns}
+
+        with self._lock:
+            # 既存の日は新しい値で置き換え、新しい日は昇順を保って挿入する
+            keep = ~np.isin(self._weather_days, new_days)
+            days = np.concatenate([self._weather_days[keep], new_days])
+            merge_order = np.argsort(days, kind='stable')
+            self._weather_days = days[merge_order]
+            for col in self.columns:
+                merged = np.concatenate([self._weather_values[col][keep], new_values[col]])
+                self._weather_values[col] = merged[merge_order]
+
+            frame = self._frame
+            if frame is None or not len(frame) or not len(new_days):
+                self.version += 1
+                return
+            sleep_days = _day_numbers(frame[self.sleep_date_col])
+            current = _day_numbers(frame[WEATHER_DATE_COL])
+            current_dist = np.where(current == _NO_DAY, np.inf, np.abs(sleep_days - current))
+            # 新しい日の中で最も近い日までの距離が、今の対応先より近い行 (+ 対応先が更新された行)
+            near = match_dates(sleep_days, new_days, 'nearest' if self.match != 'backward' else 'backward')
+            near_dist = np.where(near >= 0, np.abs(sleep_days - new_days[np.clip(near, 0, None)]), np.inf)
+            affected = (near_dist < current_dist) | np.isin(current, new_days)
+            if affected.any():
+                rows = frame.loc[affected].copy()
+                self._attach(rows, sleep_days[affected])
+                frame = frame.copy()
+                frame.loc[affected, [WEATHER_DATE_COL] + self.columns] = rows[[WEATHER_DATE_COL] + self.columns]
+                self._frame = frame
+            self.version += 1
+
+
+# (名前) -> (睡眠ファイルのバージョン, 気象ファイルのバージョン, SleepWeatherView)
+_views = data_cache.LRUCache(maxsize=16)
+
+
+def shared_view(name, sleep_path, load_sleep, weather_path, load_weather, **view_kwargs):
+    """
+    ファイルから作る SleepWeatherView をプロセス内で共有します (Streamlit の再実行をまたいで使い回す)。
+
+    load_sleep() / load_weather() はファイルが変わったときだけ呼ばれ、変わった側の行を
+    sync_sleep() / add_weather() で既存のビューに反映します (ビューを作り直しません)。
+    睡眠ファイルから消えた晩 (日付を直した晩の元の行を含む) はビューからも削除します。
+    ファイルが変わっていなければ、結合済みのビューをそのまま返します。
+    """
+    sleep_version = data_cache.file_version(sleep_path)
+    weather_version = data_cache.file_version(weather_path)
+    cached = _views.get(name)
+    if cached is None:
+        view = SleepWeatherView(load_weather(), **view_kwargs)
+        view.add_sleep(load_sleep())
+    else:
+        cached_sleep, cached_weather, view = cached
+        if cached_weather != weather_version:
+            view.add_weather(load_weather())
+        if cached_sleep != sleep_version:
+            view.sync_sleep(load_sleep())
+    _views.put(name, (sleep_version, weather_version, view))
+    return view
@@ -0,0 +1,229 @@
+"""
+睡眠データの保存形式 (バックエンド) を切り替えるためのモジュールです。
+
+どのバックエンドも read() では「型付きフレーム」を返します:
+  - 日付            : datetime64 (Parquet では date32)
+  - 就寝時間/起床時間/昼寝の時間 : 00:00 からの分 (Int16)
+  - 寝つきの良さ/寝起きの良さ/日中の眠気 : Int8
+  - 目が覚めた回数  : Int16
+  - タイムスタンプ  : datetime64
+欠損は pandas の nullable 型 (<NA>) で表します。
+
+書き込みは追記 (append) を基本とし、同じ日付の行が複数ある場合は
+後から書かれた行 (= より新しいフォーム回答) を read() で採用します。
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+import sleep_metrics
+
+TIMESTAMP_COL = 'タイムスタンプ'
+DATE_COL = '日付'
+TIME_COLS = ['就寝時間', '起床時間', '昼寝の時間']
+SCORE_COLS = ['寝つきの良さ', '寝起きの良さ', '日中の眠気']
+WAKE_COUNT_COL = '目が覚めた回数'
+
+# data_tent.csv と同じ列順
+CSV_COLUMNS = [TIMESTAMP_COL, DATE_COL] + TIME_COLS + SCORE_COLS + [WAKE_COUNT_COL]
+
+TIMESTAMP_FORMAT = '%Y/%m/%d %H:%M:%S'
+DATE_FORMAT = '%Y/%m/%d'
+
+
+def _minutes_to_clock(minutes):
+    """分 (nullable) を data_tent.csv と同じ 'H:MM:SS' 形式の文字列に戻します。"""
+    values = minutes.astype('Float64')
+    h = (values // 60).astype('Int64').astype(str)
+    m = (values % 60).astype('Int64').astype(str).str.zfill(2)
+    return (h + ':' + m + ':00').where(values.notna(), None)
+
+
+def to_typed_frame(raw):
+    """CSV スキーマ (文字列) のフレームを型付きフレームに変換します。"""
+    df = raw.copy()
+    if TIMESTAMP_COL in df.columns and not pd.api.types.is_datetime64_any_dtype(df[TIMESTAMP_COL]):
+        df[TIMESTAMP_COL] = pd.to_datetime(df[TIMESTAMP_COL], format=TIMESTAMP_FORMAT, errors='coerce')
+    if DATE_COL in df.columns and not pd.api.types.is_datetime64_any_dtype(df[DATE_COL]):
+        df[DATE_COL] = pd.to_datetime(df[DATE_COL], format=DATE_FORMAT)
+    for col in TIME_COLS:
+        if col in df.columns and not pd.api.types.is_numeric_dtype(df[col]):
+            seconds = sleep_metrics.parse_clock_seconds(df[col])
+            df[col] = pd.array(np.floor(seconds / 60), dtype='Float64').astype('Int16')
+    for col in SCORE_COLS:
+        if col in df.columns:
+            df[col] = pd.to_numeric(df[col], errors='coerce').round().astype('Int8')
+    if WAKE_COUNT_COL in df.columns:
+        df[WAKE_COUNT_COL] = pd.to_numeric(df[WAKE_COUNT_COL], errors='coerce').round().astype('Int16')
+    return df
+
+
+def to_raw_frame(typed):
+    """型付きフレームを data_tent.csv と同じ文字列スキーマに戻します。"""
+    df = typed.copy()
+    if TIMESTAMP_COL in df.columns and pd.api.types.is_datetime64_any_dtype(df[TIMESTAMP_COL]):
+        df[TIMESTAMP_COL] = df[TIMESTAMP_COL].dt.strftime(TIMESTAMP_FORMAT)
+    if DATE_COL in df.columns and pd.api.types.is_datetime64_any_dtype(df[DATE_COL]):
+        df[DATE_COL] = df[DATE_COL].dt.strftime(DATE_FORMAT)
+    for col in TIME_COLS:
+        if col in df.columns and pd.api.types.is_numeric_dtype(df[col]):
+            df[col] = _minutes_to_clock(df[col])
+    return df
+
+
+def _filter_dates(df, start=None, end=None):
+    """日付列で [start, end] (両端を含む) の行に絞り込みます。"""
+    if DATE_COL not in df.columns or (start is None and end is None):
+        return df
+    mask = np.ones(len(df), dtype=bool)
+    if start is not None:
+        mask &= (df[DATE_COL] >= pd.Timestamp(start)).to_numpy()
+    if end is not None:
+        mask &= (df[DATE_COL] <= pd.Timestamp(end)).to_numpy()
+    return df.loc[mask].reset_index(drop=True)
+
+
+def latest_per_date(df):
+    """同じ日付の行が複数ある場合、最後に書かれた行だけを残します。"""
+    if DATE_COL not in df.columns or not df[DATE_COL].duplicated().any():
+        return df
+    return df.drop_duplicates(DATE_COL, keep='last').reset_index(drop=True)
+
+
+class CsvStore:
+    """
+    従来の data_tent.csv 形式。列の射影は usecols で行いますが、
+    テキスト形式のため日付範囲の絞り込みは読み込み後に行います。
+    """
+    def __init__(self, path):
+        self.path = path
+
+    def read(self, columns=None, start=None, end=None):
+        usecols = None
+        if columns is not None:
+            usecols = lambda c: c in columns or c == DATE_COL
+        df = latest_per_date(to_typed_frame(pd.read_csv(self.path, usecols=usecols)))
+        df = _filter_dates(df, start, end)
+        if columns is not None:
+            df = df[[c for c in df.columns if c in columns]]
+        return df
+
+    def write(self, df):
+        to_raw_frame(df).to_csv(self.path, index=False)
+
+    def append(self, df):
+        """行をファイル末尾に追記します (既存行は書き直しません)。"""
+        if not os.path.exists(self.path):
+            self.write(df)
+            return
+        header = pd.read_csv(self.path, nrows=0).columns
+        needs_newline = False
+        if os.path.getsize(self.path) > 0:
+            with open(self.path, 'rb') as f:
+                f.seek(-1, os.SEEK_END)
+                needs_newline = f.read(1) != b'\n'
+        with open(self.path, 'a', newline='', encoding='utf-8') as f:
+            if needs_newline:
+                f.write('\n')
+            to_raw_frame(df).reindex(columns=header).to_csv(f, header=False, index=False)
+
+
+class ParquetStore:
+    """
+    Parquet (Arrow) による列指向の型付き保存形式。
+    列の射影と日付範囲の述語プッシュダウンに対応しています。pyarrow が必要です。
+    """
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def _arrow():
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet 形式を使うには pyarrow をインストールしてください (pip install pyarrow)") from e
+        return pa, pq
+
+    @classmethod
+    def arrow_schema(cls, columns):
+        """型付きフレームの列に対応する Arrow スキーマを返します。"""
+        pa, _ = cls._arrow()
+        known = {
+            TIMESTAMP_COL: pa.timestamp('s'),
+            DATE_COL: pa.date32(),
+            WAKE_COUNT_COL: pa.int16(),
+        }
+        known.update({col: pa.int16() for col in TIME_COLS})
+        known.update({col: pa.int8() for col in SCORE_COLS})
+        return pa.schema([(c, known[c]) for c in columns if c in known])
+
+    def read(self, columns=None, start=None, end=None):
+        pa, pq = self._arrow()
+        filters = []
+        if start is not None:
+            filters.append((DATE_COL, '>=', pd.Timestamp(start).date()))
+        if end is not None:
+            filters.append((DATE_COL, '<=', pd.Timestamp(end).date()))
+        projection = None
+        if columns is not None:
+            available = pq.read_schema(self.path).names
+            projection = [c for c in available if c in columns or c == DATE_COL]
+        table = pq.read_table(self.path, columns=projection, filters=filters or None)
+        df = table.to_pandas(date_as_object=False)
+        # Arrow の整数列は欠損があると float になるので nullable 型に戻す
+        df = latest_per_date(to_typed_frame(df).astype({
+            c: 'Int16' for c in TIME_COLS if c in df.columns
+        }))
+        if columns is not None:
+            df = df[[c for c in df.columns if c in columns]]
+        return df
+
+    def write(self, df):
+        pa, pq = self._arrow()
+        typed = to_typed_frame(df)
+        schema = self.arrow_schema(typed.columns)
+        extra = [c for c in typed.columns if c not in schema.names]
+        table = pa.Table.from_pandas(typed[schema.names], schema=schema, preserve_index=False)
+        for col in extra:
+            table = table.append_column(col, pa.array(typed[col]))
+        pq.write_table(table, self.path)
+
+    def append(self, df):
+        """
+        行を追加します。Parquet ファイルは追記できないため既存の行と結合して
+        書き直します (ついでに同じ日付の古い行を取り除きます)。
+        呼び出し側は差分がある場合にのみ呼ぶ想定です。
+        """
+        _, pq = self._arrow()
+        if not os.path.exists(self.path):
+            self.write(df)
+            return
+        existing = to_typed_frame(pq.read_table(self.path).to_pandas(date_as_object=False))
+        self.write(latest_per_date(pd.concat([existing, to_typed_frame(df)], ignore_index=True)))
+
+
+def open_store(path):
+    """拡張子からバックエンドを選びます (.parquet / .pq → ParquetStore、それ以外は CsvStore)。"""
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        return ParquetStore(path)
+    return CsvStore(path)
+
+
+def migrate_csv_to_parquet(csv_path, parquet_path):
+    """既存の data_tent.csv 形式のファイルを Parquet に一括変換し、行数を返します。"""
+    df = CsvStore(csv_path).read()
+    ParquetStore(parquet_path).write(df)
+    return len(df)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="data_tent.csv を Parquet 形式に移行します。")
+    parser.add_argument('csv_path', nargs='?', default='data_tent.csv')
+    parser.add_argument('parquet_path', nargs='?', default='data_tent.parquet')
+    args = parser.parse_args()
+
+    n = migrate_csv_to_parquet(args.csv_path, args.parquet_path)
+    print(f"{n} 行を {args.parquet_path} に保存しました。")
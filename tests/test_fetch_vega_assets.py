@@ -0,0 +1,62 @@
+"""fetch_vega_assets のバージョン固定・SRI ハッシュの検証と、CDN へ黙って切り替えないことを確かめます。"""
+import functools
+import os
+import threading
+from http.server import SimpleHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+import fetch_vega_assets as fva
+
+
+@pytest.fixture
+def cdn(tmp_path, monkeypatch):
+    """VEGA_ASSETS のパスにダミーのビルドを置いたローカルの HTTP サーバーを CDN_BASE にします。"""
+    root = tmp_path / 'cdn'
+    for package, version, path, _ in fva.VEGA_ASSETS:
+        dest = root / f"{package}@{version}" / path
+        dest.parent.mkdir(parents=True)
+        dest.write_bytes(f"/* {package} {version} */".encode())
+    handler = functools.partial(SimpleHTTPRequestHandler, directory=str(root))
+    handler.log_message = lambda *args: None
+    httpd = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(fva, 'CDN_BASE', f"http://127.0.0.1:{httpd.server_address[1]}")
+    yield root
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def test_missing_assets_do_not_fall_back_to_cdn(tmp_path):
+    with pytest.raises(fva.MissingVegaAssets):
+        fva.asset_sources(str(tmp_path))
+    sources = fva.asset_sources(str(tmp_path), allow_cdn=True)
+    assert [s.local for s in sources] == [False] * 3
+    # CDN でも固定したバージョンを読む
+    for source, (package, version, _, _) in zip(sources, fva.VEGA_ASSETS):
+        assert f"/{package}@{version}/" in source.url
+
+
+def test_fetch_records_and_checks_integrity(tmp_path, cdn):
+    asset_dir = str(tmp_path / 'vega')
+    saved = fva.fetch_assets(asset_dir)
+    assert len(saved) == 3
+    assert fva.verify_assets(asset_dir) == {}
+
+    sources = fva.asset_sources(asset_dir)
+    assert [s.url for s in sources] == [f"{fva.STATIC_URL}/{f}" for _, _, _, f in fva.VEGA_ASSETS]
+    with open(os.path.join(asset_dir, 'vega.min.js'), 'rb') as f:
+        assert sources[0].integrity == fva.sri_hash(f.read())
+
+    # ロックファイルと異なるビルドは保存しない
+    package, version, path, filename = fva.VEGA_ASSETS[0]
+    (cdn / f"{package}@{version}" / path).write_bytes(b"/* tampered */")
+    with pytest.raises(ValueError):
+        fva.fetch_assets(asset_dir, force=True)
+    assert fva.verify_assets(asset_dir) == {}
+
+    # 配信中のファイルが書き換えられたら verify で分かる
+    with open(os.path.join(asset_dir, filename), 'wb') as f:
+        f.write(b"/* modified */")
+    assert fva.verify_assets(asset_dir) == {filename: "ハッシュが一致しません"}
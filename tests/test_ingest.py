@@ -0,0 +1,75 @@
+"""ingest.merge_upload が 日付 をキーに、新しい日付を追加し再回答で置き換えることを確かめます。"""
+import pandas as pd
+import pytest
+
+import ingest
+import storage
+
+ROWS = [
+    ['2025/12/24 11:45:12', '2025/12/08', '0:00:00', '7:00:00', '0:00:00', '2', '2', '3', ''],
+    ['2025/12/24 11:46:09', '2025/12/09', '0:00:00', '6:30:00', '0:00:00', '4', '2', '2', '0.0'],
+]
+
+
+def upload(rows):
+    return pd.DataFrame(rows, columns=storage.CSV_COLUMNS)
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = storage.CsvStore(str(tmp_path / 'data.csv'))
+    assert ingest.merge_upload(store, upload(ROWS)).inserted == 2
+    return store
+
+
+def test_new_dates_are_appended(store):
+    new = ['2025/12/25 08:00:00', '2025/12/10', '23:30:00', '7:15:00', '0:15:00', '3', '4', '1', '1.0']
+    result = ingest.merge_upload(store, upload(ROWS + [new]))
+    assert (result.inserted, result.updated, result.skipped) == (1, 0, 2)
+    df = store.read()
+    assert df[storage.DATE_COL].dt.strftime('%Y/%m/%d').tolist() == ['2025/12/08', '2025/12/09', '2025/12/10']
+    assert df.loc[2, '就寝時間'] == 23 * 60 + 30
+
+
+def test_reuploaded_date_is_replaced_only_by_a_newer_answer(store):
+    newer = ['2025/12/25 09:00:00', '2025/12/09', '1:00:00', '8:00:00', '0:00:00', '5', '5', '1', '2.0']
+    result = ingest.merge_upload(store, upload([newer]))
+    assert (result.inserted, result.updated, result.skipped) == (0, 1, 0)
+    df = store.read()
+    assert len(df) == 2
+    row = df[df[storage.DATE_COL] == pd.Timestamp('2025-12-09')].iloc[0]
+    assert (row['起床時間'], row['寝つきの良さ'], row[storage.WAKE_COUNT_COL]) == (8 * 60, 5, 2)
+
+    # 古い回答は同じ日付でも採用しない
+    older = ['2025/12/20 09:00:00', '2025/12/09', '2:00:00', '9:00:00', '0:00:00', '1', '1', '5', '3.0']
+    result = ingest.merge_upload(store, upload([older]))
+    assert (result.inserted, result.updated, result.skipped) == (0, 0, 1)
+    assert store.read().equals(df)
+
+
+def test_unchanged_upload_does_not_touch_the_file(store):
+    with open(store.path, 'rb') as f:
+        before = f.read()
+    result = ingest.merge_upload(store, upload(ROWS))
+    assert not result.changed
+    assert result.skipped == 2
+    with open(store.path, 'rb') as f:
+        assert f.read() == before
+
+
+def test_malformed_upload(store):
+    with open(store.path, 'rb') as f:
+        before = f.read()
+    # 解釈できない日付は取り込まず、ファイルも変えない
+    bad_date = ['2025/12/25 08:00:00', '2025-12-10', '23:30:00', '7:15:00', '0:00:00', '3', '4', '1', '1.0']
+    with pytest.raises(ValueError):
+        ingest.merge_upload(store, upload([bad_date]))
+    with open(store.path, 'rb') as f:
+        assert f.read() == before
+
+    # 数値でない評価・回数は欠測として取り込む
+    bad_score = ['2025/12/25 08:00:00', '2025/12/10', '23:30:00', '7:15:00', '0:00:00', 'よい', '4', '1', 'x']
+    assert ingest.merge_upload(store, upload([bad_score])).inserted == 1
+    row = store.read().iloc[-1]
+    assert pd.isna(row['寝つきの良さ']) and pd.isna(row[storage.WAKE_COUNT_COL])
+    assert row['寝起きの良さ'] == 4
@@ -0,0 +1,145 @@
+"""jma_backfill のレート制限と再試行を、障害を注入したローカルのサーバー (jma_stub_server) で確かめます。"""
+import datetime
+import email.utils
+import os
+
+import numpy as np
+import pytest
+
+import weather_store
+from jma_backfill import BackfillJob, TokenBucket, retry_after_seconds, unit_key
+from jma_stub_server import StubJMAServer, page_filename
+from scrape_jma_humidity import TOKYO, Station
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'jma')
+OSAKA = Station(62, 47772, "大阪")
+
+
+class FakeClock:
+    """TokenBucket に渡す時計。sleep() は時刻を進めるだけです。"""
+    def __init__(self):
+        self.now = 0.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, sec):
+        self.sleeps.append(sec)
+        self.now += sec
+
+
+@pytest.fixture
+def server():
+    with StubJMAServer(PAGES_DIR) as server:
+        yield server
+
+
+def make_job(tmp_path, server, **kwargs):
+    kwargs = {'rate': 100.0, 'workers': 2, 'max_retries': 3, 'backoff_base': 0.01, 'backoff_max': 0.05,
+              'seed': 0, **kwargs}
+    store = weather_store.open_weather_store(str(tmp_path / 'weather.csv'))
+    return BackfillJob(store, [TOKYO, OSAKA], (2025, 10), (2025, 12), str(tmp_path / 'checkpoint.json'),
+                       base_url=server.base_url, **kwargs)
+
+
+def test_retry_after_seconds():
+    now = 1_760_000_000.0
+    assert retry_after_seconds('3') == 3.0
+    assert retry_after_seconds('0.5') == 0.5
+    assert retry_after_seconds(email.utils.formatdate(now + 30, usegmt=True), now=now) == 30.0
+    # 過去の日時・解釈できない値・ヘッダーなしは待たない
+    assert retry_after_seconds(email.utils.formatdate(now - 30, usegmt=True), now=now) == 0.0
+    assert retry_after_seconds('soon') == 0.0
+    assert retry_after_seconds('-5') == 0.0
+    assert retry_after_seconds(None) == 0.0
+
+
+def test_token_bucket_spaces_requests():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=4, burst=2, clock=clock, sleep=clock.sleep)
+    clock.now = 10.0  # しばらく空いた後
+    times = []
+    for _ in range(6):
+        bucket.acquire()
+        times.append(clock.now)
+    # 最初の burst 件は待たずに送り、その後は 1/rate 秒ごと
+    assert times == pytest.approx([10.0, 10.0, 10.25, 10.5, 10.75, 11.0])
+    assert clock.sleeps == pytest.approx([0.25] * 4)
+
+
+def test_token_bucket_throttle_and_recover():
+    clock = FakeClock()
+    bucket = TokenBucket(rate=8, min_rate=1, clock=clock, sleep=clock.sleep)
+    for _ in range(5):
+        bucket.throttle()
+    assert bucket.rate == 1
+    for _ in range(30):
+        bucket.recover()
+    assert bucket.rate == 8
+
+
+def test_backfill_retries_and_records_failures(tmp_path, server):
+    # 10 月は 503 (Retry-After が HTTP-date) と 429 (秒数) の後に成功する。
+    # 12 月は UTF-8 として復号できないページ、大阪の 11 月は保存ページがない (404)
+    past = email.utils.formatdate(usegmt=True)
+    server.inject('daily_s1_44_47662_2025_10.html', 503, {'Retry-After': past})
+    server.inject('daily_s1_44_47662_2025_10.html', 429, {'Retry-After': '0.01'})
+    job = make_job(tmp_path, server)
+    units = [(TOKYO, 2025, 10), (TOKYO, 2025, 11), (TOKYO, 2025, 12), (OSAKA, 2025, 10), (OSAKA, 2025, 11)]
+
+    stats = job.run(units)
+
+    assert (stats['done'], stats['failed'], stats['retries']) == (3, 2, 2)
+    assert job.bucket.rate < job.bucket.max_rate  # 429/503 でレートを下げた
+    failed = job.checkpoint.failed
+    assert sorted(failed) == [unit_key(TOKYO, 2025, 12), unit_key(OSAKA, 2025, 11)]
+    assert failed[unit_key(TOKYO, 2025, 12)].startswith('UnicodeDecodeError')
+    assert failed[unit_key(OSAKA, 2025, 11)].startswith('HTTPError')
+    # 復号できないページと 404 は再試行しない
+    filenames = [page_filename(p) for p in server.paths]
+    assert filenames.count('daily_s1_44_47662_2025_12.html') == 1
+    assert filenames.count('daily_s1_62_47772_2025_11.html') == 1
+    assert filenames.count('daily_s1_44_47662_2025_10.html') == 3
+    assert stats['requests'] == server.requests == 7
+
+    stored = job.store.read(TOKYO)
+    assert len(stored) == 61
+    assert len(job.store.read(OSAKA)) == 31
+    assert not np.isnan(stored['Avg_Humidity'].to_numpy(dtype=float)).all()
+
+    # 再実行では失敗した単位だけを取り直す
+    resumed = make_job(tmp_path, server)
+    assert [u for u in units if not resumed.checkpoint.is_done(u)] == [(TOKYO, 2025, 12), (OSAKA, 2025, 11)]
+
+
+def test_backfill_rate_limit_against_server(tmp_path, server):
+    server.latency = 0.01
+    job = make_job(tmp_path, server, rate=20.0, workers=4)
+    units = [(TOKYO, 2025, 10), (TOKYO, 2025, 11), (OSAKA, 2025, 10)] * 2
+
+    stats = job.run(units)
+
+    assert stats['done'] == 6
+    gaps = np.diff(server.times)
+    # 4 スレッドで同時に取りに行っても、リクエストの間隔は 1/rate 秒 (多少の揺れを許す)
+    assert gaps.min() >= 0.04
+
+
+def test_backfill_refetches_open_months(tmp_path, server):
+    # 2025-12-15 時点では 11 月 (前月) と 12 月 (当月) はまだ変わりうる
+    today = datetime.date(2025, 12, 15)
+    job = make_job(tmp_path, server, today=today)
+    job.stations = [TOKYO]
+    assert job.plan() == [(TOKYO, 2025, 10), (TOKYO, 2025, 11), (TOKYO, 2025, 12)]
+    job.run()
+    assert sorted(job.checkpoint.done) == [unit_key(TOKYO, 2025, 10)]
+
+    # 2 回目は確定した 10 月だけを飛ばし、前月と当月は取り直す
+    again = make_job(tmp_path, server, today=today)
+    again.stations = [TOKYO]
+    assert again.plan() == [(TOKYO, 2025, 11), (TOKYO, 2025, 12)]
+    before = server.requests
+    again.run()
+    filenames = [page_filename(p) for p in server.paths[before:]]
+    assert sorted(filenames) == ['daily_s1_44_47662_2025_11.html', 'daily_s1_44_47662_2025_12.html']
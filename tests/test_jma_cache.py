@@ -0,0 +1,41 @@
+"""jma_cache.PageCache の確定した月の扱いを確かめます。"""
+import datetime
+import os
+import time
+
+from jma_cache import PageCache, month_closed_at
+from scrape_jma_humidity import TOKYO
+
+TODAY = datetime.date(2025, 12, 15)
+
+
+def cache_with_page(tmp_path, year, month, saved_at):
+    cache = PageCache(str(tmp_path), ttl_sec=3600, today=TODAY)
+    cache.put(TOKYO, year, month, "<html>page</html>")
+    path = os.path.join(str(tmp_path), cache._relpath(TOKYO, year, month, "daily"))
+    os.utime(path, (saved_at, saved_at))
+    return cache
+
+
+def test_month_closed_at():
+    assert month_closed_at(2025, 9) == time.mktime((2025, 11, 1, 0, 0, 0, 0, 0, -1))
+    assert month_closed_at(2025, 11) == time.mktime((2026, 1, 1, 0, 0, 0, 0, 0, -1))
+    assert month_closed_at(2025, 12) == time.mktime((2026, 2, 1, 0, 0, 0, 0, 0, -1))
+
+
+def test_closed_month_saved_after_closing_never_expires(tmp_path):
+    cache = cache_with_page(tmp_path, 2025, 9, month_closed_at(2025, 9) + 60)
+    assert cache.get(TOKYO, 2025, 9) == "<html>page</html>"
+
+
+def test_closed_month_saved_while_open_uses_ttl(tmp_path):
+    # 9 月の途中に保存したページは、9 月が確定した後も TTL を過ぎたら取得し直す
+    cache = cache_with_page(tmp_path, 2025, 9, time.mktime((2025, 9, 20, 12, 0, 0, 0, 0, -1)))
+    assert cache.get(TOKYO, 2025, 9) is None
+    assert cache.get(TOKYO, 2025, 9, allow_stale=True) == "<html>page</html>"
+    assert cache.stats()['stale'] == 1
+
+
+def test_open_month_uses_ttl(tmp_path):
+    assert cache_with_page(tmp_path, 2025, 11, time.time() - 60).get(TOKYO, 2025, 11) is not None
+    assert cache_with_page(tmp_path, 2025, 11, time.time() - 7200).get(TOKYO, 2025, 11) is None
@@ -0,0 +1,117 @@
+"""panel_builder のプロセス・スレッド・直列の各方式が同じ図を返し、キャッシュにある図は作り直さないことを確かめます。"""
+import os
+import pickle
+import threading
+
+import numpy as np
+import plotly.graph_objects as go
+import pytest
+
+import plotly.io as pio
+
+import charts
+import data_cache
+import figure_cache
+import panel_builder
+import sleep_debt
+import trend_tiers
+
+DATA_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data_tent.csv')
+CHARTS = [
+    ('weekly_bar', charts.create_weekly_bar_chart),
+    ('monthly_trend', charts.create_monthly_sleep_trend),
+    ('histogram', charts.create_sleep_histogram),
+    ('score_trend', charts.create_sleep_score_trend),
+]
+
+
+@pytest.fixture(scope='module')
+def timeline():
+    data = data_cache.read_dashboard_data(DATA_FILE)
+    fit = data_cache.sleep_fit_timeline(data, "23:30", "07:30")
+    return fit.between(fit.first_date + np.timedelta64(20, 'D'), fit.last_date)
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    figure_cache.clear_figures()
+    yield
+    figure_cache.clear_figures()
+
+
+@pytest.fixture(scope='module', autouse=True)
+def pool():
+    yield
+    panel_builder.shutdown_pool()
+
+
+def make_tasks(timeline, tag):
+    return [panel_builder.PanelTask(chart_id, (chart_id, tag, ()), build, (timeline,)) for chart_id, build in CHARTS]
+
+
+def as_json(figures):
+    # キャッシュから復元した図と比べられるよう、JSON を経由した形にそろえる
+    return {k: pio.from_json(fig.to_json(), skip_invalid=True).to_json() for k, fig in figures.items()}
+
+
+def test_timeline_slice_pickles_with_its_root(timeline):
+    copy = pickle.loads(pickle.dumps(timeline))
+    assert len(copy) == len(timeline)
+    # 端の週・月の集計は切り出す前のタイムラインで作るので、元と同じになる
+    for tier in trend_tiers.TIERS:
+        a = timeline.tiers.query('sleep_fit_score', tier, timeline.first_date, timeline.last_date)
+        b = copy.tiers.query('sleep_fit_score', tier, copy.first_date, copy.last_date)
+        np.testing.assert_array_equal(a.to_numpy(dtype=float), b.to_numpy(dtype=float))
+    assert copy.sleep_histogram().to_dict() == timeline.sleep_histogram().to_dict()
+
+
+def test_debt_ledger_pickles(timeline):
+    ledger = sleep_debt.DebtLedger(sleep_debt.DebtModel(7.5, 0.5, 14))
+    ledger.sync(timeline.frame['date_dt'], timeline.frame['sleep_duration_hour'])
+    copy = pickle.loads(pickle.dumps(ledger))
+    copy.append(timeline.last_date + np.timedelta64(1, 'D'), 6.0)
+    assert len(copy) == len(ledger) + 1
+    assert copy.between(end=timeline.last_date).equals(ledger.between())
+
+
+@pytest.mark.parametrize('executor, workers', [('process', 2), ('thread', 2)])
+def test_executors_build_the_same_figures(timeline, executor, workers):
+    serial, timing = panel_builder.build_panels(make_tasks(timeline, 'serial'), 1)
+    assert timing.executor == 'serial'
+    figures, timing = panel_builder.build_panels(make_tasks(timeline, executor), workers, executor)
+    assert (timing.executor, timing.workers, timing.cached) == (executor, workers, 0)
+    assert list(figures) == [chart_id for chart_id, _ in CHARTS]
+    assert as_json(figures) == as_json(serial)
+
+
+def test_cached_figures_are_not_rebuilt(timeline):
+    first, timing = panel_builder.build_panels(make_tasks(timeline, 'cached'), 2, 'process')
+    assert timing.cached == 0
+    assert figure_cache.cache_stats()['size'] == len(CHARTS)
+    again, timing = panel_builder.build_panels(make_tasks(timeline, 'cached'), 2, 'process')
+    assert timing.cached == len(CHARTS)
+    assert as_json(again) == as_json(first)
+
+
+def test_workers_use_the_callers_default_template(timeline, monkeypatch):
+    # Streamlit は import 時に既定のテンプレートを変えるので、ワーカーもそれに合わせる
+    monkeypatch.setattr(pio.templates, 'default', 'simple_white')
+    figures, _ = panel_builder.build_panels(make_tasks(timeline, 'template'), 2, 'process')
+    expected = pio.templates['simple_white'].layout.colorway
+    assert all(fig.layout.template.layout.colorway == expected for fig in figures.values())
+
+
+def test_thread_workers_serialize_the_figures(timeline, monkeypatch):
+    # 図の JSON への変換はワーカーで行い、メインスレッドはキャッシュに書くだけ
+    serialized_on = []
+    to_json = go.Figure.to_json
+
+    def recording_to_json(fig, *args, **kwargs):
+        serialized_on.append(threading.current_thread())
+        return to_json(fig, *args, **kwargs)
+
+    monkeypatch.setattr(go.Figure, 'to_json', recording_to_json)
+    panel_builder.build_panels(make_tasks(timeline, 'thread_json'), 2, 'thread')
+    assert len(serialized_on) == len(CHARTS)
+    assert threading.main_thread() not in serialized_on
+    assert figure_cache.cache_stats()['size'] == len(CHARTS)
@@ -0,0 +1,100 @@
+"""scrape_jma_humidity の並行取得を、保存ページを返すローカルのサーバー (jma_stub_server) で確かめます。"""
+import datetime
+import os
+import urllib.error
+
+import numpy as np
+import pytest
+
+import jma_parser
+from jma_stub_server import StubJMAServer
+from scrape_jma_humidity import TOKYO, JMAClient, Station, daily_page_path, fetch_hourly, fetch_months
+
+PAGES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures', 'jma')
+OSAKA = Station(62, 47772, "大阪")
+
+
+@pytest.fixture
+def server():
+    with StubJMAServer(PAGES_DIR) as server:
+        yield server
+
+
+def saved_table(station, year, month):
+    name = f"daily_s1_{station.prec_no}_{station.block_no}_{year}_{month}.html"
+    with open(os.path.join(PAGES_DIR, name), encoding='utf-8') as f:
+        return jma_parser.parse_daily_table(f.read(), year, month)
+
+
+def test_fetch_months_parses_saved_pages(server):
+    results = fetch_months([TOKYO, OSAKA], [(2025, 10)], max_workers=2, base_url=server.base_url,
+                           parse=jma_parser.parse_daily_table)
+    assert [(r.station, r.ok) for r in results] == [(TOKYO, True), (OSAKA, True)]
+    for r in results:
+        expected = saved_table(r.station, 2025, 10)
+        assert len(r.rows) == 31
+        np.testing.assert_array_equal(r.rows.values['Avg_Humidity'], expected.values['Avg_Humidity'])
+
+
+def test_errors_are_recorded_per_month(server):
+    # 11 月は正常、12 月は UTF-8 として復号できないページ、2026 年 1 月は保存ページがない (404)
+    results = fetch_months([TOKYO], [(2025, 11), (2025, 12), (2026, 1)], max_workers=3,
+                           base_url=server.base_url)
+    assert [r.ok for r in results] == [True, False, False]
+    assert results[1].error.startswith('UnicodeDecodeError')
+    assert results[2].error.startswith('HTTPError')
+    assert len(results[0].rows) > 0
+
+
+def test_parse_errors_are_recorded_per_month(server):
+    def parse(html_content, year, month):
+        if month == 10:
+            raise ValueError("表が見つかりません")
+        return jma_parser.parse_daily_table(html_content, year, month)
+
+    results = fetch_months([TOKYO], [(2025, 10), (2025, 11)], max_workers=1, base_url=server.base_url, parse=parse)
+    assert [r.ok for r in results] == [False, True]
+    assert results[0].error == "ValueError: 表が見つかりません"
+
+
+def test_one_worker_reuses_one_connection(server):
+    results = fetch_months([TOKYO, OSAKA], [(2025, 10)], max_workers=1, base_url=server.base_url)
+    assert all(r.ok for r in results)
+    assert server.requests == 2
+    assert server.connections == 1
+
+
+def test_client_keeps_connection_after_404(server):
+    client = JMAClient(server.base_url)
+    try:
+        with pytest.raises(urllib.error.HTTPError):
+            client.get(daily_page_path(TOKYO, 2030, 1))
+        assert '<table' in client.get(daily_page_path(TOKYO, 2025, 10))
+    finally:
+        client.close()
+    assert server.connections == 1
+
+
+def test_client_reconnects_after_timeout(server):
+    server.latency = 0.5
+    client = JMAClient(server.base_url, timeout=0.1)
+    try:
+        with pytest.raises(TimeoutError):
+            client.get(daily_page_path(TOKYO, 2025, 10))
+        assert client._conn is None
+        server.latency = 0.0
+        # 読みかけの接続を捨てて新しい接続で取り直すので、別の月のページが正しく返る
+        html_content = client.get(daily_page_path(TOKYO, 2025, 11))
+    finally:
+        client.close()
+    with open(os.path.join(PAGES_DIR, 'daily_s1_44_47662_2025_11.html'), encoding='utf-8') as f:
+        assert html_content == f.read()
+    assert server.connections == 2
+
+
+def test_fetch_hourly(server):
+    day = datetime.date(2025, 10, 1)
+    results = fetch_hourly([TOKYO], [day, datetime.date(2025, 10, 2)], max_workers=2, base_url=server.base_url)
+    assert [r.ok for r in results] == [True, False]
+    assert len(results[0].table) == 24
+    assert not np.isnan(results[0].table.values['Humidity']).any()
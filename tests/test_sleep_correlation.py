@@ -0,0 +1,76 @@
+"""sleep_correlation のラグ別・移動窓の相関を、np.corrcoef で 1 組ずつ求めた値と比べます。"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from sleep_correlation import RollingCorrelation, lag_correlations, lagged_weather, rolling_correlations
+
+LAGS = range(4)
+
+
+@pytest.fixture(scope='module')
+def frames():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2025-10-01', periods=60)
+    weather = pd.DataFrame({'Date': dates, 'Avg_Humidity': rng.normal(65, 10, 60),
+                            'Avg_Temperature': rng.normal(18, 5, 60)})
+    weather.loc[[5, 17, 40], 'Avg_Humidity'] = np.nan
+    # 睡眠は気象より 2 日遅く始まり、1 晩抜けている
+    sleep_dates = dates[2:].delete(10)
+    sleep = pd.DataFrame({'Date': sleep_dates,
+                          'sleep_duration_hour': rng.normal(7, 1, len(sleep_dates)),
+                          'wake_quality': rng.integers(1, 6, len(sleep_dates)).astype(float)})
+    sleep.loc[[3, 30], 'sleep_duration_hour'] = np.nan
+    return sleep, weather
+
+
+def direct_corr(sleep, weather, sleep_col, weather_col, lag):
+    shifted = weather.assign(Date=weather['Date'] + pd.Timedelta(days=lag))
+    pairs = sleep[['Date', sleep_col]].merge(shifted[['Date', weather_col]], on='Date').dropna()
+    return np.corrcoef(pairs[sleep_col], pairs[weather_col])[0, 1], len(pairs)
+
+
+def test_lag_correlations_match_corrcoef(frames):
+    sleep, weather = frames
+    sleep_cols, weather_cols = ['sleep_duration_hour', 'wake_quality'], ['Avg_Humidity', 'Avg_Temperature']
+    result = lag_correlations(sleep, weather, sleep_cols, weather_cols, LAGS)
+    for k, lag in enumerate(LAGS):
+        for i, sleep_col in enumerate(sleep_cols):
+            for j, weather_col in enumerate(weather_cols):
+                r, n = direct_corr(sleep, weather, sleep_col, weather_col, lag)
+                assert result.r[k, i, j] == pytest.approx(r)
+                assert result.n[k, i, j] == n
+                assert result.ci_low[k, i, j] < r < result.ci_high[k, i, j]
+
+
+def test_nat_sleep_dates_are_left_as_nan(frames):
+    sleep, weather = frames
+    dates = sleep['Date'].copy()
+    dates.iloc[7] = pd.NaT
+    lagged = lagged_weather(dates, weather, ['Avg_Temperature'], LAGS)
+    assert np.isnan(lagged[:, 7]).all()
+    expected = lagged_weather(sleep['Date'], weather, ['Avg_Temperature'], LAGS)
+    np.testing.assert_array_equal(np.delete(lagged, 7, axis=1), np.delete(expected, 7, axis=1))
+
+    result = lag_correlations(sleep.assign(Date=dates), weather, ['wake_quality'], ['Avg_Temperature'], LAGS)
+    assert np.isfinite(result.r).all()
+
+
+def test_rolling_correlation_append_matches_rolling_correlations(frames):
+    _, weather = frames
+    rng = np.random.default_rng(1)
+    # 晩は日付の抜けなく渡す (RollingCorrelation のラグは渡した晩の数で数える)
+    x = np.column_stack([weather['Avg_Humidity'] * 0.1 + rng.normal(0, 1, len(weather)),
+                         rng.normal(7, 1, len(weather))])
+    x[[4, 20], 0] = np.nan
+    weather_cols = ['Avg_Humidity', 'Avg_Temperature']
+    window = 14
+    # 気象は睡眠と同じ日から始まるので、それより前の日は欠測
+    expected = [rolling_correlations(x, y, window) for y in lagged_weather(weather['Date'], weather, weather_cols, LAGS)]
+
+    rc = RollingCorrelation(window, 2, 2, LAGS)
+    for t, weather_row in enumerate(weather[weather_cols].to_numpy()):
+        rc.append(x[t], weather_row)
+        for k in range(len(LAGS)):
+            np.testing.assert_allclose(rc.r[k], expected[k][t], atol=1e-9)
+    assert rc.n[0].max() <= window
@@ -0,0 +1,62 @@
+"""data_cache.sleep_debt_ledger がファイル・バージョンごとに独立した負債を返すことを確かめます。"""
+import numpy as np
+import pandas as pd
+import pytest
+
+import batch_report
+import data_cache
+import sleep_debt
+
+
+def write_data(path, hours):
+    dates = pd.date_range('2025-01-01', periods=len(hours), freq='D')
+    # 07:00 に寝て hours 時間後に起きる (NaN は起床時間の欠損)
+    wake = [None if np.isnan(h) else f"{int(7 + h) % 24}:{int(round((h % 1) * 60)):02d}:00" for h in hours]
+    pd.DataFrame({
+        'タイムスタンプ': dates.strftime('%Y/%m/%d 12:00:00'),
+        '日付': dates.strftime('%Y/%m/%d'),
+        '就寝時間': '7:00:00',
+        '起床時間': wake,
+    }).to_csv(path, index=False)
+
+
+@pytest.fixture(autouse=True)
+def empty_caches():
+    data_cache.clear_caches()
+    yield
+    data_cache.clear_caches()
+
+
+def test_ledgers_are_per_file(tmp_path):
+    model = sleep_debt.DebtModel(target_hours=7.5, repayment=1.0)
+    short, long = tmp_path / 'short.csv', tmp_path / 'long.csv'
+    write_data(short, [5.0, 5.0, 5.0])
+    write_data(long, [9.0, 9.0, 9.0])
+    a = data_cache.sleep_debt_ledger(data_cache.load_dashboard_data(str(short)), model)
+    b = data_cache.sleep_debt_ledger(data_cache.load_dashboard_data(str(long)), model)
+    assert a.latest == pytest.approx(7.5)
+    assert b.latest == 0
+    # 別のファイルを同期しても、先に返した ledger は変わらない
+    assert a.latest == pytest.approx(7.5)
+    assert data_cache.sleep_debt_ledger(data_cache.load_dashboard_data(str(short)), model) is a
+
+
+def test_new_version_does_not_change_returned_ledger(tmp_path):
+    path = tmp_path / 'user.csv'
+    write_data(path, [6.5, 6.5])
+    old = data_cache.sleep_debt_ledger(data_cache.load_dashboard_data(str(path)), sleep_debt.LEGACY_MODEL)
+    write_data(path, [6.5, 6.5, 4.5])
+    new = data_cache.sleep_debt_ledger(data_cache.load_dashboard_data(str(path)), sleep_debt.LEGACY_MODEL)
+    assert len(old) == 2 and len(new) == 3
+    assert old.latest == pytest.approx(1.0) and new.latest == pytest.approx(3.0)
+
+
+def test_batch_summary_uses_the_same_model(tmp_path):
+    path = tmp_path / 'user.csv'
+    write_data(path, [6.0, np.nan, 8.0, 5.5])
+    data = data_cache.load_dashboard_data(str(path))
+    model = sleep_debt.DebtModel(target_hours=7.0, repayment=0.5, half_life_days=7)
+    ledger = data_cache.sleep_debt_ledger(data, model)
+    report = batch_report.summarize(data.timeline, model)['sleep_debt']
+    assert report['latest'] == pytest.approx(ledger.latest, abs=1e-4)
+    assert report['total'] == pytest.approx(ledger.between()['debt'].sum(), abs=1e-4)
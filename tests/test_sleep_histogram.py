@@ -0,0 +1,47 @@
+"""sleep_histogram.HistogramIndex の期間・曜日の集計を、晩を直接数えた結果と比べます。"""
+import numpy as np
+import pandas as pd
+import pytest
+
+from sleep_histogram import BinnedHistogram, HistogramIndex
+
+
+@pytest.fixture(scope='module')
+def nights():
+    rng = np.random.default_rng(0)
+    dates = pd.date_range('2025-10-01', '2026-02-28')
+    values = rng.normal(7, 1, len(dates))
+    return dates, values
+
+
+def expected(dates, values, start, end, weekdays=None):
+    mask = (dates >= pd.Timestamp(start)) & (dates <= pd.Timestamp(end))
+    if weekdays is not None:
+        mask &= np.isin(dates.weekday, weekdays)
+    return BinnedHistogram().add(values[mask])
+
+
+def test_range_within_one_month_from_the_first(nights):
+    # 月の 1 日から始まり同じ月の途中で終わる期間 (回帰テスト)
+    dates, values = nights
+    hist = HistogramIndex(dates, values).histogram('2025-12-01', '2025-12-15')
+    assert hist.n == 15
+    assert hist.to_dict() == expected(dates, values, '2025-12-01', '2025-12-15').to_dict()
+
+
+@pytest.mark.parametrize('start, end', [
+    ('2025-12-01', '2025-12-31'),   # 月全体
+    ('2025-12-10', '2025-12-31'),   # 月の途中から月末
+    ('2025-12-10', '2025-12-20'),   # 月の途中だけ
+    ('2025-12-01', '2025-12-01'),
+    ('2025-10-15', '2026-01-10'),   # 端の月 + 内側の月
+    ('2025-11-01', '2026-01-31'),
+    ('2025-11-30', '2025-12-01'),
+])
+@pytest.mark.parametrize('weekdays', [None, [5, 6]])
+def test_matches_direct_count(nights, start, end, weekdays):
+    dates, values = nights
+    hist = HistogramIndex(dates, values).histogram(start, end, weekdays)
+    want = expected(dates, values, start, end, weekdays)
+    assert hist.n == want.n
+    assert hist.to_dict() == want.to_dict()
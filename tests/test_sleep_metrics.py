@@ -0,0 +1,120 @@
+"""sleep_metrics (ベクトル化版) と dashboard の行ごとの参照実装が一致することを確かめます。"""
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dashboard
+import sleep_metrics
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGET_WINDOWS = [("23:30", "07:30"), ("22:00", "06:00"), ("01:00", "09:00"), ("13:00", "15:00")]
+
+# 日付をまたぐ晩・就寝と起床が同じ時刻・欠損・正午ちょうど・秒つき・H:MM 形式
+EDGE_ROWS = pd.DataFrame({
+    '就寝時間': ['23:30:00', '1:15:00', '7:00:00', '12:00:00', None, '22:00:00', '23:59:59', '0:00:00', None],
+    '起床時間': ['7:00:00', '9:45:00', '7:00:00', '11:59:00', '7:00:00', None, '0:00:01', '0:00:00', None],
+})
+
+
+def real_rows():
+    return pd.read_csv(os.path.join(REPO_DIR, 'data_tent.csv'))[['就寝時間', '起床時間']]
+
+
+def random_rows(n=500, seed=0):
+    rng = np.random.default_rng(seed)
+    minutes = rng.integers(0, sleep_metrics.DAY_MIN, size=(n, 2))
+    clock = [f"{m // 60}:{m % 60:02d}:00" for m in minutes.ravel()]
+    return pd.DataFrame({'就寝時間': clock[0::2], '起床時間': clock[1::2]})
+
+
+def reference_durations(df):
+    return df.apply(dashboard.calculate_sleep_duration, axis=1).astype(float).to_numpy()
+
+
+def reference_scores(df, target_start, target_end):
+    return df.apply(dashboard.calculate_sleep_fit_score, axis=1,
+                    args=(target_start, target_end)).astype(float).to_numpy()
+
+
+@pytest.mark.parametrize('rows', [real_rows, random_rows, lambda: EDGE_ROWS])
+def test_durations_match_reference(rows):
+    df = rows()
+    bed_sec, wake_sec = sleep_metrics.parse_sleep_times(df)
+    np.testing.assert_allclose(sleep_metrics.sleep_duration_hours(bed_sec, wake_sec),
+                               reference_durations(df), equal_nan=True)
+
+
+@pytest.mark.parametrize('target_start, target_end', TARGET_WINDOWS)
+@pytest.mark.parametrize('rows', [real_rows, random_rows, lambda: EDGE_ROWS])
+def test_fit_scores_match_reference(rows, target_start, target_end):
+    df = rows()
+    scores = sleep_metrics.add_sleep_metrics(df, target_start, target_end)['sleep_fit_score']
+    np.testing.assert_allclose(scores, reference_scores(df, target_start, target_end))
+
+
+def test_equal_bed_and_wake():
+    # 睡眠時間は 0 時間、適合スコアは 24 時間眠ったものとして計算する (参照実装と同じ)
+    df = pd.DataFrame({'就寝時間': ['7:00:00'], '起床時間': ['7:00:00']})
+    out = sleep_metrics.add_sleep_metrics(df)
+    assert out['sleep_duration_hour'].iloc[0] == 0
+    # 07:00〜翌 07:00 のうち目標 23:30〜07:30 と重なるのは 07:00〜07:30 の 30 分
+    assert out['sleep_fit_score'].iloc[0] == pytest.approx(100 * 30 / 1440)
+    assert out['sleep_fit_score'].iloc[0] == pytest.approx(reference_scores(df, "23:30", "07:30")[0])
+
+
+@pytest.mark.parametrize('bad', ['25:00:00', '7:60:00', 'abc'])
+def test_invalid_times_are_missing(bad):
+    # 解析できない時刻は欠損と同じ扱い: 睡眠時間は NaN、適合スコアは 00:00 として計算する。
+    # 参照実装の hhmm_to_min は '25:00:00' を 1500 分として計算するため、ここだけ結果が異なる
+    df = pd.DataFrame({'就寝時間': [bad, None], '起床時間': ['7:00:00', '7:00:00']})
+    out = sleep_metrics.add_sleep_metrics(df)
+    assert out['sleep_duration_hour'].isna().all()
+    assert out['sleep_fit_score'].iloc[0] == out['sleep_fit_score'].iloc[1]
+
+
+def brute_force_mean(bed_min, wake_min, ts, te):
+    # 1 晩ずつ区間の重なりを数える (FitScoreIndex の累積和を使わない)
+    total = 0.0
+    for bed, wake in zip(bed_min, wake_min):
+        bs = bed + sleep_metrics.DAY_MIN if bed < sleep_metrics.NOON_MIN else bed
+        we = wake + sleep_metrics.DAY_MIN if wake < sleep_metrics.NOON_MIN else wake
+        if we <= bs:
+            we += sleep_metrics.DAY_MIN
+        total += min(100.0, max(0, min(we, te) - max(bs, ts)) / (we - bs) * 100)
+    return total / len(bed_min)
+
+
+@pytest.fixture(scope='module')
+def index_nights():
+    rng = np.random.default_rng(1)
+    bed = (23 * 60 + rng.integers(-120, 120, 40)) % sleep_metrics.DAY_MIN
+    wake = (bed + rng.integers(5 * 60, 9 * 60, 40)) % sleep_metrics.DAY_MIN
+    # 就寝と起床が同じ時刻 (24 時間とみなす) の晩も含める
+    bed[0] = wake[0] = 7 * 60
+    return bed, wake
+
+
+@pytest.mark.parametrize('target_start, target_end', TARGET_WINDOWS)
+def test_fit_score_index_matches_brute_force(index_nights, target_start, target_end):
+    bed, wake = index_nights
+    index = sleep_metrics.FitScoreIndex(bed, wake)
+    np.testing.assert_allclose(index.scores(target_start, target_end),
+                               sleep_metrics.sleep_fit_scores(bed, wake, target_start, target_end))
+    ts, te = sleep_metrics.target_window_minutes(target_start, target_end)
+    assert index.mean_score(target_start, target_end) == pytest.approx(brute_force_mean(bed, wake, ts, te))
+
+
+@pytest.mark.parametrize('length_min, step', [(480, 1), (420, 15), (90, 5)])
+def test_optimal_window_matches_brute_force(index_nights, length_min, step):
+    bed, wake = index_nights
+    start, end, score = sleep_metrics.FitScoreIndex(bed, wake).optimal_window(length_min, step)
+    starts = range(sleep_metrics.NOON_MIN, sleep_metrics.NOON_MIN + sleep_metrics.DAY_MIN, step)
+    means = [brute_force_mean(bed, wake, ts, ts + length_min) for ts in starts]
+    assert score == pytest.approx(max(means))
+    # 同点の窓があってもよいよう、返した窓のスコアを直接確かめる
+    ts, te = sleep_metrics.target_window_minutes(start, end)
+    assert te - ts == length_min
+    assert brute_force_mean(bed, wake, ts, te) == pytest.approx(max(means))
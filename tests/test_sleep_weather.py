@@ -0,0 +1,53 @@
+"""sleep_weather.shared_view が睡眠ファイルの変更 (追加・削除・日付の修正) をビューに反映することを確かめます。"""
+import pandas as pd
+import pytest
+
+import sleep_weather
+
+
+def write_sleep(path, dates, hours):
+    pd.DataFrame({'Date': dates, 'Hours': hours}).to_csv(path, index=False)
+
+
+def write_weather(path):
+    dates = pd.date_range('2025-10-01', '2025-10-10')
+    pd.DataFrame({'Date': dates.strftime('%Y-%m-%d'), 'Avg_Humidity': range(50, 60)}).to_csv(path, index=False)
+
+
+@pytest.fixture
+def files(tmp_path):
+    sleep_path, weather_path = tmp_path / 'sleep.csv', tmp_path / 'weather.csv'
+    write_weather(weather_path)
+    return str(sleep_path), str(weather_path)
+
+
+def view_of(name, sleep_path, weather_path):
+    return sleep_weather.shared_view(
+        name, sleep_path, lambda: pd.read_csv(sleep_path, parse_dates=['Date']),
+        weather_path, lambda: pd.read_csv(weather_path, parse_dates=['Date']),
+        columns=['Avg_Humidity'])
+
+
+def test_reload_drops_removed_and_redated_nights(files, request):
+    sleep_path, weather_path = files
+    name = request.node.name
+    write_sleep(sleep_path, ['2025-10-01', '2025-10-02', '2025-10-03'], [7.0, 6.5, 8.0])
+    view = view_of(name, sleep_path, weather_path)
+    assert view.frame['Date'].dt.day.tolist() == [1, 2, 3]
+
+    # 10/2 を削除し、10/3 の晩を 10/4 に直して、10/5 を追加する
+    write_sleep(sleep_path, ['2025-10-01', '2025-10-04', '2025-10-05'], [7.5, 8.0, 6.0])
+    view = view_of(name, sleep_path, weather_path)
+
+    frame = view.frame
+    assert frame['Date'].dt.day.tolist() == [1, 4, 5]
+    assert frame['Hours'].tolist() == [7.5, 8.0, 6.0]
+    assert frame['Avg_Humidity'].tolist() == [50, 53, 54]
+
+
+def test_add_sleep_keeps_existing_rows(files):
+    sleep_path, weather_path = files
+    view = sleep_weather.SleepWeatherView(pd.read_csv(weather_path, parse_dates=['Date']), columns=['Avg_Humidity'])
+    view.add_sleep(pd.DataFrame({'Date': pd.to_datetime(['2025-10-01', '2025-10-02']), 'Hours': [7.0, 6.0]}))
+    view.add_sleep(pd.DataFrame({'Date': pd.to_datetime(['2025-10-02', '2025-10-03']), 'Hours': [6.5, 8.0]}))
+    assert view.frame['Hours'].tolist() == [7.0, 6.5, 8.0]
@@ -0,0 +1,44 @@
+"""SleepTimeline の集計 (tiers) と索引 (histograms) の共有を確かめます。"""
+import numpy as np
+import pandas as pd
+
+from timeline import SleepTimeline
+from trend_tiers import trend_points
+
+
+def make_timeline(n=400):
+    dates = pd.date_range('2024-01-01', periods=n, freq='D')
+    hours = 6 + (np.arange(n) % 7) * 0.5
+    return SleepTimeline(pd.DataFrame({'date_dt': dates, 'sleep_duration_hour': hours}))
+
+
+def test_between_builds_nothing_and_shares_root():
+    timeline = make_timeline()
+    part = timeline.between('2024-02-01', '2024-03-31')
+    assert timeline._tiers is None and timeline._histograms is None
+    assert part.tiers is timeline.tiers
+    assert part._histograms_index() is timeline._histograms_index()
+    assert part.between('2024-02-10', '2024-02-20').tiers is timeline.tiers
+
+
+def test_with_column_shares_other_columns():
+    timeline = make_timeline()
+    timeline.tiers.query('sleep_duration_hour', 'daily')
+    index = timeline._histograms_index()
+    scored = timeline.with_column('sleep_fit_score', np.linspace(0, 100, len(timeline)))
+    assert scored.tiers._column('sleep_duration_hour') is timeline.tiers._column('sleep_duration_hour')
+    assert scored.between('2024-02-01', '2024-02-29')._histograms_index() is index
+
+    points, tier = trend_points(scored.between('2024-02-01', '2024-02-29'), 'sleep_fit_score')
+    assert tier == 'daily' and len(points) == 29
+    assert points['mean'].iloc[0] == scored.frame['sleep_fit_score'].iloc[31]
+
+
+def test_with_column_replacing_duration_rebuilds_it():
+    timeline = make_timeline()
+    timeline._histograms_index()
+    doubled = timeline.with_column('sleep_duration_hour', timeline.frame['sleep_duration_hour'] * 2)
+    assert doubled._histograms_index() is not timeline._histograms_index()
+    assert doubled.sleep_histogram().mean == 2 * timeline.sleep_histogram().mean
+    assert (doubled.tiers.query('sleep_duration_hour', 'monthly')['mean']
+            == 2 * timeline.tiers.query('sleep_duration_hour', 'monthly')['mean']).all()
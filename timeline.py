@@ -0,0 +1,132 @@
+import threading
+
+import numpy as np
+import pandas as pd
+
+from sleep_histogram import BinnedHistogram, HistogramIndex
+from trend_tiers import TrendTiers
+
+
+class SleepTimeline:
+    """
+    date_dt でソート済みのフレーム。期間の切り出しは二分探索 (O(log n)) で行い、
+    再ソートはしません。ソートはデータのバージョンごとに from_frame() で一度だけ行います。
+
+    date_dt 列がないフレームはファイルの行順をそのまま時系列とみなします。
+    日・週・月の集計 (tiers) と睡眠時間のヒストグラムの索引 (histograms) は最初に参照されたときに
+    元のタイムライン (root) で作り、between() で切り出したタイムラインはそれを共有します。
+    with_column() で列を足したタイムラインも、その列以外の集計と索引を元のものと共有します。
+    """
+    def __init__(self, frame, tiers=None, histograms=None, root=None):
+        self.frame = frame
+        if 'date_dt' in frame.columns:
+            self._dates = frame['date_dt'].to_numpy()
+        else:
+            self._dates = None
+        self._tiers = tiers
+        self._histograms = histograms
+        self._root = self if root is None else root  # 集計・索引を持つ、切り出す前のタイムライン
+        self._histograms_base = None  # 索引を共有する with_column() の元
+        # tiers / histograms の遅延作成用 (パネルはワーカースレッドから並行して参照する)
+        self._lock = threading.Lock()
+
+    def __getstate__(self):
+        # ワーカープロセスへ渡すとき。ロックと作成済みの集計・索引は送らず、受け取った側で必要になったら作る
+        return {'frame': self.frame, 'root': None if self._root is self else self._root}
+
+    def __setstate__(self, state):
+        self.__init__(state['frame'], root=state['root'])
+
+    @classmethod
+    def from_frame(cls, frame):
+        """フレームを date_dt で (安定) ソートしてタイムラインを作ります。"""
+        if 'date_dt' in frame.columns:
+            frame = frame.sort_values('date_dt', kind='stable').reset_index(drop=True)
+        return cls(frame)
+
+    def __len__(self):
+        return len(self.frame)
+
+    @property
+    def has_dates(self):
+        return self._dates is not None
+
+    @property
+    def first_date(self):
+        return pd.Timestamp(self._dates[0]) if self.has_dates and len(self) else None
+
+    @property
+    def last_date(self):
+        return pd.Timestamp(self._dates[-1]) if self.has_dates and len(self) else None
+
+    def _position(self, date, side):
+        return int(np.searchsorted(self._dates, np.datetime64(pd.Timestamp(date)), side=side))
+
+    def between(self, start=None, end=None):
+        """[start, end] (両端を含む) の期間を切り出したタイムラインを返します。"""
+        if not self.has_dates:
+            return self
+        i = 0 if start is None else self._position(start, 'left')
+        j = len(self) if end is None else self._position(end, 'right')
+        return SleepTimeline(self.frame.iloc[i:j], root=self._root)
+
+    def last_days(self, days, end=None):
+        """end (省略時は最終日) までの直近 days 日間 (暦日) を返します。"""
+        if not self.has_dates or not len(self):
+            return self
+        end = self.last_date if end is None else pd.Timestamp(end)
+        return self.between(end - pd.Timedelta(days=days - 1), end)
+
+    def last_nights(self, n):
+        """末尾 n 行 (直近 n 晩) のフレームを返します。"""
+        return self.frame.iloc[max(0, len(self) - n):]
+
+    @property
+    def tiers(self):
+        """日・週・月の集計 (trend_tiers.TrendTiers)。列ごとに最初に参照されたときに作ります。"""
+        root = self._root
+        if root is not self:
+            return root.tiers
+        with self._lock:
+            if self._tiers is None and self.has_dates:
+                self._tiers = TrendTiers(self._dates, self.frame)
+        return self._tiers
+
+    def _histograms_index(self):
+        root = self._root
+        if root is not self:
+            return root._histograms_index()
+        with self._lock:
+            if self._histograms is None and self._histograms_base is not None:
+                self._histograms = self._histograms_base._histograms_index()
+            if self._histograms is None and self.has_dates and 'sleep_duration_hour' in self.frame.columns:
+                self._histograms = HistogramIndex(self._dates, self.frame['sleep_duration_hour'])
+        return self._histograms
+
+    def sleep_histogram(self, weekdays=None):
+        """
+        この期間の睡眠時間のヒストグラム (sleep_histogram.BinnedHistogram) を返します。
+        日付のあるタイムラインは共有の索引から期間・曜日で切り出します。
+        """
+        index = self._histograms_index()
+        if index is None:
+            values = self.frame['sleep_duration_hour'] if 'sleep_duration_hour' in self.frame.columns else []
+            return BinnedHistogram().add(values)
+        if not len(self):
+            return BinnedHistogram()
+        return index.histogram(self.first_date, self.last_date, weekdays)
+
+    def with_column(self, name, values):
+        """
+        列を追加したタイムラインを返します (並び順は同じなので再ソートしません)。
+        切り出す前のタイムラインでは、name 以外の列の集計と索引を共有します。
+        切り出したタイムラインの列は期間内の値しかないので、集計は新しく作ります。
+        """
+        frame = self.frame.assign(**{name: values})
+        if self._root is not self:
+            return SleepTimeline(frame)
+        tiers = self.tiers.with_source(frame, name) if self.has_dates else None
+        timeline = SleepTimeline(frame, tiers=tiers)
+        if name != 'sleep_duration_hour':
+            timeline._histograms_base = self
+        return timeline
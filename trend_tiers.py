@@ -0,0 +1,220 @@
+"""
+長期間の推移グラフ用の事前集計 (日・週・月) と間引きです。
+
+    tiers = TrendTiers(timeline.frame['date_dt'], timeline.frame)
+    tiers.query('sleep_duration_hour', 'weekly', start, end)   # 週ごとの mean / min / max / count
+    points, tier = trend_points(timeline, 'sleep_duration_hour')  # 期間に合った粒度の点 (max_points 点以内)
+
+集計は (合計, 件数, 最小, 最大) で持つので、新しい晩を add() したときはその晩の
+集計を既存の集計に足し合わせるだけで済みます (同じ区間どうしを合計・件数は足し、最小・最大はとる)。
+列ごとの集計は最初に参照されたときに作ります。
+
+trend_points() は期間の日数から粒度を選びます。
+  - 日数 <= max_points                : 晩ごとの値 (daily)
+  - 日数 <= LTTB_FACTOR * max_points  : 晩ごとの値を LTTB で max_points 点に間引く (形を保つ)
+  - 週数 <= max_points                : 週ごとの平均と最小・最大 (weekly)
+  - それ以上                          : 月ごとの平均と最小・最大 (monthly)
+"""
+import threading
+
+import numpy as np
+import pandas as pd
+
+TIERS = ('daily', 'weekly', 'monthly')
+MAX_POINTS = 400
+LTTB_FACTOR = 3
+
+
+def bucket_keys(days, tier):
+    """1970-01-01 からの日数を、その日が属する区間の開始日 (日数) に変換します。週は月曜始まりです。"""
+    days = np.asarray(days, dtype=np.int64)
+    if tier == 'daily':
+        return days
+    if tier == 'weekly':
+        # 1970-01-01 は木曜日なので、(days + 3) % 7 が月曜からの日数
+        return days - (days + 3) % 7
+    if tier == 'monthly':
+        months = days.astype('datetime64[D]').astype('datetime64[M]')
+        return months.astype('datetime64[D]').astype(np.int64)
+    raise ValueError(f"tier は {TIERS} のいずれかです: {tier}")
+
+
+def _aggregate(keys, sums, counts, mins, maxs):
+    """同じ区間の (合計, 件数, 最小, 最大) をまとめます。keys の順は問いません。"""
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    if not len(keys):
+        return keys, sums, counts, mins, maxs
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]])
+    return (keys[starts],
+            np.add.reduceat(sums[order], starts),
+            np.add.reduceat(counts[order], starts),
+            np.fmin.reduceat(mins[order], starts),
+            np.fmax.reduceat(maxs[order], starts))
+
+
+class _Tier:
+    """1 列・1 粒度分の集計。区間の開始日 (昇順) ごとの合計・件数・最小・最大。"""
+    def __init__(self):
+        self.keys = np.empty(0, dtype=np.int64)
+        self.sums = np.empty(0)
+        self.counts = np.empty(0, dtype=np.int64)
+        self.mins = np.empty(0)
+        self.maxs = np.empty(0)
+
+    def add(self, keys, values):
+        valid = ~np.isnan(values)
+        keys, values = keys[valid], values[valid]
+        (self.keys, self.sums, self.counts, self.mins, self.maxs) = _aggregate(
+            np.concatenate([self.keys, keys]),
+            np.concatenate([self.sums, values]),
+            np.concatenate([self.counts, np.ones(len(keys), dtype=np.int64)]),
+            np.concatenate([self.mins, values]),
+            np.concatenate([self.maxs, values]))
+
+    def frame(self, start=None, end=None):
+        """開始日が [start, end] の区間を二分探索で切り出します (start / end は日数)。"""
+        lo = 0 if start is None else np.searchsorted(self.keys, start, 'left')
+        hi = len(self.keys) if end is None else np.searchsorted(self.keys, end, 'right')
+        return pd.DataFrame({
+            'date': self.keys[lo:hi].astype('datetime64[D]').astype('datetime64[ns]'),
+            'mean': self.sums[lo:hi] / self.counts[lo:hi],
+            'min': self.mins[lo:hi],
+            'max': self.maxs[lo:hi],
+            'count': self.counts[lo:hi],
+        })
+
+
+def _day_numbers(dates):
+    return pd.DatetimeIndex(dates).to_numpy().astype('datetime64[D]').astype(np.int64)
+
+
+class TrendTiers:
+    """
+    列ごとの日・週・月の集計。dates と source (同じ行順のフレーム) から、
+    列が最初に query() されたときに集計を作ります。日付が欠損した行は集計しません。
+    """
+    def __init__(self, dates=None, source=None):
+        self._days = None if dates is None else _day_numbers(dates)
+        self._source = source
+        self._tiers = {}  # 列名 -> {粒度: _Tier}
+        self._base = None  # with_source() の元 (置き換えた列以外の集計を共有する)
+        self._replaced = None
+        self._lock = threading.RLock()  # 複数のスレッドから参照されても列の集計は一度だけ作る
+
+    def _column(self, column):
+        with self._lock:
+            tiers = self._tiers.get(column)
+            if tiers is None:
+                if self._base is not None and column != self._replaced:
+                    tiers = self._base._column(column)
+                else:
+                    tiers = {tier: _Tier() for tier in TIERS}
+                    if self._source is not None and column in self._source.columns:
+                        self._add_to(tiers, self._days, self._source[column].to_numpy(dtype=float, na_value=np.nan))
+                self._tiers[column] = tiers
+            return tiers
+
+    def with_source(self, source, column):
+        """
+        source (同じ行順で column を追加・置換したフレーム) の TrendTiers を返します。
+        column だけを source から集計し、ほかの列の集計は self と共有します (どちらも参照時に作る)。
+        """
+        tiers = TrendTiers(source=source)
+        tiers._days = self._days
+        tiers._base, tiers._replaced = self, column
+        return tiers
+
+    @staticmethod
+    def _add_to(tiers, days, values):
+        valid = days != np.iinfo(np.int64).min  # NaT
+        for tier, agg in tiers.items():
+            agg.add(bucket_keys(days[valid], tier), values[valid])
+
+    def add(self, dates, values):
+        """
+        新しい晩を追加します。values は 列名 -> 値の配列 の辞書です。
+        既存の集計に足し合わせるだけなので、既存の晩をもう一度渡すと二重に数えます。
+        with_source() で共有している列の集計は、共有先でも更新されます。
+        """
+        days = _day_numbers(dates)
+        with self._lock:
+            for column, column_values in values.items():
+                self._add_to(self._column(column), days, np.asarray(column_values, dtype=float))
+
+    def query(self, column, tier, start=None, end=None):
+        """
+        column の tier の集計のうち、[start, end] に重なる区間のものを返します。
+        端の区間も区間全体 (期間外の晩を含む) の集計です。
+        """
+        start = None if start is None else bucket_keys(_day_numbers([start]), tier)[0]
+        end = None if end is None else _day_numbers([end])[0]
+        return self._column(column)[tier].frame(start, end)
+
+
+def choose_tier(start, end, max_points=MAX_POINTS):
+    """[start, end] を max_points 点以内で表せる最も細かい粒度と、daily を LTTB で間引くかを返します。"""
+    days = (pd.Timestamp(end) - pd.Timestamp(start)).days + 1
+    if days <= max_points:
+        return 'daily', False
+    if days <= LTTB_FACTOR * max_points:
+        return 'daily', True
+    if days / 7 <= max_points:
+        return 'weekly', False
+    return 'monthly', False
+
+
+def lttb(x, y, n_out):
+    """
+    Largest-Triangle-Three-Buckets で (x, y) を n_out 点に間引き、残す点の添字を返します。
+    先頭・末尾の点は必ず残し、間の各区間から直前に選んだ点と次の区間の平均とで作る三角形が
+    最大になる点を選びます。x は昇順の数値、y に NaN を含む点は候補にしません。
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    candidates = np.flatnonzero(~np.isnan(y))
+    if n_out >= len(candidates) or n_out < 3:
+        return candidates
+    xs, ys = x[candidates], y[candidates]
+    n = len(xs)
+    # 先頭・末尾を除いた点を n_out - 2 区間に分ける
+    edges = (np.arange(n_out - 1) * (n - 2) / (n_out - 2)).astype(np.int64) + 1
+    edges[-1] = n - 1
+    # 次の区間の平均 (最後の区間は末尾の点)
+    csx = np.concatenate([[0.0], np.cumsum(xs)])
+    csy = np.concatenate([[0.0], np.cumsum(ys)])
+    nxt_lo = np.append(edges[1:-1], n - 1)
+    nxt_hi = np.append(edges[2:], n)
+    avg_x = (csx[nxt_hi] - csx[nxt_lo]) / (nxt_hi - nxt_lo)
+    avg_y = (csy[nxt_hi] - csy[nxt_lo]) / (nxt_hi - nxt_lo)
+
+    selected = np.empty(n_out, dtype=np.int64)
+    selected[0], selected[-1] = 0, n - 1
+    a = 0
+    for b in range(n_out - 2):
+        lo, hi = edges[b], edges[b + 1]
+        area = np.abs((xs[a] - avg_x[b]) * (ys[lo:hi] - ys[a]) - (xs[a] - xs[lo:hi]) * (avg_y[b] - ys[a]))
+        a = lo + int(np.argmax(area))
+        selected[b + 1] = a
+    return candidates[selected]
+
+
+def trend_points(timeline, column, max_points=MAX_POINTS):
+    """
+    timeline の期間の column を、max_points 点以内の推移として返します。
+    戻り値は (date, mean, min, max, count 列のフレーム, 粒度) で、daily の min / max は値そのものです。
+    日付のないタイムラインは直近 30 晩をそのまま返します。
+    """
+    if not timeline.has_dates or not len(timeline):
+        recent = timeline.last_nights(30)
+        values = recent[column].to_numpy(dtype=float, na_value=np.nan) if column in recent else np.empty(0)
+        return pd.DataFrame({'date': np.arange(len(values)), 'mean': values, 'min': values, 'max': values,
+                             'count': (~np.isnan(values)).astype(np.int64)}), 'daily'
+
+    start, end = timeline.first_date, timeline.last_date
+    tier, downsample = choose_tier(start, end, max_points)
+    points = timeline.tiers.query(column, tier, start, end)
+    if downsample:
+        keep = lttb(points['date'].to_numpy().astype('datetime64[D]').astype(np.int64), points['mean'], max_points)
+        points = points.iloc[keep].reset_index(drop=True)
+    return points, tier
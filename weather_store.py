@@ -0,0 +1,399 @@
+"""
+気象データ (気象庁の日別値) を 1 か所にまとめて保存するモジュールです。
+
+キーは (Prec_No, Block_No, Date) で、列は jma_parser.DAILY_COLUMNS と同じです:
+  - Prec_No / Block_No : 府県番号 (int16) / 地点番号 (int32)
+  - Date               : datetime64 (日単位)
+  - 数値の列           : float32 (欠測は NaN)。<列名>_Flag に品質フラグ (uint8, jma_parser.FLAG_*)
+  - 風向・天気概況     : category
+read() は (地点, 日付) 順に並んだこの型付きフレームを返します。
+
+    store = open_weather_store()
+    df = store.read(TOKYO, '2025-10-01', '2025-10-31')
+    backfill(store, [TOKYO], (2015, 1), (2025, 10))   # 足りない月だけ取得して保存
+
+ファイルの拡張子で形式を選びます (.parquet / .pq → Parquet、それ以外は CSV)。
+時別値 (jma_parser.HOURLY_COLUMNS) は open_hourly_store() のストアに、Date の代わりに
+観測時刻 Time をキーとして同じ形式で保存します。
+"""
+import abc
+import argparse
+import datetime
+import os
+import re
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+import jma_cache
+from jma_parser import (DAILY_COLUMNS, FLAG_MISSING, FLAG_OK, HOURLY_COLUMNS, HOURLY_NUMERIC_COLUMNS,
+                        HOURLY_TEXT_COLUMNS, NUMERIC_COLUMNS, TEXT_COLUMNS, parse_daily_table)
+
+WEATHER_FILE = 'weather.csv'
+HOURLY_WEATHER_FILE = 'weather_hourly.csv'
+
+KEY_COLUMNS = ['Prec_No', 'Block_No', 'Date']
+VALUE_COLUMNS = DAILY_COLUMNS[1:]
+FLAG_COLUMNS = [f'{c}_Flag' for c in NUMERIC_COLUMNS]
+WEATHER_COLUMNS = KEY_COLUMNS + VALUE_COLUMNS + FLAG_COLUMNS
+
+DATE_FORMAT = '%Y-%m-%d'
+TIME_FORMAT = '%Y-%m-%d %H:%M'
+
+
+class WeatherSchema(namedtuple('WeatherSchema', ['time_col', 'numeric', 'text', 'columns', 'time_format'])):
+    """ストアの列構成。time_col が日付 (Date) か観測時刻 (Time) かで日別値・時別値を区別します。"""
+    __slots__ = ()
+
+    @property
+    def keys(self):
+        return ['Prec_No', 'Block_No', self.time_col]
+
+    @property
+    def daily(self):
+        return self.time_col == 'Date'
+
+
+DAILY_SCHEMA = WeatherSchema('Date', NUMERIC_COLUMNS, TEXT_COLUMNS, WEATHER_COLUMNS, DATE_FORMAT)
+HOURLY_SCHEMA = WeatherSchema(
+    'Time', HOURLY_NUMERIC_COLUMNS, HOURLY_TEXT_COLUMNS,
+    ['Prec_No', 'Block_No', 'Time'] + HOURLY_COLUMNS[1:] + [f'{c}_Flag' for c in HOURLY_NUMERIC_COLUMNS],
+    TIME_FORMAT)
+
+
+def _station_key(station):
+    return int(station.prec_no), int(station.block_no)
+
+
+def to_weather_frame(df, schema=DAILY_SCHEMA):
+    """
+    任意の列を持つフレームを、schema (既定は WEATHER_COLUMNS) の型付きフレームに揃えます。
+    ない列は欠測 (フラグは FLAG_MISSING) になります。
+    """
+    out = df.reindex(columns=schema.columns)
+    out['Prec_No'] = out['Prec_No'].astype('int16')
+    out['Block_No'] = out['Block_No'].astype('int32')
+    time_col = schema.time_col
+    if not pd.api.types.is_datetime64_any_dtype(out[time_col]):
+        out[time_col] = pd.to_datetime(out[time_col], format='mixed')
+    if schema.daily:
+        out[time_col] = out[time_col].dt.normalize()
+    for col in schema.numeric:
+        values = pd.to_numeric(out[col], errors='coerce').astype('float32')
+        flag = f'{col}_Flag'
+        default = np.where(values.isna(), FLAG_MISSING, FLAG_OK)
+        out[flag] = pd.to_numeric(out[flag], errors='coerce').fillna(pd.Series(default, index=out.index)).astype('uint8')
+        out[col] = values
+    for col in schema.text:
+        out[col] = out[col].astype('category')
+    return out
+
+
+def merge_weather(existing, new, schema=DAILY_SCHEMA):
+    """
+    (地点, 日付) ごとに行をまとめます。新しい行の値が優先されますが、
+    新しい行で欠測の列は既存の値を残します (列の少ない古い CSV を後から取り込んでも値を消さない)。
+    """
+    keys = schema.keys
+    combined = pd.concat([existing, new], ignore_index=True)
+    for col in schema.text:
+        combined[col] = combined[col].astype(object)
+    merged = combined.groupby(keys, sort=True)[sorted(schema.text)].last()
+    for col in schema.numeric:
+        # 値とフラグは組で扱う。値もフラグもない (FLAG_MISSING) 行は新しくても採用しない
+        flag = f'{col}_Flag'
+        has_value = combined[col].notna() | (combined[flag] != FLAG_MISSING)
+        latest = (combined.loc[has_value, keys + [col, flag]]
+                  .drop_duplicates(keys, keep='last').set_index(keys))
+        merged[col] = latest[col]
+        merged[flag] = latest[flag]
+    merged = merged.reset_index()
+    return to_weather_frame(merged, schema)
+
+
+class _WeatherStore(abc.ABC):
+    """CSV / Parquet で共通の処理。サブクラスは _load / _save を実装します。"""
+    def __init__(self, path, schema=DAILY_SCHEMA):
+        self.path = path
+        self.schema = schema
+
+    @abc.abstractmethod
+    def _load(self, station=None, start=None, end=None):
+        """ファイル全体 (実装によっては地点・期間で絞り込んだ行) を型付きのフレームで返します。"""
+
+    @abc.abstractmethod
+    def _save(self, df):
+        """型付きのフレーム df でファイルを置き換えます。"""
+
+    def read(self, station=None, start=None, end=None, columns=None):
+        """
+        地点 (Station、None なら全地点) と日付 (時別値なら観測時刻) の範囲 [start, end] (両端を含む)
+        で絞り込んだ行を返します。
+        columns を指定すると、キー列とその列だけを返します。
+        """
+        if not os.path.exists(self.path):
+            df = to_weather_frame(pd.DataFrame(columns=self.schema.columns), self.schema)
+        else:
+            df = self._load(station, start, end)
+        if station is not None:
+            prec_no, block_no = _station_key(station)
+            df = df[(df['Prec_No'] == prec_no) & (df['Block_No'] == block_no)]
+        # (地点, 日付) 順に並んでいるので、日付の範囲は二分探索で切り出せる
+        if start is not None or end is not None:
+            dates = df[self.schema.time_col].to_numpy()
+            lo = 0 if start is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(start)), 'left')
+            hi = len(df) if end is None else np.searchsorted(dates, np.datetime64(pd.Timestamp(end)), 'right')
+            if station is not None:
+                df = df.iloc[lo:hi]
+            else:
+                mask = np.ones(len(df), dtype=bool)
+                if start is not None:
+                    mask &= dates >= np.datetime64(pd.Timestamp(start))
+                if end is not None:
+                    mask &= dates <= np.datetime64(pd.Timestamp(end))
+                df = df[mask]
+        if columns is not None:
+            keys = self.schema.keys
+            df = df[keys + [c for c in columns if c not in keys]]
+        return df.reset_index(drop=True)
+
+    def upsert(self, df):
+        """行を追加・更新し、保存後の行数を返します。"""
+        new = to_weather_frame(df, self.schema)
+        if os.path.exists(self.path):
+            new = merge_weather(self._load(), new, self.schema)
+        else:
+            new = merge_weather(new.iloc[:0], new, self.schema)
+        self._save(new)
+        return len(new)
+
+    def stations(self):
+        """保存されている (府県番号, 地点番号) のリスト。"""
+        df = self.read(columns=[])
+        return sorted(set(zip(df['Prec_No'].tolist(), df['Block_No'].tolist())))
+
+    def missing_dates(self, station, start, end):
+        """[start, end] のうち、その地点の行がない日付 (DatetimeIndex) を返します。"""
+        wanted = pd.date_range(start, end, freq='D')
+        if self.schema.daily:
+            have = self.read(station, start, end, columns=[])['Date']
+        else:
+            # 時別値は 1〜24 時 (24 時は翌日 0 時) の行があればその日はあるとみなす
+            have = self.read(station, pd.Timestamp(start) + pd.Timedelta(hours=1),
+                             pd.Timestamp(end) + pd.Timedelta(days=1), columns=[])['Time']
+            have = (have - pd.Timedelta(hours=1)).dt.normalize()
+        return wanted.difference(pd.DatetimeIndex(have))
+
+    def missing_months(self, station, start, end, today=None, refresh_open_months=True):
+        """
+        (年, 月) の start〜end のうち取得が必要な月を返します。
+        行が欠けている月に加えて、refresh_open_months なら当月・前月 (値が更新されうる月) も含めます。
+        今日以降の日付は対象外です。
+        """
+        today = today or datetime.date.today()
+        first = pd.Timestamp(year=start[0], month=start[1], day=1)
+        last = pd.Timestamp(year=end[0], month=end[1], day=1) + pd.offsets.MonthEnd(0)
+        last = min(last, pd.Timestamp(today) - pd.Timedelta(days=1))
+        if last < first:
+            return []
+        missing = self.missing_dates(station, first, last)
+        months = set(zip(missing.year.tolist(), missing.month.tolist()))
+        if refresh_open_months:
+            for p in pd.period_range(first, last, freq='M'):
+                if not jma_cache.is_closed_month(p.year, p.month, today):
+                    months.add((p.year, p.month))
+        return sorted(months)
+
+
+class CsvWeatherStore(_WeatherStore):
+    """テキスト形式。読み込み時に型を付け直します。"""
+    def _load(self, station=None, start=None, end=None):
+        time_col = self.schema.time_col
+        df = pd.read_csv(self.path, dtype={c: 'string' for c in self.schema.text})
+        df[time_col] = pd.to_datetime(df[time_col], format=self.schema.time_format)
+        return to_weather_frame(df, self.schema)
+
+    def _save(self, df):
+        out = df.copy()
+        time_col = self.schema.time_col
+        out[time_col] = out[time_col].dt.strftime(self.schema.time_format)
+        out.to_csv(self.path, index=False)
+
+
+class ParquetWeatherStore(_WeatherStore):
+    """Parquet 形式。地点と日付範囲の絞り込みはファイルの読み込み時に行います。pyarrow が必要です。"""
+    @staticmethod
+    def _arrow():
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as e:
+            raise ImportError("Parquet 形式を使うには pyarrow をインストールしてください (pip install pyarrow)") from e
+        return pa, pq
+
+    def _load(self, station=None, start=None, end=None):
+        _, pq = self._arrow()
+        filters = []
+        if station is not None:
+            prec_no, block_no = _station_key(station)
+            filters += [('Prec_No', '=', prec_no), ('Block_No', '=', block_no)]
+        time_col = self.schema.time_col
+        as_key = (lambda t: pd.Timestamp(t).date()) if self.schema.daily else pd.Timestamp
+        if start is not None:
+            filters.append((time_col, '>=', as_key(start)))
+        if end is not None:
+            filters.append((time_col, '<=', as_key(end)))
+        table = pq.read_table(self.path, filters=filters or None)
+        return to_weather_frame(table.to_pandas(date_as_object=False), self.schema)
+
+    def _save(self, df):
+        pa, pq = self._arrow()
+        table = pa.Table.from_pandas(df, preserve_index=False)
+        time_col = self.schema.time_col
+        time_type = pa.date32() if self.schema.daily else pa.timestamp('s')
+        table = table.set_column(table.schema.get_field_index(time_col), time_col,
+                                 table[time_col].cast(time_type))
+        pq.write_table(table, self.path)
+
+
+def open_weather_store(path=WEATHER_FILE, schema=DAILY_SCHEMA):
+    """拡張子から形式を選びます (.parquet / .pq → Parquet、それ以外は CSV)。"""
+    if os.path.splitext(path)[1].lower() in ('.parquet', '.pq'):
+        return ParquetWeatherStore(path, schema)
+    return CsvWeatherStore(path, schema)
+
+
+def open_hourly_store(path=HOURLY_WEATHER_FILE):
+    """時別値のストアを開きます。"""
+    return open_weather_store(path, HOURLY_SCHEMA)
+
+
+def backfill(store, stations, start, end, today=None, refresh_open_months=True, **fetch_kwargs):
+    """
+    各地点について store にない月 (と更新されうる当月・前月) だけを気象庁から取得して保存します。
+    fetch_kwargs は scrape_jma_humidity.fetch_months に渡されます (max_workers, cache など)。
+    戻り値は取得した MonthResult のリストです。
+    """
+    from scrape_jma_humidity import fetch_months
+
+    results = []
+    for station in stations:
+        months = store.missing_months(station, start, end, today, refresh_open_months)
+        if not months:
+            continue
+        station_results = fetch_months([station], months, parse=parse_daily_table, **fetch_kwargs)
+        frames = []
+        for r in station_results:
+            if r.ok and len(r.rows):
+                frame = r.rows.to_frame()
+                frame.insert(0, 'Block_No', station.block_no)
+                frame.insert(0, 'Prec_No', station.prec_no)
+                frames.append(frame)
+        if frames:
+            store.upsert(pd.concat(frames, ignore_index=True))
+        results.extend(station_results)
+    return results
+
+
+def backfill_hourly(store, stations, start, end, today=None, **fetch_kwargs):
+    """
+    時別値のストア (open_hourly_store) に、各地点の [start, end] のうちない日だけを取得して保存します。
+    fetch_kwargs は scrape_jma_humidity.fetch_hourly に渡されます。戻り値は DayResult のリストです。
+    """
+    from scrape_jma_humidity import fetch_hourly
+
+    today = pd.Timestamp(today or datetime.date.today())
+    end = min(pd.Timestamp(end), today - pd.Timedelta(days=1))
+    results = []
+    for station in stations:
+        if end < pd.Timestamp(start):
+            break
+        dates = store.missing_dates(station, start, end)
+        if not len(dates):
+            continue
+        station_results = fetch_hourly([station], dates, **fetch_kwargs)
+        frames = []
+        for r in station_results:
+            if r.ok and len(r.table):
+                frame = r.table.to_frame()
+                frame.insert(0, 'Block_No', station.block_no)
+                frame.insert(0, 'Prec_No', station.prec_no)
+                frames.append(frame)
+        if frames:
+            store.upsert(pd.concat(frames, ignore_index=True))
+        results.extend(station_results)
+    return results
+
+
+# 旧形式の CSV: tokyo_humidity.csv (Date 列) / tokyo_humidity_YYYY_MM.csv (Day 列のみ)
+_MONTH_FILE = re.compile(r'_(\d{4})_(\d{1,2})\.csv$')
+
+
+def read_legacy_csv(path, station):
+    """旧形式の湿度 CSV を読み込み、地点の列を付けて返します。"""
+    df = pd.read_csv(path)
+    if 'Date' in df.columns:
+        df['Date'] = pd.to_datetime(df['Date'], format='%Y/%m/%d')
+    else:
+        m = _MONTH_FILE.search(os.path.basename(path))
+        if m is None:
+            raise ValueError(f"Date 列がなく、ファイル名から年月がわかりません: {path}")
+        df['Date'] = pd.to_datetime({'year': int(m.group(1)), 'month': int(m.group(2)), 'day': df.pop('Day')})
+    df['Prec_No'] = station.prec_no
+    df['Block_No'] = station.block_no
+    return df
+
+
+def migrate_legacy_csvs(store, paths, station):
+    """旧形式の CSV をまとめて store に取り込み、保存後の行数を返します。"""
+    return store.upsert(pd.concat([read_legacy_csv(p, station) for p in paths], ignore_index=True))
+
+
+if __name__ == "__main__":
+    from scrape_jma_humidity import TOKYO, Station, _parse_year_month
+
+    parser = argparse.ArgumentParser(description="気象データのストアを管理します。")
+    parser.add_argument('--store', default=WEATHER_FILE)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate = subparsers.add_parser('migrate', help="旧形式の湿度 CSV を取り込む")
+    migrate.add_argument('paths', nargs='+')
+    migrate.add_argument('--station', type=Station.parse, default=TOKYO)
+
+    fill = subparsers.add_parser('backfill', help="足りない月を気象庁から取得する")
+    fill.add_argument('--stations', default="44:47662:東京")
+    fill.add_argument('--from', dest='start', type=_parse_year_month, required=True)
+    fill.add_argument('--to', dest='end', type=_parse_year_month, required=True)
+    fill.add_argument('--workers', type=int, default=8)
+    fill.add_argument('--cache-dir', default=jma_cache.DEFAULT_CACHE_DIR)
+
+    hourly = subparsers.add_parser('backfill-hourly', help="足りない日の時別値を気象庁から取得する")
+    hourly.add_argument('--stations', default="44:47662:東京")
+    hourly.add_argument('--from', dest='start', required=True, help="開始日 (YYYY-MM-DD)")
+    hourly.add_argument('--to', dest='end', required=True, help="終了日 (YYYY-MM-DD)")
+    hourly.add_argument('--hourly-store', default=HOURLY_WEATHER_FILE)
+    hourly.add_argument('--workers', type=int, default=8)
+    hourly.add_argument('--cache-dir', default=jma_cache.DEFAULT_CACHE_DIR)
+    args = parser.parse_args()
+
+    store = open_weather_store(args.store)
+    if args.command == 'migrate':
+        n = migrate_legacy_csvs(store, args.paths, args.station)
+        print(f"{len(args.paths)} ファイルを取り込みました ({args.store}: {n} 行)")
+    elif args.command == 'backfill-hourly':
+        stations = [Station.parse(s) for s in args.stations.split(',')]
+        results = backfill_hourly(open_hourly_store(args.hourly_store), stations, args.start, args.end,
+                                  max_workers=args.workers, cache=jma_cache.PageCache(args.cache_dir))
+        for r in results:
+            if not r.ok:
+                print(f"取得失敗: {r.station.prec_no}:{r.station.block_no} {r.date:%Y-%m-%d}: {r.error}")
+        print(f"{sum(r.ok for r in results)}/{len(results)} 日分を取得しました ({args.hourly_store})")
+    else:
+        stations = [Station.parse(s) for s in args.stations.split(',')]
+        results = backfill(store, stations, args.start, args.end, max_workers=args.workers,
+                           cache=jma_cache.PageCache(args.cache_dir))
+        for r in results:
+            if not r.ok:
+                print(f"取得失敗: {r.station.prec_no}:{r.station.block_no} {r.year}/{r.month}: {r.error}")
+        print(f"{sum(r.ok for r in results)}/{len(results)} か月分を取得しました ({args.store})")